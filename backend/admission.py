@@ -0,0 +1,163 @@
+import asyncio
+import json
+import os
+from typing import Any, Dict
+
+# --- Inbound admission control ---
+# Per-endpoint concurrency + bounded wait queue. When an endpoint is saturated
+# the request is turned away immediately (429 when the queue is full, 503 when
+# it waited too long) with a Retry-After hint, instead of piling up until every
+# request times out. Upload bodies are capped by size as they stream in.
+
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.getenv(name, str(default)))
+
+
+def _env_float(name: str, default: float) -> float:
+    return float(os.getenv(name, str(default)))
+
+
+RETRY_AFTER_SECONDS = _env_int("ADMISSION_RETRY_AFTER", 5)
+MAX_UPLOAD_BYTES = _env_int("UPLOAD_MAX_BYTES", 50 * 1024 * 1024)
+MAX_ARCHIVE_BYTES = _env_int("UPLOAD_ARCHIVE_MAX_BYTES", 2 * 1024 ** 3)
+
+
+class EndpointLimit:
+    def __init__(self, name: str, max_concurrent: int, max_queue: int, queue_timeout: float):
+        prefix = f"ADMISSION_{name.upper()}"
+        self.max_concurrent = _env_int(f"{prefix}_CONCURRENCY", max_concurrent)
+        self.max_queue = _env_int(f"{prefix}_QUEUE", max_queue)
+        self.queue_timeout = _env_float(f"{prefix}_QUEUE_TIMEOUT", queue_timeout)
+        self.semaphore = asyncio.Semaphore(self.max_concurrent)
+        self.active = 0
+        self.queued = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "active": self.active,
+            "queued": self.queued,
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+        }
+
+
+ENDPOINT_LIMITS: Dict[str, EndpointLimit] = {
+    "/search": EndpointLimit("search", 16, 32, 10.0),
+    "/ask": EndpointLimit("ask", 8, 16, 10.0),
+    "/ask/batch": EndpointLimit("ask_batch", 2, 2, 5.0),
+    "/highlights": EndpointLimit("highlights", 4, 16, 10.0),
+    "/dashboard": EndpointLimit("dashboard", 4, 16, 10.0),
+    "/upload": EndpointLimit("upload", 4, 8, 30.0),
+    "/upload/archive": EndpointLimit("upload_archive", 1, 2, 30.0),
+}
+BODY_LIMITS: Dict[str, int] = {
+    "/upload": MAX_UPLOAD_BYTES,
+    "/upload/archive": MAX_ARCHIVE_BYTES,
+}
+
+
+def admission_stats() -> Dict[str, Any]:
+    return {path: limit.stats() for path, limit in ENDPOINT_LIMITS.items()}
+
+
+class _BodyTooLarge(Exception):
+    pass
+
+
+async def _reject(send, status: int, message: str, retry_after: int = None) -> None:
+    headers = [(b"content-type", b"application/json")]
+    if retry_after is not None:
+        headers.append((b"retry-after", str(retry_after).encode()))
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": json.dumps({"error": message}).encode()})
+
+
+class AdmissionControlMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        path = scope["path"].rstrip("/") or "/"
+        limit = ENDPOINT_LIMITS.get(path)
+        max_body = BODY_LIMITS.get(path)
+
+        if max_body is not None:
+            declared = dict(scope.get("headers") or []).get(b"content-length")
+            if declared is not None:
+                try:
+                    declared_bytes = int(declared)
+                except ValueError:
+                    return await _reject(send, 400, "Invalid Content-Length header.")
+                if declared_bytes < 0:
+                    return await _reject(send, 400, "Invalid Content-Length header.")
+                if declared_bytes > max_body:
+                    return await _reject(send, 413, f"Request body exceeds {max_body} bytes.")
+
+        if limit is None:
+            return await self._call_app(scope, receive, send, max_body)
+
+        # Counters are updated without awaiting in between, so this check cannot race
+        if limit.active + limit.queued >= limit.max_concurrent + limit.max_queue:
+            limit.rejected += 1
+            return await _reject(send, 429, "Too many requests, retry later.", RETRY_AFTER_SECONDS)
+        limit.queued += 1
+        acquired = False
+        try:
+            # Not wait_for: on 3.11 a timeout racing a completed acquire can drop the permit for good
+            async with asyncio.timeout(limit.queue_timeout):
+                await limit.semaphore.acquire()
+                acquired = True
+        except TimeoutError:
+            if acquired:
+                limit.semaphore.release()
+            limit.timed_out += 1
+            return await _reject(send, 503, "Service saturated, retry later.", RETRY_AFTER_SECONDS)
+        finally:
+            limit.queued -= 1
+        limit.active += 1
+        try:
+            await self._call_app(scope, receive, send, max_body)
+        finally:
+            limit.active -= 1
+            limit.semaphore.release()
+
+    async def _call_app(self, scope, receive, send, max_body: int = None):
+        if max_body is None:
+            return await self.app(scope, receive, send)
+        received = 0
+        too_large = False
+        replaced = False
+        message_413 = f"Request body exceeds {max_body} bytes."
+
+        async def capped_receive():
+            nonlocal received, too_large
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_body:
+                    too_large = True
+                    raise _BodyTooLarge(message_413)
+            return message
+
+        async def guarded_send(message):
+            # The framework reports body read errors as its own 4xx/5xx; swap in a 413
+            nonlocal replaced
+            if too_large:
+                if not replaced:
+                    replaced = True
+                    await _reject(send, 413, message_413)
+                return
+            await send(message)
+
+        try:
+            await self.app(scope, capped_receive, guarded_send)
+        except _BodyTooLarge:
+            if not replaced:
+                await _reject(send, 413, message_413)
@@ -0,0 +1,130 @@
+"""
+Memory and access cost of a project's in-process chunk list: one LangChain
+Document per chunk (the old snapshot cache) against the compact ChunkStore.
+Each layout runs in its own subprocess so the RSS numbers do not bleed into
+each other.
+
+    python benchmarks/bench_chunk_store.py --n 1000000 --chars 400
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+LAYOUTS = ["documents", "compact"]
+CHUNKS_PER_DOC = 200
+WORDS = ("contractor shall deliver the works in accordance with the approved schedule and "
+         "specification subject to payment within thirty days of certified invoice").split()
+
+
+def make_rows(n, chars):
+    """Synthetic chunks shaped like loader output: distinct texts, per-page metadata."""
+    doc_id = None
+    for i in range(n):
+        if i % CHUNKS_PER_DOC == 0:
+            doc_id = str(uuid.UUID(int=i))
+        words, size = [f"Clause {i}."], 0
+        while size < chars:
+            word = WORDS[(i + len(words)) % len(WORDS)]
+            words.append(word)
+            size += len(word) + 1
+        yield " ".join(words), {
+            "doc_id": doc_id,
+            "project": "default",
+            "file_name": f"contract-{i // CHUNKS_PER_DOC}.pdf",
+            "file_type": "pdf",
+            "source_location": f"Page {i % CHUNKS_PER_DOC + 1}",
+            # Ingest-time relevance score (relevance.py); unrounded here, so nearly every value is distinct
+            "relevance": (i * 2654435761 % 1000003) / 1000003,
+        }
+
+
+def rss_mb():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+def run_layout(layout, n, chars):
+    base_rss = rss_mb()
+    t0 = time.perf_counter()
+    if layout == "documents":
+        from langchain_core.documents import Document
+        chunks = [Document(page_content=text, metadata=meta) for text, meta in make_rows(n, chars)]
+    else:
+        from chunk_store import ChunkList, ChunkStore
+        store = ChunkStore()
+        store.extend(make_rows(n, chars))
+        chunks = ChunkList(store, store.count)
+    build_s = time.perf_counter() - t0
+    store_mb = rss_mb() - base_rss
+
+    target = f"contract-{n // CHUNKS_PER_DOC // 2}.pdf"
+    t = time.perf_counter()
+    if layout == "documents":
+        selected = [c for c in chunks if c.metadata.get("file_name") == target]
+    else:
+        selected = chunks.where("file_name", target)
+    select_ms = (time.perf_counter() - t) * 1000
+
+    t = time.perf_counter()
+    if layout == "documents":
+        groups = {}
+        for c in chunks:
+            groups.setdefault(c.metadata.get("doc_id"), []).append(c)
+    else:
+        groups = chunks.group_by("doc_id")
+    group_ms = (time.perf_counter() - t) * 1000
+
+    t = time.perf_counter()
+    texts = (c.page_content for c in chunks) if layout == "documents" else chunks.texts()
+    scanned = sum(len(text) for text in texts)
+    scan_s = time.perf_counter() - t
+
+    return {
+        "layout": layout,
+        "n": n,
+        "chars": chars,
+        "build_s": round(build_s, 2),
+        "store_rss_mb": round(store_mb, 1),
+        "bytes_per_chunk": round(store_mb * 2**20 / n),
+        "select_file_ms": round(select_ms, 1),
+        "selected": len(selected),
+        "group_by_doc_ms": round(group_ms, 1),
+        "groups": len(groups),
+        "scan_texts_s": round(scan_s, 2),
+        "scanned_chars": scanned,
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=1_000_000)
+    parser.add_argument("--chars", type=int, default=400)
+    parser.add_argument("--layouts", default=",".join(LAYOUTS))
+    parser.add_argument("--single", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        print(json.dumps(run_layout(args.single, args.n, args.chars)))
+        return
+
+    results = []
+    for layout in args.layouts.split(","):
+        cmd = [sys.executable, __file__, "--single", layout, "--n", str(args.n), "--chars", str(args.chars)]
+        proc = subprocess.run(cmd, capture_output=True, text=True)
+        if proc.returncode != 0:
+            results.append({"layout": layout, "error": proc.stderr.strip().splitlines()[-1:]})
+        else:
+            results.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+        print(json.dumps(results[-1]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Recall / precision of the relevance pre-filter and how much prompt it saves.
+Runs on a synthetic mixed-format corpus (contract clauses plus IFC element
+lists, drawing-layer counts, OCR noise, descriptive prose and table
+summaries), or on your own labelled chunks:
+
+    python benchmarks/bench_relevance.py --thresholds 0.2,0.3,0.4
+    python benchmarks/bench_relevance.py --labels labelled.jsonl   # {"text": ..., "relevant": true|false} per line
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from model_router import estimate_tokens
+from relevance import relevance_score
+
+CLAUSES = [
+    "The Contractor shall complete the Works within {n} weeks of the Commencement Date.",
+    "Payment of each interim certificate shall be made within {n} days of the invoice date.",
+    "Liquidated damages of ${n},000 per week of delay shall be deducted from sums due.",
+    "Either party may terminate this Contract by {n} days' notice if the other commits a material breach.",
+    "The Subcontractor shall indemnify the Main Contractor against all claims arising from its works.",
+    "Retention of {n}% shall be released on issue of the Certificate of Practical Completion.",
+    "The Consultant must hold professional indemnity insurance of not less than ${n} million.",
+    "Any dispute shall first be referred to adjudication under Clause {n}.",
+    "Shop drawings are required to be submitted no later than {n} working days before fabrication.",
+    # No lexicon words: what keyword scoring misses
+    "The Employer will release the final account once the defects period of {n} months has ended.",
+]
+NOISE = [
+    lambda r: "\n".join(f"IfcWall: Name=Basic Wall:{r.randint(100, 999)}, id=2O2Fr$t4X7Zf8NOew3FL{r.randint(0, 9)}" for _ in range(10)),
+    lambda r: f"Layer: A-WALL-{r.randint(1, 40):02d} — {r.randint(10, 900)} entities",
+    lambda r: "[IMAGE TEXT]\n" + " ".join(r.choice(["|l1", "0O", ";:", "~~", "=3", "1I"]) * r.randint(1, 3) for _ in range(30)),
+    lambda r: f"The building comprises {r.randint(2, 9)} storeys with a reinforced concrete frame and a glazed atrium facing the park.",
+    lambda r: f"Table: costs.csv\nRows: {r.randint(100, 9000)}\nColumns: Item (text), Qty (number), Unit (text)",
+    # Incidental keywords: what keyword scoring lets through
+    lambda r: f"Site meeting {r.randint(1, 60)}: the design team reviewed lobby finishes; no delays were reported.",
+    lambda r: f"Table: ledger.csv\nRows: {r.randint(100, 9000)}\nColumns: Payment Date (text), Amount (number)",
+]
+# Descriptive sentences that pad chunks to realistic, varying lengths
+FILLER = [
+    "The site lies on the north bank of the river, next to the existing depot.",
+    "Access for deliveries is from the service road off the main junction.",
+    "The structural grid is 7.5 metres in both directions with a transfer slab at level one.",
+    "Finishes follow the architect's room data sheets issued with the tender drawings.",
+    "The existing building will be demolished down to ground slab level.",
+    "Mechanical plant is located on the roof behind an acoustic screen.",
+]
+
+
+def synthetic(n, noise_ratio, seed=0):
+    """Chunks of one clause or noise item plus 0-6 filler sentences, labelled by whether a clause is in them."""
+    rng = random.Random(seed)
+    rows = []
+    for _ in range(n):
+        relevant = rng.random() >= noise_ratio
+        core = rng.choice(CLAUSES).format(n=rng.randint(2, 60)) if relevant else rng.choice(NOISE)(rng)
+        sentences = [core] + [rng.choice(FILLER) for _ in range(rng.randint(0, 6))]
+        rng.shuffle(sentences)
+        rows.append((" ".join(sentences), relevant))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--labels", help="JSONL file of {\"text\", \"relevant\"} rows")
+    parser.add_argument("--n", type=int, default=5000)
+    parser.add_argument("--noise-ratio", type=float, default=0.6)
+    parser.add_argument("--thresholds", default="0.1,0.2,0.3,0.4,0.5")
+    args = parser.parse_args()
+
+    if args.labels:
+        with open(args.labels) as f:
+            rows = [(row["text"], bool(row["relevant"])) for row in map(json.loads, f) if row.strip()]
+    else:
+        rows = synthetic(args.n, args.noise_ratio)
+
+    t0 = time.perf_counter()
+    scores = [relevance_score(text) for text, _ in rows]
+    per_chunk_us = (time.perf_counter() - t0) / len(rows) * 1e6
+    tokens = [estimate_tokens(text) for text, _ in rows]
+    relevant = sum(1 for _, label in rows if label)
+
+    for threshold in (float(t) for t in args.thresholds.split(",")):
+        kept = [score >= threshold for score in scores]
+        true_pos = sum(1 for k, (_, label) in zip(kept, rows) if k and label)
+        print(json.dumps({
+            "threshold": threshold,
+            "chunks": len(rows),
+            "recall": round(true_pos / relevant, 4) if relevant else None,
+            "precision": round(true_pos / sum(kept), 4) if any(kept) else None,
+            "chunks_kept_ratio": round(sum(kept) / len(rows), 3),
+            "prompt_tokens_kept_ratio": round(sum(t for t, k in zip(tokens, kept) if k) / sum(tokens), 3),
+            "score_us_per_chunk": round(per_chunk_us, 1),
+        }))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Response size and serialization time for /highlights- and /dashboard-shaped
+payloads: stdlib json (what JSONResponse uses) against orjson, raw against
+gzip, plus the cost of the 304 check. Runs without an API key or a corpus.
+
+    python benchmarks/bench_responses.py --items 50,500,5000
+"""
+import argparse
+import gzip
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import orjson
+from starlette.requests import Request
+
+from responses import GZIP_LEVEL, ORJSON_OPTIONS, etag_for, etag_matches
+
+PARAMS = ["cost", "timeline", "compliance", "design", "safety", "sustainability"]
+
+
+def sentence(rng, words=30):
+    vocab = ("contractor shall deliver works schedule payment invoice retention completion delay "
+             "liquidated damages notice clause employer programme variation certificate defects").split()
+    return " ".join(rng.choice(vocab) for _ in range(words)).capitalize() + "."
+
+
+def highlights_payload(n, rng):
+    half = n // 2
+    return {
+        "highlights": [{"text": sentence(rng, 25), "explanation": sentence(rng, 20), "risk_flag": None} for _ in range(half)],
+        "risks": [{"text": sentence(rng, 25), "explanation": None, "risk_flag": sentence(rng, 15)} for _ in range(n - half)],
+    }
+
+
+def dashboard_payload(rng):
+    return {
+        "scores": {p: {"score": round(rng.uniform(1, 5), 2), "why": sentence(rng, 40)} for p in PARAMS},
+        "final_score": round(rng.uniform(1, 5), 2),
+        "strength": {"what": sentence(rng, 10), "why": sentence(rng, 30)},
+        "weakness": {"what": sentence(rng, 10), "why": sentence(rng, 30)},
+        "next_steps": [{"step": sentence(rng, 8), "why": sentence(rng, 20), "impact": sentence(rng, 10),
+                        "how_it_helps": sentence(rng, 15)} for _ in range(3)],
+        "parameters": {p: 1 / len(PARAMS) for p in PARAMS},
+    }
+
+
+def timed_ms(fn, repeat):
+    fn()
+    t = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - t) / repeat * 1000, result
+
+
+def measure(name, payload, repeat):
+    stdlib_ms, stdlib_body = timed_ms(
+        lambda: json.dumps(payload, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8"),
+        repeat,
+    )
+    orjson_ms, body = timed_ms(lambda: orjson.dumps(payload, option=ORJSON_OPTIONS), repeat)
+    gzip_ms, compressed = timed_ms(lambda: gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0), repeat)
+    return {
+        "payload": name,
+        "json_bytes": len(stdlib_body),
+        "orjson_bytes": len(body),
+        "gzip_bytes": len(compressed),
+        "gzip_ratio": round(len(compressed) / len(body), 3),
+        "json_ms": round(stdlib_ms, 3),
+        "orjson_ms": round(orjson_ms, 3),
+        "gzip_ms": round(gzip_ms, 3),
+    }
+
+
+def measure_not_modified(repeat):
+    """Cost of answering a revalidation: build the tag and compare it with If-None-Match."""
+    etag = etag_for("dashboard", "ai", "default", None, 42, (False, True, 0.3))
+    request = Request({"type": "http", "headers": [(b"if-none-match", etag.encode())]})
+    check_ms, matched = timed_ms(
+        lambda: etag_matches(request, etag_for("dashboard", "ai", "default", None, 42, (False, True, 0.3))), repeat
+    )
+    return {"payload": "304", "matched": matched, "body_bytes": 0, "check_ms": round(check_ms, 4)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", default="50,500,5000", help="highlight + risk counts to try")
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    print(json.dumps(measure_not_modified(args.repeat)))
+    print(json.dumps(measure("dashboard", dashboard_payload(rng), args.repeat)))
+    for n in (int(x) for x in args.items.split(",")):
+        print(json.dumps(measure(f"highlights-{n}", highlights_payload(n, rng), args.repeat)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Compare the Chroma store against MatrixVectorStore (float16 / int8) on
+synthetic embeddings: build time, query latency, recall@k against exact
+float32 search, and peak RSS. Each backend runs in its own subprocess so the
+RSS numbers do not bleed into each other.
+
+    python benchmarks/bench_vectorstore.py --n 100000 --dim 768 --queries 200
+"""
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+BACKENDS = ["matrix-float16", "matrix-int8", "chroma"]
+
+
+class PrecomputedEmbeddings:
+    """Embeddings stand-in: texts are row ids into a precomputed matrix."""
+
+    def __init__(self, vectors):
+        self.vectors = vectors
+
+    def embed_documents(self, texts):
+        return [self.vectors[int(t)].tolist() for t in texts]
+
+    def embed_query(self, text):
+        return self.vectors[int(text)].tolist()
+
+
+def make_data(n, dim, queries, seed=0):
+    rng = np.random.default_rng(seed)
+    # Clustered data so nearest neighbours are meaningful
+    centers = rng.normal(size=(max(n // 200, 1), dim)).astype(np.float32)
+    data = centers[rng.integers(0, len(centers), n)] + 0.3 * rng.normal(size=(n, dim)).astype(np.float32)
+    data /= np.linalg.norm(data, axis=1, keepdims=True)
+    q = data[rng.integers(0, n, queries)] + 0.1 * rng.normal(size=(queries, dim)).astype(np.float32)
+    q /= np.linalg.norm(q, axis=1, keepdims=True)
+    return data, q
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_backend(backend, n, dim, queries, k, batch):
+    data, q = make_data(n, dim, queries)
+    truth = np.argsort(-(q @ data.T), axis=1)[:, :k]
+    base_rss = peak_rss_mb()
+    workdir = tempfile.mkdtemp(prefix="bench_vs_")
+    try:
+        if backend.startswith("matrix"):
+            from matrix_store import MatrixVectorStore
+            store = MatrixVectorStore(PrecomputedEmbeddings(data), workdir, dtype=backend.split("-")[1])
+        else:
+            from langchain_community.vectorstores import Chroma
+            store = Chroma(embedding_function=PrecomputedEmbeddings(data), persist_directory=workdir)
+
+        t0 = time.perf_counter()
+        for start in range(0, n, batch):
+            ids = [str(i) for i in range(start, min(start + batch, n))]
+            store.add_texts(ids, metadatas=[{"row": int(i)} for i in ids], ids=ids)
+        build_s = time.perf_counter() - t0
+
+        latencies, hits = [], 0
+        for i in range(queries):
+            t = time.perf_counter()
+            docs = store.similarity_search_by_vector(q[i].tolist(), k=k)
+            latencies.append((time.perf_counter() - t) * 1000)
+            found = {int(d.metadata["row"]) for d in docs}
+            hits += len(found & set(truth[i].tolist()))
+        latencies.sort()
+        return {
+            "backend": backend,
+            "n": n,
+            "dim": dim,
+            "build_s": round(build_s, 2),
+            "p50_ms": round(latencies[len(latencies) // 2], 2),
+            "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1], 2),
+            f"recall@{k}": round(hits / (queries * k), 4),
+            "peak_rss_mb": round(peak_rss_mb(), 1),
+            "store_rss_mb": round(peak_rss_mb() - base_rss, 1),
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=50000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--batch", type=int, default=5000)
+    parser.add_argument("--backends", default=",".join(BACKENDS))
+    parser.add_argument("--single", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        print(json.dumps(run_backend(args.single, args.n, args.dim, args.queries, args.k, args.batch)))
+        return
+
+    results = []
+    for backend in args.backends.split(","):
+        cmd = [sys.executable, __file__, "--single", backend, "--n", str(args.n), "--dim", str(args.dim),
+               "--queries", str(args.queries), "--k", str(args.k), "--batch", str(args.batch)]
+        proc = subprocess.run(cmd, capture_output=True, text=True)
+        if proc.returncode != 0:
+            results.append({"backend": backend, "error": proc.stderr.strip().splitlines()[-1:]})
+        else:
+            results.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+        print(json.dumps(results[-1]))
+
+
+if __name__ == "__main__":
+    main()
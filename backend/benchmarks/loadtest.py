@@ -0,0 +1,457 @@
+"""
+End-to-end load test of main:app with local stand-ins for the LLM and the
+embedding API, so runs are free, offline and repeatable. Each concurrency
+level runs in its own subprocess against a fresh corpus (seeded with a few
+synthetic contracts), with closed-loop clients issuing a weighted mix of
+/upload, /search, /ask, /highlights and /dashboard requests. Requests go
+through the full ASGI stack (admission control, routing, thread pool) via
+httpx; the socket/HTTP server layer is not included.
+
+Per endpoint and level it reports throughput, p50/p95/p99 latency, status
+codes and the peak RSS seen while that endpoint had requests in flight. The
+results are written as JSON tagged with the git commit, so two runs can be
+compared:
+
+    python benchmarks/loadtest.py --mix mixed --concurrency 1,8,32 --duration 20
+    python benchmarks/loadtest.py --compare benchmarks/results/a.json benchmarks/results/b.json
+
+The stand-ins only replace the provider calls: the LLM scheduler's own rate
+limits, the model router and the admission limits all stay in effect.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import platform
+import random
+import re
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+RESULT_FORMAT_VERSION = 1
+ENDPOINTS = ["upload", "search", "ask", "highlights", "dashboard"]
+# Relative request weights per endpoint
+MIXES = {
+    "read-heavy": {"upload": 0, "search": 50, "ask": 20, "highlights": 15, "dashboard": 15},
+    "mixed": {"upload": 10, "search": 40, "ask": 20, "highlights": 15, "dashboard": 15},
+    "ingest-heavy": {"upload": 50, "search": 30, "ask": 10, "highlights": 5, "dashboard": 5},
+}
+QUESTIONS = [
+    "What is the payment term for the main contractor?",
+    "What happens if steel prices rise by 15%?",
+    "When is substantial completion due?",
+    "What are the liquidated damages per day of delay?",
+    "What if the concrete supplier is two weeks late?",
+    "Who approves change orders?",
+    "What insurance does the subcontractor need?",
+    "What if the crane rental is cancelled?",
+]
+RSS_SAMPLE_SECONDS = 0.02
+
+
+# --- Stand-ins ---
+
+class LocalEmbeddings:
+    """Hashed bag-of-words vectors with a simulated per-request latency."""
+
+    model = "local-hash"
+
+    def __init__(self, dim=1536, latency_s=0.03, per_text_s=0.0005):
+        self.dim = dim
+        self.latency_s = latency_s
+        self.per_text_s = per_text_s
+
+    def _vector(self, text):
+        import numpy as np
+        v = np.zeros(self.dim, dtype=np.float32)
+        for token in re.findall(r"\w+", text.lower()):
+            h = int.from_bytes(hashlib.md5(token.encode()).digest()[:8], "little")
+            v[h % self.dim] += 1.0 if h & (1 << 63) else -1.0
+        norm = float(np.linalg.norm(v))
+        return (v / norm if norm else v).tolist()
+
+    def embed_documents(self, texts):
+        time.sleep(self.latency_s + self.per_text_s * len(texts))
+        return [self._vector(t) for t in texts]
+
+    def embed_query(self, text):
+        time.sleep(self.latency_s)
+        return self._vector(text)
+
+
+def _quotes(text, n=3):
+    sentences = [s.strip() for s in re.split(r"(?<=[.!?])\s+", text) if len(s.strip()) > 30]
+    return sentences[:n] or ["No clause found."]
+
+
+def local_response(messages):
+    """Canned but well-formed output for each prompt the service sends."""
+    text = "\n".join(m["content"] for m in messages)
+    if "contract Q&A AI" in text:
+        quote = _quotes(text.split("Labeled relevant context:")[-1], 1)[0]
+        return json.dumps({"answer": f"Per the contract: {quote}",
+                           "citations": [{"chunk": "CHUNK 1", "heading": "Unknown Section", "line": None, "quote": quote}]})
+    if '"highlights"' in text and '"risks"' in text:
+        quotes = _quotes(text.split("CONTRACT DOCUMENT:")[-1], 6)
+        return json.dumps({
+            "highlights": [{"text": q, "explanation": "Sets a binding obligation for the parties."} for q in quotes[:4]],
+            "risks": [{"text": q, "risk_flag": "Timeline and remedy are not defined."} for q in quotes[4:]],
+        })
+    if "'scores', 'strength'" in text:
+        rng = random.Random(hashlib.md5(text.encode()).hexdigest())
+        params = ["cost", "timeline", "compliance", "design", "safety", "sustainability"]
+        return json.dumps({
+            "scores": [{"parameter": p, "score": rng.randint(2, 5), "why": "Supported by the payment schedule."} for p in params],
+            "strength": {"what": "Clear payment milestones", "why": "Every stage has a due date."},
+            "weakness": {"what": "Open-ended delay remedies", "why": "No cap on liquidated damages."},
+            "next_steps": [{"step": f"Action {i}", "why": "Reduces exposure.", "impact": "medium",
+                            "how_it_helps": "Shortens the critical path."} for i in range(1, 4)],
+        })
+    if "Generate questions as described." in text:
+        return json.dumps(["What is the schedule float?", "Which costs are fixed?", "Who carries material price risk?"])
+    if "what-if" in text:
+        section = {"analysis": "Costs rise about 4% over the affected packages.", "why": "Using the contract rates.", "citations": []}
+        return json.dumps({
+            "answer": "Manageable with mitigation.",
+            "cost_impact": section, "schedule_impact": section, "resource_impact": section,
+            "consequences": [{"what": "Delay to follow-on trades", "why": "Sequencing.", "citations": []}],
+            "recommended_mitigation": section,
+            "alternative_strategies": [{"strategy": "Re-sequence work", "why": "Keeps crews busy.", "citations": []}],
+        })
+    if "Summarize" in text or "summary" in text:
+        return "Parties agree on phased payments, a fixed completion date and daily delay damages."
+    return "OK"
+
+
+class LocalChat:
+    """ChatOpenAI stand-in: first-token latency plus a fixed output rate."""
+
+    latency_s = 0.2
+    tokens_per_s = 200.0
+
+    def __init__(self, model=None, **kwargs):
+        self.model = model
+
+    def _output(self, messages):
+        from model_router import estimate_tokens
+        content = local_response(messages)
+        return content, estimate_tokens(content) / self.tokens_per_s
+
+    def invoke(self, messages):
+        from langchain_core.messages import AIMessage
+        content, generate_s = self._output(messages)
+        time.sleep(self.latency_s + generate_s)
+        return AIMessage(content=content)
+
+    def stream(self, messages):
+        from langchain_core.messages import AIMessageChunk
+        content, generate_s = self._output(messages)
+        time.sleep(self.latency_s)
+        pieces = [content[i:i + 64] for i in range(0, len(content), 64)]
+        for piece in pieces:
+            time.sleep(generate_s / len(pieces))
+            yield AIMessageChunk(content=piece)
+
+
+def contract_text(rng, index):
+    """A synthetic one-page contract (~700 words), different for every index; .txt files load as one chunk."""
+    parties = ["Northwind Builders", "Harbor Steel Ltd", "Crescent Concrete", "Atlas Cranes", "Summit MEP"]
+    paragraphs = [f"CONTRACT {index}: {rng.choice(parties)} and {rng.choice(parties)} for Building {rng.randint(1, 99)}."]
+    for section in range(1, 9):
+        amount = rng.randint(10, 900) * 1000
+        days = rng.randint(5, 120)
+        paragraphs.append(
+            f"Section {section}. The contractor shall complete milestone {section} within {days} days of notice to proceed. "
+            f"Payment of ${amount:,} is due {rng.choice([15, 30, 45, 60])} days after the approved invoice. "
+            f"Liquidated damages of ${rng.randint(1, 20) * 500:,} per day apply to late completion of this milestone. "
+            f"Change orders above ${rng.randint(5, 50) * 1000:,} require written approval from the owner's representative. "
+            f"The subcontractor carries {rng.choice(['general liability', 'builders risk', 'professional'])} insurance "
+            f"of at least ${rng.randint(1, 10)},000,000 and indemnifies the owner against third-party claims."
+        )
+    return "\n\n".join(paragraphs)
+
+
+def install_stand_ins(args):
+    """Point the service at the stand-ins; must run before main is imported."""
+    import llm_scheduler
+    import vectorstore
+
+    LocalChat.latency_s = args.llm_latency_ms / 1000
+    LocalChat.tokens_per_s = args.llm_tokens_per_s
+    embeddings = LocalEmbeddings(latency_s=args.embed_latency_ms / 1000)
+    vectorstore.get_embeddings = lambda: embeddings
+    llm_scheduler.ChatOpenAI = LocalChat
+
+
+# --- One concurrency level (runs in a subprocess) ---
+
+def rss_mb():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 ** 2
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(q / 100 * len(sorted_values) + 0.5)) - 1))
+    return round(sorted_values[index], 2)
+
+
+def summarize(samples, duration_s):
+    """samples: (status, latency_ms) tuples for one endpoint."""
+    ok = sorted(ms for status, ms in samples if 200 <= status < 300)
+    statuses = {}
+    for status, _ in samples:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    return {
+        "requests": len(samples),
+        "ok": len(ok),
+        "errors": len(samples) - len(ok),
+        "statuses": statuses,
+        "throughput_rps": round(len(ok) / duration_s, 2),
+        "p50_ms": percentile(ok, 50),
+        "p95_ms": percentile(ok, 95),
+        "p99_ms": percentile(ok, 99),
+    }
+
+
+async def run_level(args, concurrency):
+    import httpx
+    import main
+
+    weights = MIXES[args.mix]
+    endpoints = [e for e in ENDPOINTS if weights[e] > 0]
+    transport = httpx.ASGITransport(app=main.app)
+    client = httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=None)
+    upload_counter = iter(range(10 ** 9))
+
+    async def request(endpoint, rng):
+        if endpoint == "upload":
+            index = next(upload_counter)
+            body = contract_text(rng, index).encode()
+            return await client.post("/upload", files={"file": (f"contract_{index}.txt", body, "text/plain")})
+        if endpoint == "search":
+            return await client.post("/search", json={"question": rng.choice(QUESTIONS)})
+        if endpoint == "ask":
+            return await client.post("/ask", data={"question": rng.choice(QUESTIONS)})
+        if endpoint == "highlights":
+            return await client.get("/highlights")
+        return await client.get("/dashboard", params={"mode": "ai"})
+
+    # Seed corpus, not measured
+    seed_rng = random.Random(args.seed)
+    for _ in range(args.seed_docs):
+        response = await request("upload", seed_rng)
+        response.raise_for_status()
+
+    in_flight = {e: 0 for e in endpoints}
+    peak_rss = {e: 0.0 for e in endpoints}
+    samples = {e: [] for e in endpoints}
+    stop_sampling = threading.Event()
+
+    def sample_rss():
+        while not stop_sampling.is_set():
+            rss = rss_mb()
+            for e in endpoints:
+                if in_flight[e]:
+                    peak_rss[e] = max(peak_rss[e], rss)
+            stop_sampling.wait(RSS_SAMPLE_SECONDS)
+
+    started = time.perf_counter()
+    deadline = started + args.duration
+
+    async def worker(worker_id):
+        rng = random.Random(f"{args.seed}-{concurrency}-{worker_id}")
+        while time.perf_counter() < deadline:
+            endpoint = rng.choices(endpoints, [weights[e] for e in endpoints])[0]
+            in_flight[endpoint] += 1
+            t0 = time.perf_counter()
+            try:
+                status = (await request(endpoint, rng)).status_code
+            except Exception as e:
+                print("LOADTEST REQUEST ERROR", endpoint, repr(e))
+                status = 599
+            finally:
+                in_flight[endpoint] -= 1
+            samples[endpoint].append((status, (time.perf_counter() - t0) * 1000))
+
+    sampler = threading.Thread(target=sample_rss, daemon=True)
+    sampler.start()
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    # In-flight requests finish past the deadline; count the real elapsed time
+    elapsed = time.perf_counter() - started
+    stop_sampling.set()
+    sampler.join()
+    await client.aclose()
+
+    per_endpoint = {}
+    for e in endpoints:
+        per_endpoint[e] = summarize(samples[e], elapsed)
+        per_endpoint[e]["peak_rss_mb"] = round(peak_rss[e], 1) or None
+    return {
+        "concurrency": concurrency,
+        "elapsed_s": round(elapsed, 2),
+        "total": summarize([s for e in endpoints for s in samples[e]], elapsed),
+        "endpoints": per_endpoint,
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def run_single(args):
+    workdir = tempfile.mkdtemp(prefix="loadtest_")
+    try:
+        os.environ.setdefault("OPENAI_API_KEY", "local-stand-in")
+        os.environ["VECTORSTORE_DIR"] = os.path.join(workdir, "vectors")
+        os.environ["CORPUS_STATE_DB"] = os.path.join(workdir, "corpus_state.db")
+        # Uploads are written relative to the working directory
+        os.chdir(workdir)
+        install_stand_ins(args)
+        result = asyncio.run(run_level(args, args.single))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    with open(args.result_file, "w") as f:
+        json.dump(result, f)
+
+
+# --- Driver ---
+
+def git_info():
+    def git(*cmd):
+        try:
+            return subprocess.run(["git", *cmd], cwd=BACKEND_DIR, capture_output=True, text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+    status = git("status", "--porcelain", "--untracked-files=no")
+    return {"commit": git("rev-parse", "HEAD"), "subject": git("log", "-1", "--format=%s"),
+            "dirty": bool(status) if status is not None else None}
+
+
+def run_all(args):
+    levels = [int(c) for c in args.concurrency.split(",")]
+    env = dict(os.environ)
+    for item in args.env:
+        key, _, value = item.partition("=")
+        env[key] = value
+    if args.backend:
+        env["VECTORSTORE_BACKEND"] = args.backend
+
+    results = []
+    for concurrency in levels:
+        result_file = tempfile.mktemp(prefix="loadtest_level_", suffix=".json")
+        cmd = [sys.executable, os.path.abspath(__file__), "--single", str(concurrency), "--result-file", result_file,
+               "--mix", args.mix, "--duration", str(args.duration), "--seed-docs", str(args.seed_docs),
+               "--seed", str(args.seed), "--llm-latency-ms", str(args.llm_latency_ms),
+               "--llm-tokens-per-s", str(args.llm_tokens_per_s), "--embed-latency-ms", str(args.embed_latency_ms)]
+        proc = subprocess.run(cmd, env=env, stdout=None if args.verbose else subprocess.DEVNULL,
+                              stderr=subprocess.PIPE, text=True)
+        if proc.returncode != 0 or not os.path.exists(result_file):
+            result = {"concurrency": concurrency, "error": proc.stderr.strip().splitlines()[-1:]}
+        else:
+            with open(result_file) as f:
+                result = json.load(f)
+            os.remove(result_file)
+        results.append(result)
+        print_level(result)
+
+    report = {
+        "format_version": RESULT_FORMAT_VERSION,
+        "git": git_info(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "host": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "config": {k: getattr(args, k) for k in ("mix", "duration", "seed_docs", "seed", "llm_latency_ms",
+                                                 "llm_tokens_per_s", "embed_latency_ms", "backend", "env")},
+        "weights": MIXES[args.mix],
+        "levels": results,
+    }
+    out = args.out
+    if not out:
+        commit = (report["git"]["commit"] or "nogit")[:10] + ("-dirty" if report["git"]["dirty"] else "")
+        out = os.path.join(BACKEND_DIR, "benchmarks", "results", f"loadtest-{args.mix}-{commit}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"results written to {out}")
+
+
+def print_level(result):
+    if "error" in result:
+        print(f"concurrency={result['concurrency']} FAILED: {result['error']}")
+        return
+    total = result["total"]
+    print(f"concurrency={result['concurrency']} rps={total['throughput_rps']} p95={total['p95_ms']}ms "
+          f"errors={total['errors']} peak_rss={result['peak_rss_mb']}MB")
+    for endpoint, s in result["endpoints"].items():
+        print(f"  {endpoint:<11} n={s['requests']:<5} rps={s['throughput_rps']:<7} p50={s['p50_ms']} "
+              f"p95={s['p95_ms']} p99={s['p99_ms']} errors={s['errors']} rss={s['peak_rss_mb']}MB")
+
+
+def compare(base_path, new_path):
+    with open(base_path) as f:
+        base = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    if base["config"] != new["config"]:
+        print("warning: runs used different configs:", base["config"], "vs", new["config"])
+    print(f"base {base['git']['commit']} ({base['git']['subject']})\nnew  {new['git']['commit']} ({new['git']['subject']})")
+    base_levels = {lvl["concurrency"]: lvl for lvl in base["levels"] if "error" not in lvl}
+
+    def delta(old, cur):
+        if old is None or cur is None:
+            return f"{cur}"
+        change = (cur - old) / old * 100 if old else 0.0
+        return f"{cur} ({change:+.1f}%)"
+
+    for lvl in new["levels"]:
+        old = base_levels.get(lvl["concurrency"])
+        if old is None or "error" in lvl:
+            continue
+        print(f"concurrency={lvl['concurrency']}")
+        for endpoint in ["total"] + list(lvl["endpoints"]):
+            cur = lvl["total"] if endpoint == "total" else lvl["endpoints"][endpoint]
+            prev = old["total"] if endpoint == "total" else old["endpoints"].get(endpoint)
+            if prev is None:
+                continue
+            rss = "" if endpoint == "total" else f" rss={delta(prev['peak_rss_mb'], cur['peak_rss_mb'])}"
+            print(f"  {endpoint:<11} rps={delta(prev['throughput_rps'], cur['throughput_rps'])} "
+                  f"p95={delta(prev['p95_ms'], cur['p95_ms'])} p99={delta(prev['p99_ms'], cur['p99_ms'])} "
+                  f"errors={prev['errors']}->{cur['errors']}{rss}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent load test of the API with local LLM/embedding stand-ins.")
+    parser.add_argument("--mix", choices=sorted(MIXES), default="mixed")
+    parser.add_argument("--concurrency", default="1,4,16,32", help="comma-separated client counts, one run each")
+    parser.add_argument("--duration", type=float, default=15.0, help="seconds per concurrency level")
+    parser.add_argument("--seed-docs", type=int, default=5, help="contracts uploaded before measuring")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--llm-latency-ms", type=float, default=200.0, help="stand-in LLM time to first token")
+    parser.add_argument("--llm-tokens-per-s", type=float, default=200.0, help="stand-in LLM output rate")
+    parser.add_argument("--embed-latency-ms", type=float, default=30.0, help="stand-in embedding request latency")
+    parser.add_argument("--backend", help="VECTORSTORE_BACKEND for the run (default: inherited)")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="extra service env, repeatable")
+    parser.add_argument("--out", help="result file (default: benchmarks/results/loadtest-<mix>-<commit>.json)")
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "NEW"), help="compare two result files and exit")
+    parser.add_argument("--verbose", action="store_true", help="show the service's own output")
+    parser.add_argument("--single", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--result-file", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+    elif args.single:
+        run_single(args)
+    else:
+        run_all(args)
+
+
+if __name__ == "__main__":
+    main()
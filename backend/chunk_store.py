@@ -0,0 +1,275 @@
+import json
+import threading
+from array import array
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+# --- Compact chunk store ---
+# The per-process copy of a project's chunks. Instead of one LangChain
+# Document (object + metadata dict + its own strings) per chunk, texts live
+# UTF-8 encoded in one growing bytearray indexed by an offsets array, and each
+# metadata key is a column of uint32 ids into a table of interned values, so
+# "contract.pdf" or "pdf" is stored once however many chunks carry it. Keys
+# whose values are floats (e.g. the ingest-time relevance score) are nearly
+# all distinct, so they get a float64 column instead (NaN = absent). Chunks
+# are exposed through slotted ChunkView objects that decode on access, and a
+# ChunkList is a fixed-length (optionally filtered) view of the store, so a
+# snapshot handed to a request stays stable while new uploads are appended.
+
+_ABSENT = 0
+_SCALARS = (str, int, float, bool, type(None))
+
+
+class _Encoded(str):
+    """An interned non-scalar metadata value, kept as JSON and decoded per read so callers get their own copy."""
+
+
+def _intern_key(value: Any) -> Tuple[type, Any]:
+    # Keyed by type too, so 1, 1.0 and True stay distinct values
+    if isinstance(value, _SCALARS):
+        return type(value), value
+    return _Encoded, json.dumps(value, sort_keys=True, default=str)
+
+
+class ChunkStore:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._arena = bytearray()
+        self._offsets = array("Q", [0])
+        self._columns: Dict[str, array] = {}  # "I" = interned value ids, "d" = floats
+        self._value_ids: Dict[Tuple[type, Any], int] = {}
+        self._values: List[Any] = [None]  # id 0 = key absent
+        self.count = 0
+
+    def _intern(self, value: Any) -> int:
+        key = _intern_key(value)
+        value_id = self._value_ids.get(key)
+        if value_id is None:
+            value_id = len(self._values)
+            self._value_ids[key] = value_id
+            self._values.append(key[1] if key[0] is not _Encoded else _Encoded(key[1]))
+        return value_id
+
+    def _as_interned(self, key: str) -> array:
+        """Convert a float column to interned ids (a non-float value arrived for the key)."""
+        floats = self._columns[key]
+        column = array("I", (_ABSENT if v != v else self._intern(v) for v in floats))
+        self._columns[key] = column
+        return column
+
+    def append(self, text: str, metadata: Dict[str, Any]) -> int:
+        with self._lock:
+            index = self.count
+            for key, value in metadata.items():
+                column = self._columns.get(key)
+                is_float = type(value) is float and value == value
+                if column is None:
+                    # New key: earlier chunks do not have it
+                    if is_float:
+                        column = self._columns[key] = array("d", [np.nan]) * index
+                    else:
+                        column = self._columns[key] = array("I", bytes(4 * index))
+                elif column.typecode == "d" and not is_float:
+                    column = self._as_interned(key)
+                column.append(value if column.typecode == "d" else self._intern(value))
+            for key, column in self._columns.items():
+                if len(column) == index:
+                    column.append(np.nan if column.typecode == "d" else _ABSENT)
+            self._arena += text.encode("utf-8")
+            self._offsets.append(len(self._arena))
+            self.count = index + 1
+            return index
+
+    def extend(self, rows) -> None:
+        for text, metadata in rows:
+            self.append(text, metadata)
+
+    def text(self, index: int) -> str:
+        return self._arena[self._offsets[index]:self._offsets[index + 1]].decode("utf-8")
+
+    def metadata(self, index: int) -> Dict[str, Any]:
+        found = {}
+        for key, column in self._columns.items():
+            raw = column[index]
+            if column.typecode == "d":
+                if raw == raw:
+                    found[key] = raw
+            elif raw != _ABSENT:
+                found[key] = self.value(raw)
+        return found
+
+    def _column(self, key: str, stop: int) -> Optional[np.ndarray]:
+        column = self._columns.get(key)
+        if column is None:
+            return None
+        with self._lock:
+            # Copied under the lock: a live buffer export would block appends to the array
+            return np.array(column[:stop], dtype=np.float64 if column.typecode == "d" else np.uint32)
+
+    def matching(self, key: str, value: Any, stop: int) -> np.ndarray:
+        """Indices below `stop` whose metadata `key` equals `value`."""
+        column = self._column(key, stop)
+        if column is None:
+            return np.zeros(0, dtype=np.int64)
+        if column.dtype == np.float64:
+            if type(value) is not float:
+                return np.zeros(0, dtype=np.int64)
+            return np.flatnonzero(column == value)
+        value_id = self._value_ids.get(_intern_key(value))
+        if value_id is None:
+            return np.zeros(0, dtype=np.int64)
+        return np.flatnonzero(column == value_id)
+
+    def column_ids(self, key: str, stop: int) -> Tuple[np.ndarray, List[Any]]:
+        """
+        Metadata `key` for the first `stop` chunks as (codes, values): chunk i has
+        values[codes[i]], with None for chunks that lack the key.
+        """
+        column = self._column(key, stop)
+        if column is None:
+            return np.zeros(stop, dtype=np.int64), [None]
+        if column.dtype == np.float64:
+            absent = np.isnan(column)
+            uniques, codes = np.unique(np.where(absent, 0.0, column), return_inverse=True)
+            codes = np.where(absent, 0, codes.reshape(-1) + 1)
+            return codes, [None] + uniques.tolist()
+        return column.astype(np.int64), _LazyValues(self)
+
+    def numeric(self, key: str, stop: int) -> np.ndarray:
+        """Metadata `key` as float64 for the first `stop` chunks; NaN where absent or not a number."""
+        column = self._column(key, stop)
+        if column is None:
+            return np.full(stop, np.nan)
+        if column.dtype == np.float64:
+            return column
+        # Only the values this column uses are looked up, not the whole intern table
+        ids, codes = np.unique(column, return_inverse=True)
+        table = np.array([
+            v if isinstance(v, (int, float)) and not isinstance(v, bool) else np.nan
+            for v in (self._values[int(i)] for i in ids)
+        ], dtype=np.float64)
+        return table[codes.reshape(-1)]
+
+    def sizes(self, stop: int) -> np.ndarray:
+        """UTF-8 byte length of each of the first `stop` chunk texts."""
+        with self._lock:
+            offsets = np.array(self._offsets[:stop + 1], dtype=np.int64)
+        return np.diff(offsets)
+
+    def value(self, value_id: int) -> Any:
+        value = self._values[value_id]
+        return json.loads(value) if isinstance(value, _Encoded) else value
+
+    def nbytes(self) -> int:
+        """Approximate memory held by the store's arrays and interned values."""
+        arrays = len(self._arena) + self._offsets.itemsize * len(self._offsets)
+        arrays += sum(column.itemsize * len(column) for column in self._columns.values())
+        return arrays + sum(len(str(k[1])) + 60 for k in self._value_ids)
+
+
+class _LazyValues:
+    """values[code] for an interned column: decodes from the store's intern table."""
+
+    __slots__ = ("_store",)
+
+    def __init__(self, store: ChunkStore):
+        self._store = store
+
+    def __getitem__(self, code: int) -> Any:
+        return self._store.value(int(code))
+
+
+class ChunkView:
+    """One chunk, read from the store on access; duck-types a Document's page_content / metadata."""
+
+    __slots__ = ("_store", "_index")
+
+    def __init__(self, store: ChunkStore, index: int):
+        self._store = store
+        self._index = index
+
+    @property
+    def page_content(self) -> str:
+        return self._store.text(self._index)
+
+    @property
+    def metadata(self) -> Dict[str, Any]:
+        return self._store.metadata(self._index)
+
+    def __repr__(self) -> str:
+        return f"ChunkView({self._index}, {self.metadata!r})"
+
+
+class ChunkList:
+    """
+    Immutable sequence of chunks: the first `stop` chunks of a store, or the
+    subset given by `indices`. Supports len / iteration / indexing like a list.
+    """
+
+    __slots__ = ("_store", "_stop", "_indices")
+
+    def __init__(self, store: ChunkStore, stop: int, indices: Optional[np.ndarray] = None):
+        self._store = store
+        self._stop = stop
+        self._indices = indices
+
+    def __len__(self) -> int:
+        return self._stop if self._indices is None else len(self._indices)
+
+    def _index(self, i: int) -> int:
+        return i if self._indices is None else int(self._indices[i])
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            positions = np.arange(len(self))[i]
+            return ChunkList(self._store, self._stop, positions if self._indices is None else self._indices[positions])
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("chunk index out of range")
+        return ChunkView(self._store, self._index(i))
+
+    def __iter__(self) -> Iterator[ChunkView]:
+        for i in range(len(self)):
+            yield ChunkView(self._store, self._index(i))
+
+    def texts(self) -> Iterator[str]:
+        """Chunk texts in order, without building views or one joined string."""
+        for i in range(len(self)):
+            yield self._store.text(self._index(i))
+
+    def _positions(self) -> np.ndarray:
+        return np.arange(self._stop) if self._indices is None else self._indices
+
+    def numeric(self, key: str) -> np.ndarray:
+        return self._store.numeric(key, self._stop)[self._positions()]
+
+    def sizes(self) -> np.ndarray:
+        return self._store.sizes(self._stop)[self._positions()]
+
+    def take(self, positions: np.ndarray) -> "ChunkList":
+        """The chunks at `positions` (indices into this list), in that order."""
+        return ChunkList(self._store, self._stop, self._positions()[np.asarray(positions, dtype=np.int64)])
+
+    def where(self, key: str, value: Any) -> "ChunkList":
+        """Chunks whose metadata `key` equals `value` (vectorized over the interned column)."""
+        matched = self._store.matching(key, value, self._stop)
+        if self._indices is not None:
+            matched = np.intersect1d(self._indices, matched, assume_unique=True)
+        return ChunkList(self._store, self._stop, matched)
+
+    def group_by(self, key: str) -> Dict[Any, "ChunkList"]:
+        """Chunks split by the value of metadata `key`, groups in order of first appearance."""
+        ids, values = self._store.column_ids(key, self._stop)
+        positions = self._positions()
+        ids = ids[positions]
+        # Stable sort keeps chunk order inside each group; runs of equal ids are the groups
+        order = np.argsort(ids, kind="stable")
+        starts = np.flatnonzero(np.diff(ids[order], prepend=-1))
+        runs = np.split(order, starts[1:])
+        groups: Dict[Any, ChunkList] = {}
+        for run in sorted(runs, key=lambda run: run[0]) if len(order) else []:
+            value = values[int(ids[run[0]])]
+            groups[value] = ChunkList(self._store, self._stop, positions[run])
+        return groups
@@ -0,0 +1,266 @@
+import hashlib
+import re
+import threading
+from bisect import bisect_right
+from collections import OrderedDict, deque
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from corpus_state import CORPUS
+from tracing import traced
+
+# --- Citation index and quote verification ---
+# At ingest every chunk gets an outline: the character offset of each of its
+# lines, the line number its first line has within its page / section, and
+# the headings in effect (carried over from earlier chunks of the same file).
+# Outlines are stored in the corpus database by content hash, so /search can
+# label context chunks with real headings and line numbers, and check the
+# quotes the model returns: all quotes are compiled into one Aho-Corasick
+# automaton and the context chunks are scanned once, instead of searching
+# every chunk for every quote. Each citation comes back flagged verified (with
+# where the quote actually is) or unverified.
+
+OUTLINE_CACHE_SIZE = 4096
+MIN_FRAGMENT_CHARS = 4
+MAX_HEADING_CHARS = 100
+
+HEADING_RE = re.compile(
+    r"^(?:#{1,6}\s+\S.*"
+    r"|(?i:article|section|clause|schedule|appendix|annex|part|exhibit)\s+[\w.-]+\b.*"
+    r"|\d+(?:\.\d+)*\.?\s+[A-Z][^.;]*"
+    r"|[A-Z][A-Z0-9 &,/()'-]{3,})$"
+)
+_UPPER_HEADING_RE = re.compile(r"^[A-Z][A-Z0-9 &,/()'-]{3,}$")
+_ELLIPSIS_RE = re.compile(r"\.\.\.+|…|\[\.\.\.\]")
+_TRANSLATE = str.maketrans({"‘": "'", "’": "'", "“": '"', "”": '"', "–": "-", "—": "-", " ": " "})
+
+
+def text_key(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def heading_of(line: str) -> Optional[str]:
+    line = line.strip()
+    if not line or len(line) > MAX_HEADING_CHARS or not HEADING_RE.match(line):
+        return None
+    # All-caps lines are headings only when they contain letters (not "1,200 / 300")
+    if _UPPER_HEADING_RE.match(line) and not re.search(r"[A-Z]{3}", line):
+        return None
+    return line.lstrip("#").strip()
+
+
+# --- Ingest-time outlines ---
+
+def outline(text: str, line_start: int = 1, heading: Optional[str] = None) -> Dict[str, Any]:
+    """Line offsets and headings of one chunk; `heading` is the one in effect before it."""
+    offsets, headings = [0], []
+    for match in re.finditer(r"\n", text):
+        offsets.append(match.end())
+    for i, start in enumerate(offsets):
+        end = offsets[i + 1] - 1 if i + 1 < len(offsets) else len(text)
+        found = heading_of(text[start:end])
+        if found:
+            headings.append([i, found])
+    return {"line_start": line_start, "heading": heading, "offsets": offsets, "headings": headings}
+
+
+def index_chunks(chunks) -> Dict[str, Dict[str, Any]]:
+    """Outlines for a file's chunks in reading order; line numbers restart with each page / section."""
+    outlines: Dict[str, Dict[str, Any]] = {}
+    heading, location, line = None, object(), 1
+    for chunk in chunks:
+        text = chunk.page_content
+        source_location = chunk.metadata.get("source_location")
+        if source_location != location:
+            location, line = source_location, 1
+        entry = outline(text, line, heading)
+        outlines.setdefault(text_key(text), entry)
+        if entry["headings"]:
+            heading = entry["headings"][-1][1]
+        line += len(entry["offsets"])
+    return outlines
+
+
+class OutlineCache:
+    """Outlines by content hash: in-process LRU in front of the corpus database."""
+
+    def __init__(self, size: int = OUTLINE_CACHE_SIZE):
+        self.size = size
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+    def save(self, outlines: Dict[str, Dict[str, Any]]) -> None:
+        CORPUS.save_outlines(outlines)
+        with self._lock:
+            for key, entry in outlines.items():
+                self._remember(key, entry)
+
+    def _remember(self, key: str, entry: Dict[str, Any]) -> None:
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+
+    def get_many(self, texts: List[str]) -> List[Dict[str, Any]]:
+        keys = [text_key(t) for t in texts]
+        with self._lock:
+            found = {k: self._entries[k] for k in keys if k in self._entries}
+        missing = [k for k in dict.fromkeys(keys) if k not in found]
+        if missing:
+            stored = CORPUS.outlines(missing)
+            with self._lock:
+                for key, entry in stored.items():
+                    self._remember(key, entry)
+            found.update(stored)
+        # Chunks indexed before outlines existed (or synthetic ones): outline the text alone
+        return [found.get(k) or outline(t) for k, t in zip(keys, texts)]
+
+
+OUTLINES = OutlineCache()
+
+
+def locate(entry: Dict[str, Any], position: int) -> Tuple[int, Optional[str]]:
+    """(line number, heading) of a character position inside an outlined chunk."""
+    index = bisect_right(entry["offsets"], position) - 1
+    heading = entry["heading"]
+    for line, title in entry["headings"]:
+        if line > index:
+            break
+        heading = title
+    return entry["line_start"] + index, heading
+
+
+def chunk_label(entry: Dict[str, Any]) -> str:
+    """Heading to show the model for a chunk: its opening heading, else the one it continues."""
+    heading = entry["heading"]
+    if entry["headings"] and entry["headings"][0][0] == 0:
+        heading = entry["headings"][0][1]
+    return heading or "Unknown Section"
+
+
+# --- Multi-pattern matching ---
+
+class AhoCorasick:
+    """Finds every occurrence of a set of patterns in one pass over the text."""
+
+    def __init__(self, patterns: Iterable[str]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[int]] = [[]]
+        self.patterns = list(dict.fromkeys(p for p in patterns if p))
+        for pid, pattern in enumerate(self.patterns):
+            state = 0
+            for ch in pattern:
+                nxt = self._goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[state][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                state = nxt
+            self._out[state].append(pid)
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+        first = "".join(sorted(self._goto[0]))
+        self._start = re.compile(f"[{re.escape(first)}]") if first else None
+
+    def search(self, text: str):
+        """Yields (pattern id, end position) for every match."""
+        if self._start is None:
+            return
+        goto, fail, out = self._goto, self._fail, self._out
+        state, i, n = 0, 0, len(text)
+        while i < n:
+            if state == 0:
+                # Skip ahead to the next character that can start a pattern
+                match = self._start.search(text, i)
+                if match is None:
+                    break
+                i = match.start()
+            ch = text[i]
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for pid in out[state]:
+                yield pid, i + 1
+            i += 1
+
+
+def normalize(text: str) -> Tuple[str, List[int]]:
+    """Case-folded, whitespace-collapsed text plus the original position of each character."""
+    folded = text.translate(_TRANSLATE).lower()
+    if len(folded) != len(text):
+        # A few characters lower-case to two; keep one per original character so positions line up
+        folded = "".join(ch.lower()[0] for ch in text.translate(_TRANSLATE))
+    words, positions = [], []
+    for match in re.finditer(r"\S+", folded):
+        if words:
+            positions.append(match.start())  # the collapsed space maps to the next word
+        words.append(match.group())
+        positions.extend(range(match.start(), match.end()))
+    return " ".join(words), positions
+
+
+def quote_fragments(quote: str) -> List[str]:
+    """Normalized pieces of a quote that must all appear; elided parts (...) are skipped."""
+    pieces = []
+    for part in _ELLIPSIS_RE.split(quote or ""):
+        piece = normalize(part)[0].strip(" \"'`.,;:")
+        if len(piece) >= MIN_FRAGMENT_CHARS:
+            pieces.append(piece)
+    return pieces
+
+
+def _chunk_number(value: Any) -> Optional[int]:
+    match = re.search(r"\d+", str(value or ""))
+    return int(match.group()) if match else None
+
+
+@traced()
+def verify_citations(answer: Dict[str, Any], texts: List[str]) -> Dict[str, Any]:
+    """
+    Flag each citation in `answer` as verified (every quote fragment occurs in
+    one context chunk, preferring the chunk it cites) and attach the quote's
+    real chunk / heading / line; adds a verified / unverified tally.
+    """
+    citations = answer.get("citations")
+    if not isinstance(citations, list):
+        return answer
+    fragments = [quote_fragments(c.get("quote") if isinstance(c, dict) else None) for c in citations]
+    matcher = AhoCorasick(f for parts in fragments for f in parts)
+    ids = {p: i for i, p in enumerate(matcher.patterns)}
+    outlines = OUTLINES.get_many(texts)
+    # pattern id -> {chunk number: first original start position}
+    hits: Dict[int, Dict[int, int]] = {}
+    normalized = [normalize(t) for t in texts]
+    for number, (norm, positions) in enumerate(normalized, start=1):
+        for pid, end in matcher.search(norm):
+            hits.setdefault(pid, {}).setdefault(number, positions[end - len(matcher.patterns[pid])])
+
+    verified = 0
+    for citation, parts in zip(citations, fragments):
+        if not isinstance(citation, dict):
+            continue
+        chunks = None
+        for part in parts:
+            found = set(hits.get(ids[part], {}))
+            chunks = found if chunks is None else chunks & found
+        cited = _chunk_number(citation.get("chunk"))
+        number = None
+        if chunks:
+            number = cited if cited in chunks else min(chunks)
+        citation["verified"] = number is not None
+        if number is not None:
+            verified += 1
+            line, heading = locate(outlines[number - 1], hits[ids[parts[0]]][number])
+            citation["source"] = {"chunk": f"CHUNK {number}", "heading": heading, "line": line}
+    answer["verification"] = {"verified": verified, "unverified": len(citations) - verified}
+    return answer
@@ -0,0 +1,270 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+from chunk_store import ChunkList, ChunkStore
+
+# --- Shared corpus state ---
+# Chunk registry, per-document manifests and the corpus version live in a
+# SQLite database next to the persistent vector store, so every uvicorn worker
+# (and every replica mounting the same volume) sees the same corpus. Each
+# process keeps a cached copy of the chunk list and only re-reads it when the
+# version row changes; since the registry is append-only, a refresh loads just
+# the new rows, appended to a compact ChunkStore. Everything is namespaced by project; each project has its own
+# version counter so an upload to one project does not invalidate the others.
+# A file whose content (sha256) is already registered in the project is not
+# registered again, so re-uploads do not double-count in highlights / scores.
+
+# Not imported from vectorstore (which imports this module); same default
+CORPUS_STATE_DB = os.getenv("CORPUS_STATE_DB") or os.path.join(
+    os.getenv("VECTORSTORE_DIR", "/tmp/chroma_store"), "corpus_state.db"
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS chunks (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    doc_id TEXT NOT NULL,
+    file_name TEXT,
+    file_type TEXT,
+    source_location TEXT,
+    page_content TEXT NOT NULL,
+    metadata TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS chunks_doc_id ON chunks(doc_id);
+CREATE TABLE IF NOT EXISTS manifests (
+    doc_id TEXT PRIMARY KEY,
+    file_name TEXT NOT NULL,
+    file_type TEXT,
+    sha256 TEXT,
+    chunk_count INTEGER NOT NULL,
+    uploaded_at REAL NOT NULL,
+    corpus_version INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS insights (
+    doc_id TEXT PRIMARY KEY,
+    project TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS score_baselines (
+    scope TEXT PRIMARY KEY,
+    corpus_version INTEGER NOT NULL,
+    payload TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS chunk_outlines (
+    text_key TEXT PRIMARY KEY,
+    payload TEXT NOT NULL
+);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('corpus_version', '0');
+"""
+
+DEFAULT_PROJECT = "default"
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class CorpusState:
+    def __init__(self, path: str = CORPUS_STATE_DB):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # project -> (last loaded row id, store, (version, chunks))
+        self._cache: Dict[str, Tuple[int, ChunkStore, Tuple[int, ChunkList]]] = {}
+        conn = self._conn()
+        conn.executescript(_SCHEMA)
+        self._migrate(conn)
+
+    @staticmethod
+    def _migrate(conn: sqlite3.Connection) -> None:
+        for table in ("chunks", "manifests"):
+            columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+            if "project" not in columns:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN project TEXT NOT NULL DEFAULT '{DEFAULT_PROJECT}'")
+        conn.execute("CREATE INDEX IF NOT EXISTS chunks_project_id ON chunks(project, id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS manifests_project_sha256 ON manifests(project, sha256)")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def version(self, project: Optional[str] = None) -> int:
+        """Version of one project's corpus, or of the whole store when project is None."""
+        key = "corpus_version" if project is None else f"corpus_version:{project}"
+        row = self._conn().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return int(row[0]) if row else 0
+
+    def projects(self) -> List[str]:
+        return [row[0] for row in self._conn().execute("SELECT DISTINCT project FROM manifests ORDER BY project")]
+
+    def find_document(self, sha256: str, project: str = DEFAULT_PROJECT) -> Optional[Dict[str, Any]]:
+        """Manifest of the project's document with this content hash, if one is registered."""
+        cur = self._conn().execute(
+            "SELECT doc_id, file_name, chunk_count, corpus_version FROM manifests WHERE project = ? AND sha256 = ? "
+            "ORDER BY uploaded_at LIMIT 1",
+            (project, sha256),
+        )
+        row = cur.fetchone()
+        return dict(zip([d[0] for d in cur.description], row)) if row else None
+
+    def add_document(self, file_name: str, chunks: List[Document], sha256: Optional[str] = None, project: str = DEFAULT_PROJECT) -> Tuple[str, int, bool]:
+        """
+        Register a parsed file and its chunks atomically; returns (doc_id, project
+        version, created). Content already registered in the project (same sha256)
+        is not added again: the existing doc_id is returned with created=False.
+        """
+        doc_id = str(uuid.uuid4())
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if sha256:
+                # Checked inside the write transaction, so concurrent uploads of one file register it once
+                row = conn.execute(
+                    "SELECT doc_id FROM manifests WHERE project = ? AND sha256 = ? LIMIT 1", (project, sha256)
+                ).fetchone()
+                if row:
+                    conn.execute("COMMIT")
+                    return row[0], self.version(project), False
+            version = self.version(project) + 1
+            conn.executemany(
+                "INSERT INTO chunks (doc_id, project, file_name, file_type, source_location, page_content, metadata) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (doc_id, project, c.metadata.get("file_name"), c.metadata.get("file_type"), c.metadata.get("source_location"),
+                     c.page_content, json.dumps(dict(c.metadata, doc_id=doc_id, project=project)))
+                    for c in chunks
+                ],
+            )
+            conn.execute(
+                "INSERT INTO manifests (doc_id, project, file_name, file_type, sha256, chunk_count, uploaded_at, corpus_version) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (doc_id, project, file_name, chunks[0].metadata.get("file_type") if chunks else None, sha256, len(chunks), time.time(), version),
+            )
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (f"corpus_version:{project}", str(version)))
+            conn.execute("UPDATE meta SET value = CAST(value AS INTEGER) + 1 WHERE key = 'corpus_version'")
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        for c in chunks:
+            c.metadata["doc_id"] = doc_id
+            c.metadata["project"] = project
+        return doc_id, version, True
+
+    def chunks(self, project: str = DEFAULT_PROJECT) -> ChunkList:
+        return self.snapshot(project)[1]
+
+    def _cached(self, project: str) -> Tuple[int, ChunkStore, Tuple[int, ChunkList]]:
+        entry = self._cache.get(project)
+        if entry is None:
+            store = ChunkStore()
+            entry = (0, store, (-1, ChunkList(store, 0)))
+        return entry
+
+    def snapshot(self, project: str = DEFAULT_PROJECT) -> Tuple[int, ChunkList]:
+        """(project version, project chunks); refreshed from the shared store only when the version moved."""
+        version = self.version(project)
+        last_row_id, store, cached = self._cached(project)
+        if version == cached[0]:
+            return cached
+        with self._lock:
+            last_row_id, store, cached = self._cached(project)
+            if version != cached[0]:
+                conn = self._conn()
+                # One read transaction so the version and the rows come from the same snapshot
+                conn.execute("BEGIN")
+                try:
+                    version = self.version(project)
+                    rows = conn.execute(
+                        "SELECT id, page_content, metadata FROM chunks WHERE project = ? AND id > ? ORDER BY id",
+                        (project, last_row_id),
+                    ).fetchall()
+                finally:
+                    conn.execute("COMMIT")
+                if rows:
+                    # The store is append-only; readers holding the old snapshot keep seeing its first rows
+                    store.extend((text, json.loads(meta)) for _, text, meta in rows)
+                    last_row_id = rows[-1][0]
+                cached = (version, ChunkList(store, store.count))
+                self._cache[project] = (last_row_id, store, cached)
+            return cached
+
+    def save_insights(self, doc_id: str, project: str, payload: Dict[str, Any]) -> None:
+        self._conn().execute(
+            "INSERT OR REPLACE INTO insights (doc_id, project, payload, created_at) VALUES (?, ?, ?, ?)",
+            (doc_id, project, json.dumps(payload), time.time()),
+        )
+
+    def insights(self, doc_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Precomputed per-document insights for the given documents (missing ones are left out)."""
+        found: Dict[str, Dict[str, Any]] = {}
+        conn = self._conn()
+        for start in range(0, len(doc_ids), 500):
+            batch = doc_ids[start:start + 500]
+            rows = conn.execute(
+                f"SELECT doc_id, payload FROM insights WHERE doc_id IN ({','.join('?' * len(batch))})", batch
+            ).fetchall()
+            found.update((doc_id, json.loads(payload)) for doc_id, payload in rows)
+        return found
+
+    def save_baseline(self, scope: str, corpus_version: int, payload: Dict[str, Any]) -> None:
+        """Latest LLM score baseline for a scope (project / file); older versions are replaced."""
+        self._conn().execute(
+            "INSERT OR REPLACE INTO score_baselines (scope, corpus_version, payload, created_at) VALUES (?, ?, ?, ?)",
+            (scope, corpus_version, json.dumps(payload), time.time()),
+        )
+
+    def baseline(self, scope: str, corpus_version: int) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute(
+            "SELECT payload FROM score_baselines WHERE scope = ? AND corpus_version = ?", (scope, corpus_version)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save_outlines(self, outlines: Dict[str, Dict[str, Any]]) -> None:
+        """Citation outlines by chunk content hash; the first outline of a text is kept."""
+        self._conn().executemany(
+            "INSERT OR IGNORE INTO chunk_outlines (text_key, payload) VALUES (?, ?)",
+            [(key, json.dumps(entry)) for key, entry in outlines.items()],
+        )
+
+    def outlines(self, keys: List[str]) -> Dict[str, Dict[str, Any]]:
+        found: Dict[str, Dict[str, Any]] = {}
+        conn = self._conn()
+        for start in range(0, len(keys), 500):
+            batch = keys[start:start + 500]
+            rows = conn.execute(
+                f"SELECT text_key, payload FROM chunk_outlines WHERE text_key IN ({','.join('?' * len(batch))})", batch
+            ).fetchall()
+            found.update((key, json.loads(payload)) for key, payload in rows)
+        return found
+
+    def manifests(self, project: Optional[str] = None) -> List[Dict[str, Any]]:
+        query = "SELECT doc_id, project, file_name, file_type, sha256, chunk_count, uploaded_at, corpus_version FROM manifests"
+        params: Tuple = ()
+        if project is not None:
+            query += " WHERE project = ?"
+            params = (project,)
+        cur = self._conn().execute(query + " ORDER BY uploaded_at", params)
+        cols = [d[0] for d in cur.description]
+        return [dict(zip(cols, row)) for row in cur.fetchall()]
+
+
+CORPUS = CorpusState()
@@ -0,0 +1,136 @@
+import hashlib
+import random
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Tuple
+
+# --- MinHash / LSH near-duplicate detection ---
+# Signatures are computed once per chunk at ingest (see /upload) and looked up
+# by content hash at retrieval time, so filtering a context list only costs a
+# handful of bucket lookups per chunk.
+
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+SHINGLE_SIZE = 3
+NEAR_DUP_THRESHOLD = 0.8
+# Signatures of texts seen only at query time (not registered at ingest) kept in an LRU
+LAZY_SIGNATURE_CACHE = 4096
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_rng = random.Random(1337)
+_PERMUTATIONS = [
+    (_rng.randint(1, _MERSENNE_PRIME - 1), _rng.randint(0, _MERSENNE_PRIME - 1))
+    for _ in range(NUM_PERM)
+]
+
+Signature = Tuple[int, ...]
+
+
+def _hash64(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> set:
+    tokens = re.findall(r"\w+", text.lower())
+    if len(tokens) <= size:
+        return {" ".join(tokens)}
+    return {" ".join(tokens[i:i + size]) for i in range(len(tokens) - size + 1)}
+
+
+def minhash_signature(text: str) -> Signature:
+    hashed = [_hash64(s) & _MAX_HASH for s in shingles(text)]
+    return tuple(
+        min((a * h + b) % _MERSENNE_PRIME for h in hashed) & _MAX_HASH
+        for a, b in _PERMUTATIONS
+    )
+
+
+def estimate_similarity(a: Signature, b: Signature) -> float:
+    return sum(1 for x, y in zip(a, b) if x == y) / NUM_PERM
+
+
+def _band_keys(signature: Signature) -> List[Tuple[int, Signature]]:
+    return [(band, signature[band * ROWS:(band + 1) * ROWS]) for band in range(BANDS)]
+
+
+class NearDuplicateIndex:
+    """
+    Content-hash -> MinHash signature registry filled at ingest time.
+    Unknown texts (e.g. from a persisted store after a restart) are signed lazily
+    and kept in a bounded LRU, not registered.
+    """
+
+    def __init__(self, lazy_cache_size: int = LAZY_SIGNATURE_CACHE):
+        self._signatures: Dict[str, Signature] = {}
+        self._lazy: "OrderedDict[str, Signature]" = OrderedDict()
+        self._lazy_size = lazy_cache_size
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._signatures)
+
+    def add(self, text: str) -> Signature:
+        key = hashlib.sha1(text.encode("utf-8")).hexdigest()
+        sig = self._signatures.get(key)
+        if sig is None:
+            sig = minhash_signature(text)
+            self._signatures[key] = sig
+        return sig
+
+    def add_documents(self, chunks) -> None:
+        for chunk in chunks:
+            self.add(getattr(chunk, "page_content", chunk))
+
+    def signature(self, text: str) -> Signature:
+        key = hashlib.sha1(text.encode("utf-8")).hexdigest()
+        sig = self._signatures.get(key)
+        if sig is not None:
+            return sig
+        with self._lock:
+            sig = self._lazy.get(key)
+            if sig is not None:
+                self._lazy.move_to_end(key)
+                return sig
+        sig = minhash_signature(text)
+        with self._lock:
+            self._lazy[key] = sig
+            while len(self._lazy) > self._lazy_size:
+                self._lazy.popitem(last=False)
+        return sig
+
+    def add_signatures(self, texts: Iterable[str], signatures: Iterable[Signature]) -> None:
+        """Register precomputed signatures (e.g. from an index snapshot) without re-hashing shingles."""
+        for text, sig in zip(texts, signatures):
+            self._signatures[hashlib.sha1(text.encode("utf-8")).hexdigest()] = tuple(int(x) for x in sig)
+
+
+NEAR_DUP_INDEX = NearDuplicateIndex()
+
+
+def filter_near_duplicates(
+    texts: Iterable[str],
+    index: NearDuplicateIndex = NEAR_DUP_INDEX,
+    threshold: float = NEAR_DUP_THRESHOLD,
+) -> List[str]:
+    """
+    Keep the first occurrence of each group of near-identical texts (estimated
+    Jaccard similarity >= threshold). Order of the input is preserved.
+    """
+    buckets: Dict[Tuple[int, Signature], List[int]] = {}
+    kept: List[str] = []
+    kept_sigs: List[Signature] = []
+    for text in texts:
+        sig = index.signature(text)
+        keys = _band_keys(sig)
+        candidates = {i for key in keys for i in buckets.get(key, ())}
+        if any(estimate_similarity(sig, kept_sigs[i]) >= threshold for i in candidates):
+            continue
+        pos = len(kept)
+        kept.append(text)
+        kept_sigs.append(sig)
+        for key in keys:
+            buckets.setdefault(key, []).append(pos)
+    return kept
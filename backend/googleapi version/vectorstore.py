@@ -2,18 +2,40 @@
 from langchaincommunity.vectorstores import Chroma
 from langchaincore.documents import Document
 from google import genai
+from concurrent.futures import ThreadPoolExecutor
 import os
+import random
+import time
+
+# embed_content accepts at most 100 texts per request
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "100"))
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "3"))
 
 def get_embeddings():
     api_key = os.getenv("GEMINI_API_KEY")
     client = genai.Client(api_key=api_key)
+    def embed_batch(texts):
+        for attempt in range(EMBED_MAX_RETRIES + 1):
+            try:
+                result = client.models.embed_content(
+                    model="gemini-embedding-001",
+                    contents=[{"content": t} for t in texts]
+                )
+                # result.embeddings is a list of objects with 'values'
+                return [e.values for e in result.embeddings]
+            except Exception as e:
+                if attempt == EMBED_MAX_RETRIES:
+                    raise
+                print(f"EMBED RETRY {attempt + 1}/{EMBED_MAX_RETRIES}: {e}")
+                time.sleep(min(2 ** attempt, 30) * random.uniform(0.5, 1.0))
     def embed(texts):
-        result = client.models.embed_content(
-            model="gemini-embedding-001",
-            contents=[{"content": t} for t in texts]
-        )
-        # result.embeddings is a list of objects with 'values'
-        return [e.values for e in result.embeddings]
+        # Batch-sized requests, a few in flight at once; a failing batch is retried on its own
+        batches = [texts[i:i + EMBED_BATCH_SIZE] for i in range(0, len(texts), EMBED_BATCH_SIZE)]
+        if len(batches) <= 1:
+            return embed_batch(texts) if texts else []
+        with ThreadPoolExecutor(max_workers=EMBED_CONCURRENCY) as pool:
+            return [v for vectors in pool.map(embed_batch, batches) for v in vectors]
     return embed
 
 
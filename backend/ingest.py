@@ -0,0 +1,168 @@
+import os
+import re
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from citations import OUTLINES, index_chunks
+from corpus_state import CORPUS, file_sha256
+from dedup import NEAR_DUP_INDEX
+from insights import INSIGHTS_ENABLED, schedule_document_insights
+from loader import load_and_chunk_docs
+from relevance import score_chunks
+from tables import TABLES, is_tabular, read_tabular, table_chunks
+from vectorstore import add_documents, get_vectorstore
+
+# --- File and archive ingestion ---
+# One code path for a single upload and for every member of a bulk archive:
+# parse -> embed/index -> register in the shared corpus state. Archive members
+# are streamed out of the ZIP one at a time and ingested in parallel; the
+# archive itself is never read into memory.
+
+UPLOAD_ROOT = "./backend/uploads"
+COPY_BUFFER_BYTES = 1024 * 1024
+INGEST_CONCURRENCY = int(os.getenv("INGEST_CONCURRENCY", "4"))
+ARCHIVE_MAX_FILES = int(os.getenv("ARCHIVE_MAX_FILES", "2000"))
+ARCHIVE_MAX_UNCOMPRESSED_BYTES = int(os.getenv("ARCHIVE_MAX_UNCOMPRESSED_BYTES", str(5 * 1024 ** 3)))
+SUPPORTED_EXTENSIONS = {
+    ".pdf", ".docx", ".txt", ".csv", ".xlsx", ".ifc", ".bim", ".dwg", ".dxf", ".jpg", ".jpeg", ".png"
+}
+
+
+class ArchiveError(Exception):
+    pass
+
+
+def upload_dir(project: str) -> str:
+    path = os.path.join(UPLOAD_ROOT, project)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def save_stream(src, dest_path: str) -> int:
+    """Copy a file-like object to disk in fixed-size blocks; returns bytes written."""
+    written = 0
+    with open(dest_path, "wb") as out:
+        for block in iter(lambda: src.read(COPY_BUFFER_BYTES), b""):
+            out.write(block)
+            written += len(block)
+    return written
+
+
+def ingest_file(file_path: str, file_name: str, project: str) -> Dict[str, Any]:
+    """Parse, index and register one file on disk; returns doc_id, chunk count and timings."""
+    t0 = time.monotonic()
+    sha256 = file_sha256(file_path)
+    existing = CORPUS.find_document(sha256, project)
+    if existing:
+        # Same content already in the project: nothing to parse, embed or register
+        return {"doc_id": existing["doc_id"], "chunks": existing["chunk_count"], "duplicate": True,
+                "parse_s": 0.0, "index_s": round(time.monotonic() - t0, 3)}
+    frames = None
+    if is_tabular(file_path):
+        # Parsed once: summary chunks for retrieval, full columns for exact table queries
+        frames = read_tabular(file_path)
+        chunks = table_chunks(frames, os.path.basename(file_path), os.path.splitext(file_path)[1][1:].lower())
+    else:
+        chunks = load_and_chunk_docs(file_path)
+    for chunk in chunks:
+        chunk.metadata["project"] = project
+    t1 = time.monotonic()
+    vectorstore = get_vectorstore(project=project)
+    # Stored with the chunk so /highlights and /dashboard can skip irrelevant chunks without rescanning
+    score_chunks(chunks, getattr(vectorstore, "embeddings", None))
+    add_documents(chunks, vectorstore)
+    # Shared registry: every worker/replica picks the new chunks up via the project version
+    doc_id, _, created = CORPUS.add_document(file_name, chunks, sha256, project)
+    if not created:
+        # Lost a race with a concurrent upload of the same file, which registered it
+        return {"doc_id": doc_id, "chunks": len(chunks), "duplicate": True,
+                "parse_s": round(t1 - t0, 3), "index_s": round(time.monotonic() - t1, 3)}
+    NEAR_DUP_INDEX.add_documents(chunks)
+    # Line offsets and headings per chunk, for citation labels and quote checks
+    OUTLINES.save(index_chunks(chunks))
+    if frames is not None:
+        TABLES.save(project, doc_id, file_name, frames)
+    if INSIGHTS_ENABLED:
+        # Summary tree + highlights for this document only, off the request path
+        schedule_document_insights(doc_id, project, chunks)
+    return {
+        "doc_id": doc_id,
+        "chunks": len(chunks),
+        "duplicate": False,
+        "parse_s": round(t1 - t0, 3),
+        "index_s": round(time.monotonic() - t1, 3),
+    }
+
+
+def _member_path(name: str) -> Optional[str]:
+    """Safe relative path for an archive member, or None for entries to skip."""
+    parts = [p for p in re.split(r"[\\/]+", name) if p not in ("", ".", "..")]
+    if not parts or parts[0] == "__MACOSX" or any(p.startswith(".") for p in parts):
+        return None
+    return os.path.join(*parts)
+
+
+def ingest_archive(archive_path: str, project: str, max_workers: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Ingest every supported file in a ZIP archive, INGEST_CONCURRENCY files at a time.
+    One bad member never fails the batch; it is reported with its error instead.
+    """
+    started = time.monotonic()
+    try:
+        with zipfile.ZipFile(archive_path) as zf:
+            members = [m for m in zf.infolist() if not m.is_dir()]
+    except zipfile.BadZipFile as e:
+        raise ArchiveError(f"Not a valid ZIP archive: {e}")
+
+    report: List[Dict[str, Any]] = []
+    todo = []
+    for m in members:
+        rel_path = _member_path(m.filename)
+        if rel_path is None:
+            continue
+        if os.path.splitext(rel_path)[1].lower() not in SUPPORTED_EXTENSIONS:
+            report.append({"file": rel_path, "status": "skipped", "error": "Unsupported file type"})
+            continue
+        todo.append((m, rel_path))
+    if len(todo) > ARCHIVE_MAX_FILES:
+        raise ArchiveError(f"Archive has {len(todo)} files, at most {ARCHIVE_MAX_FILES} are allowed.")
+    # zipfile stops reading a member at its declared size, so this bounds the extracted total
+    if sum(m.file_size for m, _ in todo) > ARCHIVE_MAX_UNCOMPRESSED_BYTES:
+        raise ArchiveError(f"Archive expands to more than {ARCHIVE_MAX_UNCOMPRESSED_BYTES} bytes.")
+
+    dest_root = os.path.join(upload_dir(project), os.path.splitext(os.path.basename(archive_path))[0])
+
+    def ingest_member(item) -> Dict[str, Any]:
+        member, rel_path = item
+        entry: Dict[str, Any] = {"file": rel_path}
+        t0 = time.monotonic()
+        try:
+            dest = os.path.join(dest_root, rel_path)
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            # Each worker opens its own handle; ZipFile objects are not thread-safe
+            with zipfile.ZipFile(archive_path) as zf, zf.open(member) as src:
+                entry["bytes"] = save_stream(src, dest)
+            entry["extract_s"] = round(time.monotonic() - t0, 3)
+            entry.update(ingest_file(dest, os.path.basename(rel_path), project))
+            entry["status"] = "ok"
+        except Exception as e:
+            print("ARCHIVE MEMBER ERROR", rel_path, e)
+            entry["status"] = "failed"
+            entry["error"] = str(e)
+        entry["total_s"] = round(time.monotonic() - t0, 3)
+        return entry
+
+    with ThreadPoolExecutor(max_workers=max_workers or INGEST_CONCURRENCY, thread_name_prefix="ingest") as pool:
+        report.extend(pool.map(ingest_member, todo))
+
+    statuses = [entry["status"] for entry in report]
+    return {
+        "project": project,
+        "files": report,
+        "ingested": statuses.count("ok"),
+        "failed": statuses.count("failed"),
+        "skipped": statuses.count("skipped"),
+        "elapsed_s": round(time.monotonic() - started, 3),
+    }
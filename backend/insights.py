@@ -0,0 +1,165 @@
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List
+
+from corpus_state import CORPUS
+from dedup import filter_near_duplicates
+from rag_chain import DocChunk, extract_contract_highlights, summarize_document_text
+from relevance import select_relevant
+
+# --- Per-document insights ---
+# With PRECOMPUTE_INSIGHTS=1 every indexed file gets a summary tree (leaf
+# summaries over groups of chunks, folded up to one root) plus highlights and
+# risks, computed in the background right after ingest and stored in the
+# corpus database. /highlights merges the per-document results and /dashboard
+# scores over the document summaries, so a new upload only costs LLM work for
+# that one document. Documents without insights yet are computed on demand: a
+# request joins a background job only once it is running, and takes over one
+# that is still queued (e.g. behind a bulk archive upload) instead of waiting
+# for the queue to reach it.
+
+INSIGHTS_ENABLED = os.getenv("PRECOMPUTE_INSIGHTS", "0") == "1"
+INSIGHT_LEAF_CHARS = int(os.getenv("INSIGHT_LEAF_CHARS", "12000"))
+SUMMARY_TREE_FANOUT = 8
+INSIGHTS_EXECUTOR = ThreadPoolExecutor(max_workers=int(os.getenv("INSIGHT_CONCURRENCY", "2")), thread_name_prefix="insights")
+
+_inflight: Dict[str, Future] = {}
+_inflight_lock = threading.RLock()
+
+
+def _leaf_texts(chunks) -> List[str]:
+    """Pack consecutive chunks into leaves of at most INSIGHT_LEAF_CHARS characters."""
+    leaves, current, size = [], [], 0
+    for chunk in chunks:
+        text = chunk.page_content
+        if current and size + len(text) > INSIGHT_LEAF_CHARS:
+            leaves.append("\n\n".join(current))
+            current, size = [], 0
+        current.append(text)
+        size += len(text)
+    if current:
+        leaves.append("\n\n".join(current))
+    return leaves
+
+
+def compute_document_insights(chunks) -> Dict[str, Any]:
+    leaves = _leaf_texts(chunks)
+    highlights, risks = [], []
+    # The summary tree covers the whole document; highlights only its relevant chunks
+    for text in _leaf_texts(select_relevant(chunks)):
+        found = extract_contract_highlights(text)
+        highlights.extend(h.dict() for h in found.highlights)
+        risks.extend(r.dict() for r in found.risks)
+    levels = [[summarize_document_text(text) for text in leaves]]
+    while len(levels[-1]) > 1:
+        below = levels[-1]
+        levels.append([
+            summarize_document_text("\n\n".join(below[i:i + SUMMARY_TREE_FANOUT]))
+            for i in range(0, len(below), SUMMARY_TREE_FANOUT)
+        ])
+    meta = chunks[0].metadata if chunks else {}
+    return {
+        "file_name": meta.get("file_name"),
+        "file_type": meta.get("file_type"),
+        "chunks": len(chunks),
+        "summary": levels[-1][0] if levels[-1] else "",
+        "summary_tree": levels,
+        "highlights": highlights,
+        "risks": risks,
+    }
+
+
+def _compute_and_store(doc_id: str, project: str, chunks) -> Dict[str, Any]:
+    stored = CORPUS.insights([doc_id]).get(doc_id)
+    if stored is not None:
+        # Computed meanwhile by a request (or another worker)
+        return stored
+    insights = compute_document_insights(chunks)
+    CORPUS.save_insights(doc_id, project, insights)
+    return insights
+
+
+def schedule_document_insights(doc_id: str, project: str, chunks) -> Future:
+    """Start (or join) the background insight job for one document."""
+    with _inflight_lock:
+        future = _inflight.get(doc_id)
+        if future is None:
+            future = INSIGHTS_EXECUTOR.submit(_compute_and_store, doc_id, project, chunks)
+            _inflight[doc_id] = future
+            # May run right here if the job already finished, hence the re-entrant lock
+            future.add_done_callback(lambda f: _finished(doc_id, f))
+        return future
+
+
+def _finished(doc_id: str, future: Future) -> None:
+    with _inflight_lock:
+        if _inflight.get(doc_id) is future:
+            del _inflight[doc_id]
+    if not future.cancelled() and future.exception() is not None:
+        print("INSIGHTS ERROR", doc_id, future.exception())
+
+
+def _claim(doc_id: str, project: str, chunks) -> Future:
+    """
+    The insight job for one document: joined if it is already running,
+    otherwise run on the caller's thread (a queued background job is cancelled).
+    """
+    with _inflight_lock:
+        future = _inflight.get(doc_id)
+        if future is not None and not future.cancel():
+            return future
+        mine: Future = Future()
+        mine.set_running_or_notify_cancel()
+        _inflight[doc_id] = mine
+    try:
+        mine.set_result(_compute_and_store(doc_id, project, chunks))
+    except Exception as e:
+        mine.set_exception(e)
+    finally:
+        _finished(doc_id, mine)
+    return mine
+
+
+def document_insights(project: str, chunks) -> List[Dict[str, Any]]:
+    """Insights for every document the chunks belong to, in order; missing ones are computed now."""
+    by_doc = chunks.group_by("doc_id")
+    stored = CORPUS.insights([doc_id for doc_id in by_doc if doc_id])
+    results = []
+    for doc_id, doc_chunks in by_doc.items():
+        if doc_id is None:
+            # Chunks registered before documents had ids; nothing to persist under
+            results.append(compute_document_insights(doc_chunks))
+        elif doc_id in stored:
+            results.append(stored[doc_id])
+        else:
+            results.append(_claim(doc_id, project, doc_chunks).result())
+    return results
+
+
+def merge_highlights(insights: List[Dict[str, Any]]) -> Dict[str, Any]:
+    merged = {}
+    for key in ("highlights", "risks"):
+        items = [item for doc in insights for item in doc.get(key, [])]
+        # Boilerplate clauses repeat across contracts; keep one of each
+        kept = set(filter_near_duplicates([item["text"] for item in items]))
+        merged[key] = []
+        for item in items:
+            if item["text"] in kept:
+                kept.discard(item["text"])
+                merged[key].append(item)
+    return merged
+
+
+def summary_context(insights: List[Dict[str, Any]]) -> List[DocChunk]:
+    """One context entry per document: its root summary, or the level below it for large documents."""
+    context = []
+    for doc in insights:
+        tree = doc.get("summary_tree") or [[doc.get("summary", "")]]
+        level = tree[-2] if len(tree) > 1 else tree[-1]
+        context.append(DocChunk(page_content=f"[{doc.get('file_name')}]\n" + "\n\n".join(level)))
+    return context
+
+
+def insights_stats() -> Dict[str, Any]:
+    return {"enabled": INSIGHTS_ENABLED, "in_flight": len(_inflight)}
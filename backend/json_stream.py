@@ -0,0 +1,192 @@
+import json
+import typing
+from bisect import bisect_right
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from pydantic import BaseModel, TypeAdapter, ValidationError
+
+# --- Incremental JSON parsing for streamed LLM output ---
+# The parser is fed completion chunks as they arrive and reports every
+# top-level member of the JSON object (and every item of a top-level array)
+# as soon as its closing delimiter is seen. A malformed or truncated tail only
+# loses the member it belongs to; everything before it is already parsed.
+# Only the chunks of the member still open are kept, and a member or item is
+# joined into one string once, when it closes, so parsing stays linear in
+# the length of the output.
+
+Event = Tuple[str, str, Any]  # ("section" | "item", key, value)
+_INVALID = object()
+
+
+class StreamingJSONParser:
+    def __init__(self):
+        self.done = False
+        self._chunks: List[str] = []  # chunks from the one holding _member_start on
+        self._starts: List[int] = []  # absolute offset of each kept chunk
+        self._end = 0  # absolute offset just past the last chunk
+        self._depth = 0
+        self._started = False
+        self._in_string = False
+        self._escape = False
+        self._member_start = 0
+        self._array_key: Optional[str] = None
+        self._item_start = 0
+
+    def _slice(self, start: int, end: int) -> str:
+        """Text between absolute offsets `start` and `end`, from the kept chunks."""
+        if end <= start:
+            return ""
+        first = bisect_right(self._starts, start) - 1
+        last = bisect_right(self._starts, end - 1)
+        joined = "".join(self._chunks[first:last])
+        base = self._starts[first]
+        return joined[start - base:end - base]
+
+    def feed(self, chunk: str) -> List[Event]:
+        events: List[Event] = []
+        if not chunk or self.done:
+            return events
+        self._chunks.append(chunk)
+        self._starts.append(self._end)
+        base = self._end
+        self._end += len(chunk)
+        for offset, ch in enumerate(chunk):
+            if self.done:
+                break
+            i = base + offset
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                continue
+            if not self._started:
+                # Skip any prose / code fences before the object
+                if ch == "{":
+                    self._started = True
+                    self._depth = 1
+                    self._member_start = i + 1
+                continue
+            if ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                if ch == "[" and self._depth == 1:
+                    self._array_key = self._member_key(self._slice(self._member_start, i))
+                    self._item_start = i + 1
+                self._depth += 1
+            elif ch in "}]":
+                if ch == "]" and self._depth == 2 and self._array_key is not None:
+                    self._emit_item(self._slice(self._item_start, i), events)
+                    self._array_key = None
+                self._depth -= 1
+                if self._depth == 0:
+                    self._emit_member(self._slice(self._member_start, i), events)
+                    self.done = True
+            elif ch == ",":
+                if self._depth == 1:
+                    self._emit_member(self._slice(self._member_start, i), events)
+                    self._member_start = i + 1
+                elif self._depth == 2 and self._array_key is not None:
+                    self._emit_item(self._slice(self._item_start, i), events)
+                    self._item_start = i + 1
+        # Chunks wholly before the open member are never read again
+        keep_from = self._member_start if self._started else self._end
+        drop = bisect_right(self._starts, keep_from) - 1
+        if drop > 0:
+            del self._chunks[:drop]
+            del self._starts[:drop]
+        return events
+
+    @staticmethod
+    def _member_key(raw: str) -> Optional[str]:
+        try:
+            return json.loads(raw.strip().rstrip(":").strip())
+        except ValueError:
+            return None
+
+    def _emit_member(self, raw: str, events: List[Event]) -> None:
+        if not raw.strip():
+            return
+        try:
+            member = json.loads("{" + raw + "}")
+        except ValueError:
+            return
+        for key, value in member.items():
+            events.append(("section", key, value))
+
+    def _emit_item(self, raw: str, events: List[Event]) -> None:
+        if not raw.strip():
+            return
+        try:
+            events.append(("item", self._array_key, json.loads(raw)))
+        except ValueError:
+            return
+
+
+def _field_type(model_cls, key: str):
+    field = model_cls.model_fields.get(key)
+    return None if field is None else field.annotation
+
+
+def _validate(annotation, value):
+    try:
+        return TypeAdapter(annotation).validate_python(value)
+    except ValidationError:
+        return _INVALID
+
+
+def validate_section(model_cls, key: str, value: Any) -> Any:
+    """Validate one top-level member against `model_cls`; list members keep their valid items."""
+    if model_cls is None:
+        return value
+    annotation = _field_type(model_cls, key)
+    if annotation is None:
+        return _INVALID
+    if typing.get_origin(annotation) in (list, List) and isinstance(value, list):
+        item_type = typing.get_args(annotation)[0]
+        items = [_validate(item_type, v) for v in value]
+        return [v for v in items if v is not _INVALID]
+    return _validate(annotation, value)
+
+
+def validate_item(model_cls, key: str, value: Any) -> Any:
+    if model_cls is None:
+        return value
+    annotation = _field_type(model_cls, key)
+    if annotation is None or typing.get_origin(annotation) not in (list, List):
+        return _INVALID
+    return _validate(typing.get_args(annotation)[0], value)
+
+
+def collect_sections(
+    chunks: Iterable[str],
+    model_cls: Optional[typing.Type[BaseModel]] = None,
+) -> Tuple[Dict[str, Any], Dict[str, List[Any]]]:
+    """
+    Consume a stream of completion chunks. Returns (complete sections, partial
+    list sections). If the stream breaks after something useful arrived, the
+    error is swallowed and whatever was parsed is returned.
+    """
+    parser = StreamingJSONParser()
+    sections: Dict[str, Any] = {}
+    partial: Dict[str, List[Any]] = {}
+    try:
+        for chunk in chunks:
+            for kind, key, value in parser.feed(chunk):
+                if kind == "item":
+                    item = validate_item(model_cls, key, value)
+                    if item is not _INVALID:
+                        partial.setdefault(key, []).append(item)
+                    continue
+                value = validate_section(model_cls, key, value)
+                if value is _INVALID:
+                    continue
+                sections[key] = value
+                partial.pop(key, None)
+    except Exception as e:
+        if not sections and not partial:
+            raise
+        print("LLM STREAM ERROR", e)
+    return sections, partial
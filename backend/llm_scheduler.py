@@ -0,0 +1,290 @@
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+from langchain_openai import ChatOpenAI
+
+from model_router import ROUTER, estimate_tokens
+from tracing import record_span
+
+# --- Outbound LLM scheduler ---
+# Every chat completion from rag_chain.py goes through `invoke_llm`. Calls are
+# admitted per model against token/request buckets (refilled continuously from
+# the per-minute limits), interactive traffic is admitted before background
+# work, and provider 429s / transient errors are retried with jittered backoff.
+# A call that would wait in the queue longer than its priority's
+# LLM_MAX_WAIT_* budget is turned away at once with LLMRateLimitError
+# (retry_after = the predicted wait), instead of holding its request open.
+# Before any of that, the call is routed (model choice / truncation) by
+# model_router.ROUTER based on its token budget.
+
+INTERACTIVE = 0   # /search, /ask
+BACKGROUND = 1    # /highlights, /dashboard, summaries
+
+DEFAULT_TPM = int(os.getenv("LLM_TPM_LIMIT", "200000"))
+DEFAULT_RPM = int(os.getenv("LLM_RPM_LIMIT", "500"))
+MODEL_LIMITS = {
+    "gpt-4": {"tpm": int(os.getenv("LLM_TPM_LIMIT_GPT4", "10000")), "rpm": DEFAULT_RPM},
+}
+MAX_QUEUE_WAIT = {
+    INTERACTIVE: float(os.getenv("LLM_MAX_WAIT_INTERACTIVE", "20")),
+    BACKGROUND: float(os.getenv("LLM_MAX_WAIT_BACKGROUND", "120")),
+}
+MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 30.0
+
+
+class LLMProviderError(Exception):
+    """A call still failing after all retries; `retry_after` is the last backoff delay."""
+
+    def __init__(self, message: str, retry_after: float = BACKOFF_MAX_SECONDS):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class LLMRateLimitError(LLMProviderError):
+    """The provider kept rate-limiting (429) the call."""
+
+
+class LLMUnavailableError(LLMProviderError):
+    """The provider kept failing (5xx, timeouts, connection errors)."""
+
+
+class TokenBucket:
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.updated = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        return 0.0 if self.tokens >= amount else (amount - self.tokens) / self.rate
+
+
+class _ModelQueue:
+    def __init__(self, tpm: int, rpm: int):
+        self.token_bucket = TokenBucket(tpm)
+        self.request_bucket = TokenBucket(rpm)
+        self.waiting: List = []  # heap of (priority, seq, tokens)
+        self.admitted = 0
+        self.shed = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+
+class LLMScheduler:
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._queues: Dict[str, _ModelQueue] = {}
+        self._seq = itertools.count()
+
+    def _queue(self, model: str) -> _ModelQueue:
+        q = self._queues.get(model)
+        if q is None:
+            limits = MODEL_LIMITS.get(model, {})
+            q = _ModelQueue(limits.get("tpm", DEFAULT_TPM), limits.get("rpm", DEFAULT_RPM))
+            self._queues[model] = q
+        return q
+
+    def acquire(self, model: str, tokens: int, priority: int = INTERACTIVE, max_wait: Optional[float] = None) -> float:
+        """
+        Block until `model` has budget for `tokens`; higher priority (lower number)
+        goes first. Raises LLMRateLimitError as soon as the predicted wait (for this
+        call and everything queued ahead of it) exceeds `max_wait`.
+        """
+        started = time.monotonic()
+        if max_wait is None:
+            max_wait = MAX_QUEUE_WAIT.get(priority, MAX_QUEUE_WAIT[BACKGROUND])
+        deadline = started + max_wait
+        with self._cond:
+            q = self._queue(model)
+            tokens = min(tokens, q.token_bucket.capacity)
+            entry = (priority, next(self._seq), tokens)
+            heapq.heappush(q.waiting, entry)
+            try:
+                while True:
+                    now = time.monotonic()
+                    q.token_bucket.refill(now)
+                    q.request_bucket.refill(now)
+                    ahead = [e for e in q.waiting if e <= entry]
+                    wait = max(q.token_bucket.wait_time(sum(e[2] for e in ahead)),
+                               q.request_bucket.wait_time(len(ahead)))
+                    if q.waiting[0] == entry and wait <= 0:
+                        q.token_bucket.tokens -= tokens
+                        q.request_bucket.tokens -= 1
+                        break
+                    if now + wait > deadline:
+                        q.shed += 1
+                        raise LLMRateLimitError(
+                            f"LLM queue for {model} is {wait:.0f}s deep, over the {max_wait:.0f}s limit",
+                            retry_after=wait,
+                        )
+                    self._cond.wait(timeout=wait if q.waiting[0] == entry else deadline - now)
+            finally:
+                q.waiting.remove(entry)
+                heapq.heapify(q.waiting)
+                self._cond.notify_all()
+            waited = time.monotonic() - started
+            q.admitted += 1
+            q.total_wait += waited
+            q.max_wait = max(q.max_wait, waited)
+            return waited
+
+    def refund(self, model: str, tokens: int) -> None:
+        """Return the unused part of a reservation (max_tokens that were not generated)."""
+        if tokens <= 0:
+            return
+        with self._cond:
+            bucket = self._queue(model).token_bucket
+            bucket.tokens = min(bucket.capacity, bucket.tokens + tokens)
+            self._cond.notify_all()
+
+    def record(self, model: str, retried: bool = False, rate_limited: bool = False) -> None:
+        with self._cond:
+            q = self._queue(model)
+            q.retries += int(retried)
+            q.rate_limited += int(rate_limited)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                model: {
+                    "queue_depth": len(q.waiting),
+                    "admitted": q.admitted,
+                    "avg_wait_s": round(q.total_wait / q.admitted, 3) if q.admitted else 0.0,
+                    "max_wait_s": round(q.max_wait, 3),
+                    "retries": q.retries,
+                    "rate_limited": q.rate_limited,
+                    "shed": q.shed,
+                    "tokens_available": int(q.token_bucket.tokens),
+                }
+                for model, q in self._queues.items()
+            }
+
+
+SCHEDULER = LLMScheduler()
+
+
+def _status(e: Exception) -> Optional[int]:
+    return getattr(e, "status_code", None) or getattr(getattr(e, "response", None), "status_code", None)
+
+
+def _is_rate_limit(e: Exception) -> bool:
+    return _status(e) == 429 or type(e).__name__ == "RateLimitError"
+
+
+def _is_retryable(e: Exception) -> bool:
+    status = _status(e)
+    if status is not None:
+        return status == 429 or status >= 500
+    return type(e).__name__ in ("RateLimitError", "APITimeoutError", "APIConnectionError", "InternalServerError")
+
+
+def _retry_after(e: Exception) -> Optional[float]:
+    headers = getattr(getattr(e, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def _output_tokens(response) -> int:
+    usage = getattr(response, "usage_metadata", None) or {}
+    return usage.get("output_tokens") or estimate_tokens(response.content or "")
+
+
+def invoke_llm(
+    messages: List[Dict[str, str]],
+    model: str = "gpt-4.1-mini",
+    temperature: float = 0.2,
+    max_tokens: int = 1000,
+    priority: int = INTERACTIVE,
+    latency_target: Optional[float] = None,
+):
+    traced_from = time.perf_counter()
+    route = ROUTER.route(messages, model, max_tokens, priority, latency_target)
+    # Retries are handled here, not inside the client
+    llm = ChatOpenAI(model=route.model, temperature=temperature, max_tokens=route.max_tokens, max_retries=0)
+    queued = 0.0
+    for attempt in range(MAX_RETRIES + 1):
+        queued += SCHEDULER.acquire(route.model, route.prompt_tokens + route.max_tokens, priority)
+        try:
+            started = time.monotonic()
+            response = llm.invoke(route.messages)
+            output_tokens = _output_tokens(response)
+            SCHEDULER.refund(route.model, route.max_tokens - output_tokens)
+            ROUTER.record(route, model, time.monotonic() - started, output_tokens)
+            record_span("llm", traced_from, requested=model, model=route.model, action=route.action,
+                        prompt_tokens=route.prompt_tokens, output_tokens=output_tokens,
+                        queue_wait_ms=round(queued * 1000, 1), attempts=attempt + 1)
+            return response
+        except Exception as e:
+            # Nothing was generated; only the prompt stays charged
+            SCHEDULER.refund(route.model, route.max_tokens)
+            _backoff_or_raise(route.model, e, attempt)
+
+
+def stream_llm(
+    messages: List[Dict[str, str]],
+    model: str = "gpt-4.1-mini",
+    temperature: float = 0.2,
+    max_tokens: int = 1000,
+    priority: int = INTERACTIVE,
+    latency_target: Optional[float] = None,
+) -> Iterator[str]:
+    """Like `invoke_llm` but yields content chunks. Only failures before the first chunk are retried."""
+    traced_from = time.perf_counter()
+    route = ROUTER.route(messages, model, max_tokens, priority, latency_target)
+    llm = ChatOpenAI(model=route.model, temperature=temperature, max_tokens=route.max_tokens, max_retries=0)
+    queued = 0.0
+    for attempt in range(MAX_RETRIES + 1):
+        queued += SCHEDULER.acquire(route.model, route.prompt_tokens + route.max_tokens, priority)
+        emitted = False
+        started = time.monotonic()
+        output = []
+        try:
+            for chunk in llm.stream(route.messages):
+                emitted = True
+                output.append(chunk.content)
+                yield chunk.content
+            output_tokens = estimate_tokens("".join(output))
+            SCHEDULER.refund(route.model, route.max_tokens - output_tokens)
+            ROUTER.record(route, model, time.monotonic() - started, output_tokens)
+            # A leaf span: a generator cannot hold the current span open across its yields
+            record_span("llm_stream", traced_from, requested=model, model=route.model, action=route.action,
+                        prompt_tokens=route.prompt_tokens, output_tokens=output_tokens,
+                        queue_wait_ms=round(queued * 1000, 1), attempts=attempt + 1)
+            return
+        except GeneratorExit:
+            # The consumer stopped early (e.g. a client disconnect); the rest of the reservation was never used
+            SCHEDULER.refund(route.model, route.max_tokens - estimate_tokens("".join(output)))
+            raise
+        except Exception as e:
+            SCHEDULER.refund(route.model, route.max_tokens - estimate_tokens("".join(output)))
+            if emitted:
+                raise
+            _backoff_or_raise(route.model, e, attempt)
+
+
+def _backoff_or_raise(model: str, e: Exception, attempt: int) -> None:
+    if not _is_retryable(e):
+        raise e
+    rate_limited = _is_rate_limit(e)
+    SCHEDULER.record(model, retried=attempt < MAX_RETRIES, rate_limited=rate_limited)
+    delay = _retry_after(e) or min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt)
+    if attempt == MAX_RETRIES:
+        if rate_limited:
+            raise LLMRateLimitError(f"LLM provider rate limit for {model}: {e}", retry_after=delay)
+        raise LLMUnavailableError(f"LLM provider unavailable for {model}: {e}", retry_after=delay)
+    time.sleep(delay * random.uniform(0.5, 1.5))
@@ -35,33 +35,10 @@ def load_and_chunk_docs(file_path):
             "source_location": "Text"
         }) for doc in loader.load()]
 
-    elif ext == ".csv":
-        import pandas as pd
-        data = pd.read_csv(file_path)
-        columns = ", ".join(data.columns)
-        preview = data.head(5).to_string(index=False)
-        summary = f"Table columns: {columns}\nPreview (first 5 rows):\n{preview}"
-        docs = [Document(page_content=summary, metadata={
-            "file_type": "csv",
-            "file_name": file_name,
-            "source_location": "main table"
-        })]
-        # One chunk per table (whole file or sheet in xlsx)
-
-    elif ext == ".xlsx":
-        import pandas as pd
-        excel = pd.ExcelFile(file_path)
-        for sheet_name in excel.sheet_names:
-            data = excel.parse(sheet_name)
-            columns = ", ".join(data.columns)
-            preview = data.head(5).to_string(index=False)
-            summary = f"Sheet: {sheet_name}\nTable columns: {columns}\nPreview (first 5 rows):\n{preview}"
-            docs.append(Document(page_content=summary, metadata={
-                "file_type": "xlsx",
-                "file_name": file_name,
-                "source_location": sheet_name
-            }))
-        # One chunk per sheet
+    elif ext in (".csv", ".xlsx"):
+        from tables import read_tabular, table_chunks
+        docs = table_chunks(read_tabular(file_path), file_name, ext[1:])
+        # One chunk per table (whole file or sheet in xlsx); the rows go to the table store at ingest
 
     elif ext in (".ifc", ".bim"):
         try:
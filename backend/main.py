@@ -1,129 +1,425 @@
 
-from fastapi import FastAPI, UploadFile, File, Form
+from fastapi import FastAPI, UploadFile, File, Form, BackgroundTasks, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
+from langchain_core.documents import Document
+import asyncio
 import os
-import uuid
+import json
+import math
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional
 from dotenv import load_dotenv
-from loader import load_and_chunk_docs
-from vectorstore import get_vectorstore, add_documents, similarity_search
-from rag_chain import QuestionRequest, evaluate_scores_with_llm, extract_contract_highlights, generate_report, answer_doc_question, rag_loop
+from vectorstore import get_vectorstore, similarity_search, project_name, metadata_filter, RETRIEVAL_CACHE
+from corpus_state import CORPUS
+from ingest import ingest_file, ingest_archive, save_stream, upload_dir, ArchiveError
+from sessions import SESSIONS, refresh_session_summary
+from singleflight import LLM_SINGLEFLIGHT
+from llm_scheduler import SCHEDULER, LLMProviderError, LLMRateLimitError
+from model_router import ROUTER
+from admission import AdmissionControlMiddleware, admission_stats
+from snapshots import import_snapshot, SnapshotError
+from insights import INSIGHTS_ENABLED, document_insights, merge_highlights, summary_context, insights_stats
+from tables import answer_table_question
+from citations import verify_citations
+from relevance import RELEVANCE_FILTER, RELEVANCE_THRESHOLD, select_relevant, relevance_stats
+from responses import ConditionalGetMiddleware, etag_for, json_response
+from tracing import TRACE_ENDPOINT_ENABLED, TRACES, TracingMiddleware, timeline, traced
+from scenarios import save_baseline, get_baseline, recalc_scores, PINNABLE_PARAMS, SCORE_MIN, SCORE_MAX
+from rag_chain import QuestionRequest, score_with_llm, apply_param_weights, WEIGHTS, extract_contract_highlights, generate_report, answer_doc_question, rag_context, finish_report, rag_batch
 
 
 load_dotenv()
-PROJECT_CHUNKS = []
 
-app = FastAPI()
+# Seed a fresh instance from an index snapshot (see snapshots.py) instead of re-ingesting
+INDEX_SNAPSHOT = os.getenv("INDEX_SNAPSHOT")
+
+# Settings that change /highlights and /dashboard output for the same corpus; part of their ETags
+RESULT_CONFIG = (INSIGHTS_ENABLED, RELEVANCE_FILTER, RELEVANCE_THRESHOLD, tuple(sorted(WEIGHTS.items())))
+
+def highlights_etag(project: str, file_name: Optional[str], corpus_version: int) -> str:
+    return etag_for("highlights", project, file_name, corpus_version, RESULT_CONFIG)
+
+def dashboard_etag(mode: str, project: str, file_name: Optional[str], corpus_version: int) -> str:
+    return etag_for("dashboard", mode, project, file_name, corpus_version, RESULT_CONFIG)
+
+def _current_etag(params: Dict[str, str], endpoint: str) -> str:
+    # Same tag the endpoint would send for the corpus as it is now; ValueError on a bad project name
+    project = project_name(params.get("project"))
+    if endpoint == "highlights":
+        return highlights_etag(project, params.get("file_name"), CORPUS.version(project))
+    return dashboard_etag(params.get("mode", "ai"), project, params.get("file_name"), CORPUS.version(project))
+
+@asynccontextmanager
+async def lifespan(app):
+    if INDEX_SNAPSHOT:
+        try:
+            result = await run_in_threadpool(import_snapshot, INDEX_SNAPSHOT, os.getenv("INDEX_SNAPSHOT_PROJECT"))
+            print("Loaded index snapshot", result)
+        except SnapshotError as e:
+            print("INDEX SNAPSHOT SKIPPED", e)
+    yield
+
+app = FastAPI(lifespan=lifespan)
+# Added before CORS so rejections still carry CORS headers
+app.add_middleware(AdmissionControlMiddleware)
+# Revalidations of unchanged results are answered without an admission slot
+app.add_middleware(ConditionalGetMiddleware, etags={
+    "/highlights": lambda params: _current_etag(params, "highlights"),
+    "/dashboard": lambda params: _current_etag(params, "dashboard"),
+})
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Request-ID"],
 )
+# Outermost, so a trace also covers admission queueing (opt-in, see tracing.py)
+app.add_middleware(TracingMiddleware)
+
+def provider_error_response(e: LLMProviderError):
+    # Throttling is the client's to back off from (429); an outage upstream is not (503)
+    if isinstance(e, LLMRateLimitError):
+        message, status_code = "LLM provider rate limit reached, retry later.", 429
+    else:
+        message, status_code = "LLM provider unavailable, retry later.", 503
+    return JSONResponse(
+        {"error": message, "detail": str(e)},
+        status_code=status_code,
+        headers={"Retry-After": str(math.ceil(e.retry_after))}
+    )
+
+def bad_project_response(e: ValueError):
+    return JSONResponse({"error": f"Invalid project: {str(e)}"}, status_code=400)
+
+def has_matching_document(project, file_name=None, file_type=None):
+    return any(
+        (not file_name or m["file_name"] == file_name) and (not file_type or m["file_type"] == file_type)
+        for m in CORPUS.manifests(project)
+    )
+
+@traced()
+def table_context(question, project, file_name=None, file_type=None):
+    """Exact figures from uploaded spreadsheets for the question, or None; never fails the request."""
+    if file_type and file_type not in ("csv", "xlsx"):
+        return None
+    try:
+        return answer_table_question(question, project, file_name)
+    except Exception as e:
+        print("TABLE QUERY ERROR", e)
+        return None
+
+def select_chunks(chunks, file_name=None):
+    if not file_name:
+        return chunks
+    return chunks.where("file_name", file_name)
 
 class QuestionInput(BaseModel):
     question: str
+    project: Optional[str] = None
+    file_name: Optional[str] = None
+    file_type: Optional[str] = None
+
+class RecalcInput(BaseModel):
+    values: Dict[str, float]
+    project: Optional[str] = None
+    file_name: Optional[str] = None
+
+class BatchQuestionInput(BaseModel):
+    questions: List[str]
+    max_concurrency: int = 4
+    project: Optional[str] = None
+    file_name: Optional[str] = None
+    file_type: Optional[str] = None
+
+MAX_BATCH_SCENARIOS = 50
 
 @app.post("/search")
 async def search_contract(input: QuestionInput):
     import traceback
     question = input.question
-    if not PROJECT_CHUNKS:
+    try:
+        project = project_name(input.project)
+    except ValueError as e:
+        return bad_project_response(e)
+    if not has_matching_document(project, input.file_name, input.file_type):
         return JSONResponse({"error": "No documents found in database."}, status_code=404)
     try:
-        from langchain_community.vectorstores import Chroma
-        from langchain_openai import OpenAIEmbeddings
-        assert hasattr(PROJECT_CHUNKS[0], "page_content"), "Chunk missing page_content"
-        embeddings = OpenAIEmbeddings()
-        chroma_vs = Chroma.from_documents(PROJECT_CHUNKS, embeddings)
-        top_chunks = chroma_vs.similarity_search(question, k=min(6, len(PROJECT_CHUNKS)))
+        # Only the project's own collection is searched, narrowed by the optional file filters
+        vectordb = get_vectorstore(project=project)
+        # Spreadsheet aggregates are computed alongside the vector search
+        top_chunks, table_result = await asyncio.gather(
+            run_in_threadpool(
+                similarity_search, question, vectordb, k=6, filter=metadata_filter(input.file_name, input.file_type)
+            ),
+            run_in_threadpool(table_context, question, project, input.file_name, input.file_type),
+        )
     except Exception as e:
         print("VECTORSTORE ERROR", traceback.format_exc())
         return JSONResponse({"error": "Vector search failed", "detail": str(e)}, status_code=500)
+    if table_result:
+        top_chunks = [Document(page_content=table_result)] + list(top_chunks)
     try:
-        answer, _ = answer_doc_question(question, top_chunks)
+        answer, _ = await run_in_threadpool(answer_doc_question, question, top_chunks)
+    except LLMProviderError as e:
+        return provider_error_response(e)
     except Exception as e:
         print("LLM ERROR", traceback.format_exc())
         return JSONResponse({"error": "LLM QA failed", "detail": str(e)}, status_code=500)
-    answer, _ = answer_doc_question(question, top_chunks)
     import json
     try:
         answer_json = json.loads(answer)
-        return JSONResponse(answer_json)
     except Exception:
         return JSONResponse({"answer": answer})
+    if isinstance(answer_json, dict):
+        # Every quote is checked against the context chunks it was given, in one pass over them
+        answer_json = await run_in_threadpool(verify_citations, answer_json, [chunk.page_content for chunk in top_chunks])
+    return JSONResponse(answer_json)
 
 
 @app.post("/upload")
-async def upload_project_file(file: UploadFile = File(...)):
-    try:
-        os.makedirs("./backend/uploads", exist_ok=True)
-        file_path = f"./backend/uploads/{file.filename}"
-        with open(file_path, "wb") as f:
-            f.write(await file.read())
-        chunks = load_and_chunk_docs(file_path)
-        vectordb = get_vectorstore()
-        add_documents(chunks, vectordb)
-        PROJECT_CHUNKS.extend(chunks)
-        doc_id = str(uuid.uuid4())
+async def upload_project_file(file: UploadFile = File(...), project: Optional[str] = Form(None)):
+    try:
+        project = project_name(project)
+    except ValueError as e:
+        return bad_project_response(e)
+    try:
+        file_name = os.path.basename(file.filename)
+        file_path = os.path.join(upload_dir(project), file_name)
+        # Copied to disk in blocks; parsing and embedding are blocking, keep them off the event loop
+        await run_in_threadpool(save_stream, file.file, file_path)
+        result = await run_in_threadpool(ingest_file, file_path, file_name, project)
         return {
-            "msg": f"File {file.filename} uploaded and indexed.",
-            "doc_id": doc_id
+            "msg": f"File {file_name} already indexed (same content)." if result["duplicate"] else f"File {file_name} uploaded and indexed.",
+            "doc_id": result["doc_id"],
+            "duplicate": result["duplicate"],
+            "project": project
         }
     except Exception as e:
         return JSONResponse({"error": f"Upload failed: {str(e)}"}, status_code=500)
 
+@app.post("/upload/archive")
+async def upload_project_archive(file: UploadFile = File(...), project: Optional[str] = Form(None)):
+    try:
+        project = project_name(project)
+    except ValueError as e:
+        return bad_project_response(e)
+    archive_name = os.path.basename(file.filename)
+    if not archive_name.lower().endswith(".zip"):
+        return JSONResponse({"error": "Only .zip archives are supported."}, status_code=400)
+    archive_path = os.path.join(upload_dir(project), archive_name)
+    try:
+        await run_in_threadpool(save_stream, file.file, archive_path)
+        report = await run_in_threadpool(ingest_archive, archive_path, project)
+        report["archive"] = archive_name
+        return report
+    except ArchiveError as e:
+        return JSONResponse({"error": f"Archive rejected: {str(e)}"}, status_code=400)
+    except Exception as e:
+        return JSONResponse({"error": f"Archive upload failed: {str(e)}"}, status_code=500)
+    finally:
+        # Members are extracted next to it; the archive itself is not needed afterwards
+        if os.path.exists(archive_path):
+            os.remove(archive_path)
+
+@traced()
+def compute_highlights(chunks, project):
+    if INSIGHTS_ENABLED:
+        # Merge per-document results; only documents without insights cost LLM work
+        return merge_highlights(document_insights(project, chunks))
+    # Only chunks that can carry obligations, deadlines, payments or risks are sent
+    return extract_contract_highlights(select_relevant(chunks).texts()).dict()
+
+@traced()
+def compute_dashboard(chunks, mode, project, file_name, corpus_version):
+    if mode == "ai":
+        if INSIGHTS_ENABLED:
+            # Score over one summary per document instead of every chunk
+            chunks = summary_context(document_insights(project, chunks))
+        else:
+            chunks = select_relevant(chunks)
+        raw_scores, strength, weakness, next_steps = score_with_llm(chunks)
+        scores, final_score = apply_param_weights(raw_scores)
+        # Baseline for /dashboard/recalc, valid until the corpus changes
+        save_baseline(project, file_name, corpus_version, raw_scores)
+    else:
+        scores = {}
+        final_score = 0
+        strength = {"what": "", "why": ""}
+        weakness = {"what": "", "why": ""}
+        next_steps = []
+    return {
+        "scores": scores,
+        "final_score": final_score,
+        "strength": strength.dict() if hasattr(strength, "dict") else strength,
+        "weakness": weakness.dict() if hasattr(weakness, "dict") else weakness,
+        "next_steps": [ns.dict() if hasattr(ns, "dict") else ns for ns in next_steps],
+        "parameters": dict(WEIGHTS)
+    }
+
 @app.get("/highlights")
-async def get_highlights():
-    if not PROJECT_CHUNKS:
+async def get_highlights(request: Request, project: Optional[str] = None, file_name: Optional[str] = None):
+    try:
+        project = project_name(project)
+    except ValueError as e:
+        return bad_project_response(e)
+    # If-None-Match with the current tag was already answered by ConditionalGetMiddleware
+    corpus_version, project_chunks = CORPUS.snapshot(project)
+    project_chunks = select_chunks(project_chunks, file_name)
+    if not project_chunks:
         return JSONResponse({"error": "No documents found"}, status_code=404)
     try:
-        full_text = "\n\n".join(chunk.page_content for chunk in PROJECT_CHUNKS)
-        highlights = extract_contract_highlights(full_text)
-        return JSONResponse(highlights.dict())
+        # Identical concurrent requests on the same corpus share one LLM evaluation
+        key = ("highlights", project, file_name, corpus_version)
+        highlights = await LLM_SINGLEFLIGHT.do(key, compute_highlights, project_chunks, project)
+        etag = highlights_etag(project, file_name, corpus_version)
+        return await run_in_threadpool(json_response, request, highlights, etag)
+    except LLMProviderError as e:
+        return provider_error_response(e)
     except Exception as e:
         return JSONResponse({"error": f"Highlights error: {str(e)}"}, status_code=500)
 
 @app.get("/dashboard")
-async def get_dashboard(mode: str = "ai"):
-    if not PROJECT_CHUNKS:
+async def get_dashboard(request: Request, mode: str = "ai", project: Optional[str] = None, file_name: Optional[str] = None):
+    try:
+        project = project_name(project)
+    except ValueError as e:
+        return bad_project_response(e)
+    corpus_version, project_chunks = CORPUS.snapshot(project)
+    project_chunks = select_chunks(project_chunks, file_name)
+    if not project_chunks:
         return JSONResponse({"error": "No documents to score."}, status_code=404)
     try:
-        if mode == "ai":
-            # Unpack all five outputs as per your new rag_chain.py
-            scores, final_score, strength, weakness, next_steps = evaluate_scores_with_llm(PROJECT_CHUNKS)
-        else:
-            scores = {}
-            final_score = 0
-            strength = {"what": "", "why": ""}
-            weakness = {"what": "", "why": ""}
-            next_steps = []
-        return JSONResponse({
-            "scores": scores,
-            "final_score": final_score,
-            "strength": strength.dict() if hasattr(strength, "dict") else strength,
-            "weakness": weakness.dict() if hasattr(weakness, "dict") else weakness,
-            "next_steps": [ns.dict() if hasattr(ns, "dict") else ns for ns in next_steps],
-            "parameters": {"cost": 0.3, "timeline": 0.2, "compliance": 0.2, "design": 0.1, "sustainability": 0.2}
-        })
+        key = ("dashboard", mode, project, file_name, corpus_version)
+        dashboard = await LLM_SINGLEFLIGHT.do(key, compute_dashboard, project_chunks, mode, project, file_name, corpus_version)
+        etag = dashboard_etag(mode, project, file_name, corpus_version)
+        return await run_in_threadpool(json_response, request, dashboard, etag)
+    except LLMProviderError as e:
+        return provider_error_response(e)
     except Exception as e:
         return JSONResponse({"error": f"Dashboard error: {str(e)}"}, status_code=500)
 
 
 
+@app.post("/dashboard/recalc")
+async def recalc_dashboard(input: RecalcInput):
+    started = time.perf_counter()
+    try:
+        project = project_name(input.project)
+    except ValueError as e:
+        return bad_project_response(e)
+    corpus_version = CORPUS.version(project)
+    raw_scores = get_baseline(project, input.file_name, corpus_version)
+    if raw_scores is None:
+        return JSONResponse({"error": "No baseline scores for the current documents; load /dashboard?mode=ai first."}, status_code=409)
+    unknown = [p for p in input.values if p not in PINNABLE_PARAMS]
+    if unknown:
+        return JSONResponse({"error": f"Unknown parameters: {', '.join(unknown)}"}, status_code=400)
+    if any(not SCORE_MIN <= v <= SCORE_MAX for v in input.values.values()):
+        return JSONResponse({"error": f"Scores must be between {SCORE_MIN} and {SCORE_MAX}."}, status_code=400)
+    result = recalc_scores(raw_scores, input.values)
+    result["corpus_version"] = corpus_version
+    result["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 3)
+    return result
+
+
 @app.post("/ask")
 
-async def ask_whatif(question: str = Form(...)):
+async def ask_whatif(
+    background_tasks: BackgroundTasks,
+    question: str = Form(...),
+    session_id: Optional[str] = Form(None),
+    project: Optional[str] = Form(None),
+    file_name: Optional[str] = Form(None),
+    file_type: Optional[str] = Form(None)
+):
+    try:
+        project = project_name(project)
+    except ValueError as e:
+        return bad_project_response(e)
     try:
-        vectordb = get_vectorstore()
-        report = rag_loop(question, vectordb)
+        session = SESSIONS.get(session_id)
+        vectordb = get_vectorstore(project=project)
+        # Spreadsheet aggregates are planned alongside retrieval, not before it
+        (context, chat_summary), table_result = await asyncio.gather(
+            # Summary is refreshed after the response is sent, never on the request path
+            run_in_threadpool(
+                rag_context, question, vectordb, chat_summary=session.context(), pipelined=True,
+                search_filter=metadata_filter(file_name, file_type)
+            ),
+            run_in_threadpool(table_context, question, project, file_name, file_type),
+        )
+        report = await run_in_threadpool(
+            finish_report, question, context, chat_summary, [table_result] if table_result else None
+        )
+        session.add_turn(question, str(report.get("answer") or json.dumps(report))[:2000])
+        background_tasks.add_task(refresh_session_summary, session)
+        report["session_id"] = session.session_id
         return report
+    except LLMProviderError as e:
+        return provider_error_response(e)
     except Exception as e:
         return {"error": str(e)}
 
 
+@app.post("/ask/batch")
+async def ask_whatif_batch(input: BatchQuestionInput):
+    questions = [q for q in input.questions if q.strip()]
+    if not questions:
+        return JSONResponse({"error": "No questions provided."}, status_code=400)
+    if len(questions) > MAX_BATCH_SCENARIOS:
+        return JSONResponse({"error": f"At most {MAX_BATCH_SCENARIOS} scenarios per batch."}, status_code=400)
+    try:
+        project = project_name(input.project)
+    except ValueError as e:
+        return bad_project_response(e)
+    try:
+        vectordb = get_vectorstore(project=project)
+        # Long-running; keep it off the event loop
+        return await run_in_threadpool(
+            rag_batch, questions, vectordb, max_concurrency=min(max(input.max_concurrency, 1), 8),
+            search_filter=metadata_filter(input.file_name, input.file_type)
+        )
+    except LLMProviderError as e:
+        return provider_error_response(e)
+    except Exception as e:
+        return JSONResponse({"error": f"Batch error: {str(e)}"}, status_code=500)
+
+
+
+@app.get("/stats")
+async def stats():
+    return {
+        "corpus_version": CORPUS.version(),
+        "projects": {
+            project: {"version": CORPUS.version(project), "chunks": len(CORPUS.chunks(project))}
+            for project in CORPUS.projects()
+        },
+        "documents": len(CORPUS.manifests()),
+        "singleflight": LLM_SINGLEFLIGHT.stats(),
+        "llm_scheduler": SCHEDULER.stats(),
+        "llm_routing": ROUTER.stats(),
+        "admission": admission_stats(),
+        "insights": insights_stats(),
+        "retrieval_cache": RETRIEVAL_CACHE.stats(),
+        "relevance_filter": relevance_stats(),
+    }
+
+
+if TRACE_ENDPOINT_ENABLED:
+    @app.get("/debug/trace/{request_id}")
+    async def debug_trace(request_id: str):
+        """Span timeline of a traced request (see the X-Request-ID response header)."""
+        record = await run_in_threadpool(TRACES.get, request_id)
+        if record is None:
+            return JSONResponse({"error": f"No trace for request {request_id}"}, status_code=404)
+        return timeline(record)
+
 
 @app.get("/about")
 async def about():
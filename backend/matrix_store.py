@@ -0,0 +1,274 @@
+import json
+import os
+import threading
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, run a single worker there
+    fcntl = None
+
+import numpy as np
+from langchain_core.documents import Document
+
+# --- Memory-mapped exact vector store ---
+# Drop-in alternative to Chroma for corpora up to a few hundred thousand
+# chunks. Embeddings are L2-normalized and appended to a flat float16 (or
+# int8 + per-row scale) file that is memory-mapped for search; top-k is an
+# exact blocked matmul + argpartition. Metadata filters use an in-memory
+# inverted index over metadata values. The store is append-only.
+# Several worker processes can share one directory: appends hold an
+# exclusive fcntl lock on the directory's lock file, and info.json (replaced
+# atomically, last) holds the committed row count. Every process picks up
+# rows appended by others when info.json changes, before reading or writing,
+# the way corpus_state reloads on a version change. Bytes past the committed
+# count (an interrupted append) are cut off by the next writer.
+
+SEARCH_BLOCK_ROWS = 8192
+
+
+class MatrixVectorStore:
+    def __init__(self, embedding_function, persist_directory: str, dtype: str = "float16"):
+        if dtype not in ("float16", "int8"):
+            raise ValueError(f"Unsupported matrix dtype: {dtype}")
+        self.embeddings = embedding_function
+        self.persist_directory = persist_directory
+        self.dtype = dtype
+        os.makedirs(persist_directory, exist_ok=True)
+        self._vectors_path = os.path.join(persist_directory, f"vectors.{dtype}")
+        self._scales_path = os.path.join(persist_directory, "scales.f32")
+        self._meta_path = os.path.join(persist_directory, "meta.jsonl")
+        self._info_path = os.path.join(persist_directory, "info.json")
+        self._lock_path = os.path.join(persist_directory, "append.lock")
+        self._lock = threading.Lock()
+        self.dim: Optional[int] = None
+        self.count = 0
+        self._meta_offset = 0  # bytes of meta.jsonl covering the loaded rows
+        self._info_stamp = None  # stat of info.json when last loaded
+        self._ids: List[str] = []
+        self._row_by_id: Dict[str, int] = {}
+        self._texts: List[str] = []
+        self._metadatas: List[Dict[str, Any]] = []
+        self._postings: Dict[Tuple[str, Any], List[int]] = {}
+        self._matrix = None
+        self._scales = None
+        self._load()
+
+    # --- persistence ---
+
+    def _load(self) -> None:
+        with self._lock:
+            self._catch_up()
+
+    @contextmanager
+    def _exclusive(self):
+        """Thread lock plus an exclusive lock on the directory, held across other processes too."""
+        with self._lock, open(self._lock_path, "a+b") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _stamp(self):
+        try:
+            st = os.stat(self._info_path)
+        except FileNotFoundError:
+            return None
+        return st.st_ino, st.st_mtime_ns, st.st_size
+
+    def _sync(self) -> None:
+        """Load rows other processes appended since the last look (one stat call when nothing changed)."""
+        if self._stamp() != self._info_stamp:
+            with self._lock:
+                self._catch_up()
+
+    def _catch_up(self) -> None:
+        # Caller holds self._lock. Only rows below the committed count are read, never a half-written tail
+        stamp = self._stamp()
+        if stamp is None:
+            return
+        with open(self._info_path) as f:
+            info = json.load(f)
+        if info.get("dtype") != self.dtype:
+            raise RuntimeError(f"Matrix store at {self.persist_directory} uses {info.get('dtype')}, not {self.dtype}")
+        self.dim = info["dim"]
+        if info["count"] > self.count:
+            with open(self._meta_path, "rb") as f:
+                f.seek(self._meta_offset)
+                while self.count < info["count"]:
+                    line = f.readline()
+                    row = json.loads(line)
+                    self._register(row["id"], row["text"], row["metadata"])
+                    self._meta_offset += len(line)
+                    self.count += 1
+            self._remap()
+        self._info_stamp = stamp
+
+    def _truncate_uncommitted(self) -> None:
+        # Caller holds the exclusive lock. An interrupted append can leave bytes past the committed rows
+        itemsize = 2 if self.dtype == "float16" else 1
+        for path, size in ((self._vectors_path, self.count * (self.dim or 0) * itemsize),
+                           (self._scales_path, self.count * 4),
+                           (self._meta_path, self._meta_offset)):
+            if os.path.exists(path) and os.path.getsize(path) > size:
+                os.truncate(path, size)
+
+    def _remap(self) -> None:
+        if not self.count:
+            self._matrix = self._scales = None
+            return
+        np_dtype = np.float16 if self.dtype == "float16" else np.int8
+        self._matrix = np.memmap(self._vectors_path, dtype=np_dtype, mode="r", shape=(self.count, self.dim))
+        if self.dtype == "int8":
+            self._scales = np.memmap(self._scales_path, dtype=np.float32, mode="r", shape=(self.count,))
+
+    def _register(self, doc_id: str, text: str, metadata: Dict[str, Any]) -> None:
+        row = len(self._ids)
+        self._ids.append(doc_id)
+        self._row_by_id[doc_id] = row
+        self._texts.append(text)
+        self._metadatas.append(metadata)
+        for key, value in metadata.items():
+            if isinstance(value, (str, int, float, bool)):
+                self._postings.setdefault((key, value), []).append(row)
+
+    # --- writes ---
+
+    def add_documents(self, documents: List[Document], ids: Optional[List[str]] = None) -> List[str]:
+        texts = [d.page_content for d in documents]
+        vectors = self.embeddings.embed_documents(texts)
+        return self.add_embeddings(texts, vectors, [dict(d.metadata or {}) for d in documents], ids)
+
+    def add_texts(self, texts: List[str], metadatas: Optional[List[dict]] = None, ids: Optional[List[str]] = None, **kwargs) -> List[str]:
+        vectors = self.embeddings.embed_documents(list(texts))
+        return self.add_embeddings(list(texts), vectors, metadatas, ids)
+
+    def add_embeddings(self, texts: List[str], embeddings, metadatas: Optional[List[dict]] = None, ids: Optional[List[str]] = None) -> List[str]:
+        if not len(texts):
+            return []
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix = matrix / np.where(norms == 0, 1, norms)
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [str(uuid.uuid4()) for _ in texts]
+        with self._exclusive():
+            self._catch_up()
+            if self.dim is None:
+                self.dim = matrix.shape[1]
+            elif matrix.shape[1] != self.dim:
+                raise ValueError(f"Embedding dimension {matrix.shape[1]} does not match store dimension {self.dim}")
+            self._truncate_uncommitted()
+            with open(self._vectors_path, "ab") as f:
+                if self.dtype == "float16":
+                    f.write(matrix.astype(np.float16).tobytes())
+                else:
+                    scales = np.abs(matrix).max(axis=1) / 127.0
+                    scales[scales == 0] = 1.0
+                    f.write(np.round(matrix / scales[:, None]).astype(np.int8).tobytes())
+                    with open(self._scales_path, "ab") as sf:
+                        sf.write(scales.astype(np.float32).tobytes())
+            lines = [(json.dumps({"id": doc_id, "text": text, "metadata": metadata}) + "\n").encode("utf-8")
+                     for doc_id, text, metadata in zip(ids, texts, metadatas)]
+            with open(self._meta_path, "ab") as f:
+                f.write(b"".join(lines))
+            # Commit point: the new count becomes visible to every process at once
+            tmp = self._info_path + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump({"dim": self.dim, "dtype": self.dtype, "count": self.count + len(texts)}, f)
+            os.replace(tmp, self._info_path)
+            for doc_id, text, metadata in zip(ids, texts, metadatas):
+                self._register(doc_id, text, metadata)
+            self.count += len(texts)
+            self._meta_offset += sum(len(line) for line in lines)
+            self._info_stamp = self._stamp()
+            self._remap()
+        return ids
+
+    # --- reads ---
+
+    def contains(self, ids: List[str]) -> set:
+        self._sync()
+        known = self._row_by_id
+        return {doc_id for doc_id in ids if doc_id in known}
+
+    def _document(self, row: int) -> Document:
+        return Document(page_content=self._texts[row], metadata=dict(self._metadatas[row], id=self._ids[row]))
+
+    def get_by_ids(self, ids: List[str]) -> List[Document]:
+        """Documents for the given ids, in that order; unknown ids are skipped."""
+        self._sync()
+        rows = [self._row_by_id.get(doc_id) for doc_id in ids]
+        return [self._document(row) for row in rows if row is not None and row < self.count]
+
+    def export_rows(self, start: int = 0, stop: Optional[int] = None) -> Tuple[List[str], List[str], List[Dict[str, Any]], np.ndarray]:
+        """(ids, texts, metadatas, float32 vectors) for rows [start, stop), for snapshot export."""
+        self._sync()
+        count, matrix, scales = self.count, self._matrix, self._scales
+        stop = count if stop is None else min(stop, count)
+        if start >= stop:
+            return [], [], [], np.empty((0, self.dim or 0), dtype=np.float32)
+        vectors = np.asarray(matrix[start:stop], dtype=np.float32)
+        if scales is not None:
+            vectors = vectors * np.asarray(scales[start:stop])[:, None]
+        return self._ids[start:stop], self._texts[start:stop], self._metadatas[start:stop], vectors
+
+    def _filter_rows(self, filter: Optional[Dict[str, Any]]) -> Optional[np.ndarray]:
+        """Row indices matching a Chroma-style filter ({k: v}, {k: {"$in": [...]}}, {"$and": [...]})."""
+        if not filter:
+            return None
+        clauses = filter["$and"] if "$and" in filter else [{k: v} for k, v in filter.items()]
+        rows = None
+        for clause in clauses:
+            for key, cond in clause.items():
+                values = cond["$in"] if isinstance(cond, dict) and "$in" in cond else [cond.get("$eq") if isinstance(cond, dict) else cond]
+                matched = set()
+                for value in values:
+                    matched.update(self._postings.get((key, value), ()))
+                rows = matched if rows is None else rows & matched
+        return np.fromiter(sorted(rows or ()), dtype=np.int64)
+
+    def _scores(self, matrix, query: np.ndarray, scales=None) -> np.ndarray:
+        scores = np.empty(matrix.shape[0], dtype=np.float32)
+        for start in range(0, matrix.shape[0], SEARCH_BLOCK_ROWS):
+            block = np.asarray(matrix[start:start + SEARCH_BLOCK_ROWS], dtype=np.float32)
+            scores[start:start + len(block)] = block @ query
+        if scales is not None:
+            scores *= scales
+        return scores
+
+    def similarity_search_with_score_by_vector(self, embedding, k: int = 4, filter: Optional[Dict[str, Any]] = None) -> List[Tuple[Document, float]]:
+        self._sync()
+        count, matrix, scales = self.count, self._matrix, self._scales
+        if not count:
+            return []
+        query = np.asarray(embedding, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        rows = self._filter_rows(filter)
+        if rows is not None:
+            if not len(rows):
+                return []
+            scores = self._scores(matrix[rows], query, None if scales is None else scales[rows])
+        else:
+            scores = self._scores(matrix, query, scales)
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        results = []
+        for i in top:
+            row = int(rows[i]) if rows is not None else int(i)
+            results.append((self._document(row), float(scores[i])))
+        return results
+
+    def similarity_search_by_vector(self, embedding, k: int = 4, filter: Optional[Dict[str, Any]] = None, **kwargs) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k=k, filter=filter)]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, filter: Optional[Dict[str, Any]] = None, **kwargs) -> List[Tuple[Document, float]]:
+        return self.similarity_search_with_score_by_vector(self.embeddings.embed_query(query), k=k, filter=filter)
+
+    def similarity_search(self, query: str, k: int = 4, filter: Optional[Dict[str, Any]] = None, **kwargs) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k=k, filter=filter)]
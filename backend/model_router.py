@@ -0,0 +1,240 @@
+import logging
+import os
+import re
+import threading
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional
+
+# --- Token-budget model routing ---
+# Every call through llm_scheduler is routed before it is sent: the prompt is
+# measured locally. A prompt that does not fit the requested model goes to a
+# larger-context model of the same or better quality, and one that fits
+# nowhere is truncated, never sent just to fail. Short lookups, and calls the
+# requested model would answer past their latency target, go to the fastest
+# model of the same or better quality; with LLM_ROUTING=1 that model may also
+# be a quality level down.
+# Measured latencies feed back into the per-model latency estimates; each
+# decision is logged at DEBUG on the "model_router" logger.
+
+logger = logging.getLogger(__name__)
+
+# Opt-in: without it the requested model is only ever replaced by one of the same or better quality
+ROUTING_ENABLED = os.getenv("LLM_ROUTING", "0") == "1"
+# Cap for prompts built to "as much context as fits" (highlights parts, scoring context)
+MAX_PROMPT_TOKENS = int(os.getenv("LLM_MAX_PROMPT_TOKENS", "24000"))
+SHORT_PROMPT_TOKENS = int(os.getenv("LLM_SHORT_PROMPT_TOKENS", "2000"))
+SHORT_OUTPUT_TOKENS = int(os.getenv("LLM_SHORT_OUTPUT_TOKENS", "800"))
+# Seconds; None means no target. Interactive = /search, /ask
+LATENCY_TARGETS = {0: float(os.getenv("LLM_LATENCY_TARGET_INTERACTIVE", "20")), 1: None}
+LATENCY_EWMA_ALPHA = 0.2
+
+
+class ModelSpec(NamedTuple):
+    name: str
+    quality: int            # higher is better
+    context_window: int     # prompt + completion tokens
+    max_output: int
+    base_latency_s: float   # initial estimates; refined from measured calls
+    output_tokens_per_s: float
+
+
+MODEL_LADDER = [
+    ModelSpec("gpt-4.1-nano", 1, 1_047_576, 32_768, 0.4, 180.0),
+    ModelSpec("gpt-4.1-mini", 2, 1_047_576, 32_768, 0.6, 110.0),
+    ModelSpec("gpt-4.1", 3, 1_047_576, 32_768, 0.9, 60.0),
+    ModelSpec("gpt-4", 3, 8_192, 8_192, 1.2, 25.0),
+]
+MODELS = {spec.name: spec for spec in MODEL_LADDER}
+# A short lookup may drop this many quality levels to reach a faster model
+SHORT_LOOKUP_QUALITY_DROP = 1
+TRUNCATION_MARKER = "\n[... truncated to fit the model context ...]\n"
+
+
+# --- Token estimation ---
+
+_encoding = None
+_encoding_failed = False
+_encoding_lock = threading.Lock()
+
+
+def _get_encoding():
+    global _encoding, _encoding_failed
+    if _encoding is None and not _encoding_failed:
+        with _encoding_lock:
+            if _encoding is None and not _encoding_failed:
+                try:
+                    import tiktoken
+                    _encoding = tiktoken.get_encoding("o200k_base")
+                except Exception as e:
+                    # tiktoken fetches its BPE file on first use; offline hosts fall back to the heuristic
+                    print("TOKENIZER UNAVAILABLE, using heuristic:", e)
+                    _encoding_failed = True
+    return _encoding
+
+
+def estimate_tokens(text: str) -> int:
+    encoding = _get_encoding()
+    if encoding is not None:
+        return max(1, len(encoding.encode(text, disallowed_special=())))
+    # Words plus punctuation, with long words costing more; within ~10% of BPE on English prose
+    pieces = re.findall(r"\w+|[^\w\s]", text)
+    return max(1, sum(1 + len(p) // 8 for p in pieces), len(text) // 4)
+
+
+def prompt_tokens(messages: List[Dict[str, str]]) -> int:
+    # ~4 tokens of chat framing per message
+    return sum(estimate_tokens(m["content"]) + 4 for m in messages)
+
+
+# --- Routing ---
+
+class RouteDecision(NamedTuple):
+    model: str
+    messages: List[Dict[str, str]]
+    max_tokens: int
+    prompt_tokens: int
+    action: str      # kept | fast | latency | context | truncated
+    reason: str
+
+
+class ModelRouter:
+    def __init__(self, ladder: List[ModelSpec] = MODEL_LADDER):
+        self.ladder = ladder
+        self._lock = threading.Lock()
+        # model -> [base latency s, output tokens per s] (EWMA of measured calls)
+        self._latency = {spec.name: [spec.base_latency_s, spec.output_tokens_per_s] for spec in ladder}
+        self._stats: Dict[str, Dict[str, Any]] = {}
+
+    def predicted_latency(self, model: str, output_tokens: int) -> float:
+        base, rate = self._latency.get(model, (1.0, 50.0))
+        return base + output_tokens / rate
+
+    def _fits(self, spec: ModelSpec, tokens: int, max_tokens: int) -> bool:
+        return tokens + min(max_tokens, spec.max_output) <= spec.context_window
+
+    def max_prompt_tokens(self, max_tokens: int = 0) -> int:
+        """Largest prompt to build: MAX_PROMPT_TOKENS, or less if no model takes that alongside `max_tokens` of output."""
+        fits = max(spec.context_window - min(max_tokens, spec.max_output) for spec in self.ladder)
+        return min(fits, MAX_PROMPT_TOKENS)
+
+    def route(
+        self,
+        messages: List[Dict[str, str]],
+        model: str,
+        max_tokens: int,
+        priority: int = 0,
+        latency_target: Optional[float] = None,
+    ) -> RouteDecision:
+        tokens = prompt_tokens(messages)
+        requested = MODELS.get(model)
+        if requested is None:
+            return RouteDecision(model, messages, max_tokens, tokens, "kept", "unknown model")
+        if latency_target is None:
+            latency_target = LATENCY_TARGETS.get(priority)
+
+        # Candidates of acceptable quality that can hold the whole prompt, fastest first
+        def fastest(min_quality: int) -> List[ModelSpec]:
+            fitting = [s for s in self.ladder if s.quality >= min_quality and self._fits(s, tokens, max_tokens)]
+            return sorted(fitting, key=lambda s: (self.predicted_latency(s.name, max_tokens), -s.quality))
+
+        # Lowering quality for speed is opt-in; a faster model of the same quality is always fine
+        min_quality = requested.quality - (SHORT_LOOKUP_QUALITY_DROP if ROUTING_ENABLED else 0)
+        if tokens <= SHORT_PROMPT_TOKENS and max_tokens <= SHORT_OUTPUT_TOKENS:
+            candidates = fastest(min_quality)
+            if candidates and candidates[0].name != model:
+                return self._decision(candidates[0], messages, max_tokens, tokens, "fast",
+                                      f"short lookup ({tokens} prompt tokens)")
+
+        if self._fits(requested, tokens, max_tokens):
+            if latency_target is not None and self.predicted_latency(model, max_tokens) > latency_target:
+                candidates = [s for s in fastest(min_quality)
+                              if self.predicted_latency(s.name, max_tokens) <= latency_target]
+                if candidates:
+                    return self._decision(candidates[0], messages, max_tokens, tokens, "latency",
+                                          f"{model} predicted over {latency_target}s target")
+            return self._decision(requested, messages, max_tokens, tokens, "kept", "fits")
+
+        # Dropping quality to fit is a routing choice; otherwise the prompt is truncated below
+        candidates = fastest(requested.quality) or (fastest(0) if ROUTING_ENABLED else [])
+        if candidates:
+            return self._decision(candidates[0], messages, max_tokens, tokens, "context",
+                                  f"{tokens} prompt tokens exceed {model} context")
+
+        # Nothing fits: keep the largest-context model of the best quality and trim the prompt
+        spec = max(self.ladder, key=lambda s: (s.context_window, s.quality))
+        budget = spec.context_window - min(max_tokens, spec.max_output)
+        trimmed = truncate_messages(messages, budget)
+        return self._decision(spec, trimmed, max_tokens, prompt_tokens(trimmed), "truncated",
+                              f"{tokens} prompt tokens exceed every model context")
+
+    def _decision(self, spec: ModelSpec, messages, max_tokens, tokens, action, reason) -> RouteDecision:
+        return RouteDecision(spec.name, messages, min(max_tokens, spec.max_output), tokens, action, reason)
+
+    def record(self, decision: RouteDecision, requested: str, latency_s: float, output_tokens: Optional[int] = None) -> None:
+        """Log a routed call with its measured latency and refine the latency model."""
+        logger.debug(
+            "llm_route requested=%s model=%s action=%s prompt_tokens=%s max_tokens=%s latency_s=%.2f reason=%r",
+            requested, decision.model, decision.action, decision.prompt_tokens, decision.max_tokens,
+            latency_s, decision.reason,
+        )
+        with self._lock:
+            s = self._stats.setdefault(decision.model, {"calls": 0, "total_latency_s": 0.0, "actions": {}})
+            s["calls"] += 1
+            s["total_latency_s"] += latency_s
+            s["actions"][decision.action] = s["actions"].get(decision.action, 0) + 1
+            if output_tokens and decision.model in self._latency:
+                base, rate = self._latency[decision.model]
+                observed_base = max(latency_s - output_tokens / rate, 0.05)
+                base += LATENCY_EWMA_ALPHA * (observed_base - base)
+                if latency_s > base:
+                    observed_rate = output_tokens / (latency_s - base)
+                    rate += LATENCY_EWMA_ALPHA * (observed_rate - rate)
+                self._latency[decision.model] = [base, rate]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                model: {
+                    "calls": s["calls"],
+                    "avg_latency_s": round(s["total_latency_s"] / s["calls"], 3),
+                    "actions": dict(s["actions"]),
+                    "est_base_latency_s": round(self._latency[model][0], 3) if model in self._latency else None,
+                }
+                for model, s in self._stats.items()
+            }
+
+
+def truncate_messages(messages: List[Dict[str, str]], budget: int) -> List[Dict[str, str]]:
+    """Shrink the longest messages (keeping their beginning) until the prompt fits `budget` tokens."""
+    messages = [dict(m) for m in messages]
+    while prompt_tokens(messages) > budget:
+        longest = max(messages, key=lambda m: len(m["content"]))
+        excess = prompt_tokens(messages) - budget
+        content = longest["content"]
+        # Cut proportionally to the token overshoot, a little extra to converge quickly
+        keep = int(len(content) * (1 - excess / max(estimate_tokens(content), 1)) * 0.95)
+        if keep <= 0 or keep >= len(content):
+            keep = len(content) // 2
+        longest["content"] = content[:keep] + TRUNCATION_MARKER
+    return messages
+
+
+def pack_texts(texts: Iterable[str], max_tokens: int) -> Iterator[str]:
+    """Join consecutive texts into parts of at most ~`max_tokens` tokens each, one part at a time."""
+    current, size = [], 0
+    for text in texts:
+        tokens = estimate_tokens(text)
+        if current and size + tokens > max_tokens:
+            yield "\n\n".join(current)
+            current, size = [], 0
+        current.append(text)
+        size += tokens
+    if current:
+        yield "\n\n".join(current)
+
+
+def split_text(text: str, max_tokens: int) -> List[str]:
+    """Split text on paragraph boundaries into parts of at most ~`max_tokens` tokens each."""
+    return list(pack_texts(text.split("\n\n"), max_tokens))
+
+
+ROUTER = ModelRouter()
@@ -2,10 +2,18 @@
 import os
 import json
 import re
-from typing import List, Optional, Dict, Any, Set
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+from typing import List, Optional, Dict, Any, Iterable, Set, Union
 from pydantic import BaseModel, ValidationError, Field
-from langchain_openai import ChatOpenAI
+from llm_scheduler import invoke_llm, stream_llm, INTERACTIVE, BACKGROUND
+from json_stream import collect_sections
 from typing import Tuple
+from dedup import filter_near_duplicates, NEAR_DUP_THRESHOLD
+from model_router import ROUTER, estimate_tokens, pack_texts
+from citations import OUTLINES, chunk_label, locate
+from vectorstore import cached_lookup, cached_search, normalize_query, search_by_vector
+from tracing import ContextThreadPoolExecutor, annotate, traced
 # --- Pydantic Models ---
 
 class DocChunk(BaseModel):
@@ -41,43 +49,77 @@ class ContractHighlightsRisks(BaseModel):
     highlights: List[HighlightRisk] = Field(default_factory=list)
     risks: List[HighlightRisk] = Field(default_factory=list)
 
-qa_history: List[Dict[str, str]] = []
-qa_summary: Optional[str] = None
+# --- Structured (JSON) LLM Output ---
 
-report_history: List[Dict[str, str]] = []
-report_summary: Optional[str] = None
+def invoke_structured(
+    messages: List[Dict[str, str]],
+    model_cls=None,
+    required_keys: Optional[List[str]] = None,
+    repair_attempts: int = 1,
+    **llm_kwargs
+) -> Dict[str, Any]:
+    """
+    Stream a JSON completion and validate each top-level section against
+    `model_cls` as it arrives.
+    Truncated lists keep the items that did parse. Keys still missing at the
+    end are re-requested on their own instead of regenerating the whole answer.
+    """
+    if required_keys is None:
+        required_keys = list(model_cls.model_fields) if model_cls else []
+    sections, partial = collect_sections(stream_llm(messages, **llm_kwargs), model_cls)
+    for attempt in range(repair_attempts + 1):
+        for key, items in partial.items():
+            if key not in sections and items:
+                sections[key] = items  # salvaged from a cut-off list
+        missing = [k for k in required_keys if k not in sections]
+        if not missing or attempt == repair_attempts:
+            break
+        repair = messages + [{
+            "role": "user",
+            "content": f"Return ONLY a JSON object with these keys, following the structure described above: {', '.join(missing)}"
+        }]
+        more, partial = collect_sections(stream_llm(repair, **llm_kwargs), model_cls)
+        sections.update({k: v for k, v in more.items() if k in missing})
+    return sections
 
 # --- RAG and Document Searching ---
-def summarize_history(history: List[Dict[str, str]], model="gpt-4.1-mini", max_tokens=200) -> str:
+def summarize_history(history: List[Dict[str, str]], model="gpt-4.1-mini", max_tokens=200, priority: int = INTERACTIVE) -> str:
     history_text = "\n".join(f"{m['role']}: {m['content']}" for m in history)
     prompt = f"""Summarize the following chat history in under 150 tokens, keeping key questions, decisions, and context for the next LLM turn. No fluff:
 {history_text}
 """
-    llm = ChatOpenAI(model=model, temperature=0.1, max_tokens=max_tokens)
-    response = llm.invoke([{"role": "user", "content": prompt}])
+    response = invoke_llm([{"role": "user", "content": prompt}], model=model, temperature=0.1, max_tokens=max_tokens, priority=priority)
     return response.content.strip()
 
-def rag_search(query: str, vectorstore, k: int = 4) -> List[DocChunk]:
-    # vectorstore.similarity_search returns objects with .page_content
-    relevant_chunks = vectorstore.similarity_search(query, k=k)
+@traced()
+def rag_search(query: str, vectorstore, k: int = 4, search_filter: Optional[Dict[str, Any]] = None) -> List[DocChunk]:
+    annotate(query=query, k=k)
+    # Identical queries on an unchanged corpus are answered from the retrieval cache
+    relevant_chunks = cached_search(query, vectorstore, k=k, filter=search_filter)
+    annotate(chunks=len(relevant_chunks))
     # Validate and wrap results with Pydantic
     return [DocChunk(page_content=chunk.page_content) for chunk in relevant_chunks]
 
 # --- Q&A with Context Chunks ---
 
+@traced()
 def answer_doc_question(
     user_query: str,
     context_chunks: List[DocChunk],
-    chat_summary: Optional[str] = None
+    chat_summary: Optional[str] = None,
+    model: str = "gpt-4",
 ) -> Tuple[str, List[DocChunk]]:
-    # Ensure the chunks are DocChunk and have heading/line info if possible
     context_chunks = [DocChunk(**chunk.dict()) for chunk in context_chunks]
 
+    # Headings and line numbers come from the ingest-time citation index
     references = []
-    for i, chunk in enumerate(context_chunks):
-        heading = (chunk.heading or "Unknown Section") if hasattr(chunk, "heading") else "Unknown Section"
-        line = chunk.line_number if hasattr(chunk, "line_number") and chunk.line_number is not None else "-"
-        ref = f"[CHUNK {i+1} | {heading}] (Line {line})\n{chunk.page_content.strip()}"
+    outlines = OUTLINES.get_many([chunk.page_content for chunk in context_chunks])
+    for i, (chunk, outline) in enumerate(zip(context_chunks, outlines)):
+        text = chunk.page_content
+        heading = chunk_label(outline)
+        first_line = locate(outline, len(text) - len(text.lstrip()))[0]
+        last_line = locate(outline, max(len(text.rstrip()) - 1, 0))[0]
+        ref = f"[CHUNK {i+1} | {heading}] (Lines {first_line}-{last_line})\n{text.strip()}"
         references.append(ref)
     context_section = "\n\n".join(references)
 
@@ -104,13 +146,35 @@ Return JSON:
 }}
 Strict rules: Only return JSON, always attach the heading/section and line for each citation.
 """
-    llm = ChatOpenAI(model="gpt-4", temperature=0.1, max_tokens=600)
-    response = llm.invoke([{"role": "user", "content": prompt}])
+    # The router sends short lookups to the fastest model of the same quality
+    response = invoke_llm([{"role": "user", "content": prompt}], model=model, temperature=0.1, max_tokens=600, priority=INTERACTIVE)
     return response.content, context_chunks
 
 # --- Highlights and Risk Extraction ---
 
-def extract_contract_highlights(document_text: str) -> ContractHighlightsRisks:
+HIGHLIGHTS_MAX_TOKENS = 1500
+
+@traced()
+def extract_contract_highlights(document_text: Union[str, Iterable[str]], priority: int = BACKGROUND) -> ContractHighlightsRisks:
+    """
+    Highlights and risks for a document given as one string or as its chunk texts.
+    Larger than any model's context: packed into parts, extracted per part and merged
+    (the router truncates what cannot be split). Chunk texts are packed as they are
+    read, so the whole corpus is never joined into one string.
+    """
+    budget = ROUTER.max_prompt_tokens(HIGHLIGHTS_MAX_TOKENS) - 1000
+    if isinstance(document_text, str):
+        if estimate_tokens(document_text) <= budget:
+            return _extract_highlights_part(document_text, priority)
+        document_text = document_text.split("\n\n")
+    merged = ContractHighlightsRisks()
+    for part in pack_texts(document_text, budget):
+        found = _extract_highlights_part(part, priority)
+        merged.highlights.extend(found.highlights)
+        merged.risks.extend(found.risks)
+    return merged
+
+def _extract_highlights_part(document_text: str, priority: int) -> ContractHighlightsRisks:
     prompt = f"""
 You are a top-tier contract analysis and compliance AI.
 
@@ -139,15 +203,57 @@ Respond using this JSON structure:
 CONTRACT DOCUMENT:
 {document_text}
 """
-    llm = ChatOpenAI(model="gpt-4.1-mini", temperature=0.2, max_tokens=1500)
-    response = llm.invoke([{"role": "user", "content": prompt}])
+    parsed = invoke_structured(
+        [{"role": "user", "content": prompt}], ContractHighlightsRisks,
+        model="gpt-4.1-mini", temperature=0.2, max_tokens=HIGHLIGHTS_MAX_TOKENS, priority=priority
+    )
 
-    m = re.search(r"\{[\s\S]+\}", response.content if hasattr(response, 'content') else response)
-    parsed = json.loads(m.group()) if m else {"highlights": [], "risks": []}
-
-    # Validate with Pydantic
+    # Sections are already validated with Pydantic as they stream in
     return ContractHighlightsRisks(**parsed)
 
+# --- Table Questions ---
+
+@traced()
+def plan_table_query(question: str, tables: List[Dict[str, Any]], priority: int = INTERACTIVE) -> Optional[Dict[str, Any]]:
+    """
+    Translate a question into a filter / group-by / aggregate query over one of
+    the given table schemas (see tables.run_query), or None if no table answers it.
+    """
+    prompt = f"""You translate questions about construction spreadsheets into table queries.
+
+Tables (columns with type; text columns list their most common values):
+{json.dumps(tables, indent=1)}
+
+Question: {question}
+
+If the question needs numbers from one of these tables (totals, counts, averages, min/max, lists by category), return:
+{{"table": "<table id>",
+  "filters": [{{"column": "<column>", "op": "eq|ne|contains|in|gt|gte|lt|lte", "value": ...}}],
+  "group_by": ["<column>", ...],
+  "aggregates": [{{"fn": "sum|count|avg|min|max", "column": "<numeric column, or null for count>"}}],
+  "order": "desc|asc",
+  "limit": 20}}
+Use "contains" to match words inside text values (e.g. item descriptions). Only use columns that exist.
+Otherwise return {{"table": null}}. Only return JSON.
+"""
+    response = invoke_llm([{"role": "user", "content": prompt}], model="gpt-4.1-mini", temperature=0.0, max_tokens=400, priority=priority)
+    try:
+        start, end = response.content.find("{"), response.content.rfind("}") + 1
+        spec = json.loads(response.content[start:end])
+    except ValueError:
+        print("TABLE PLAN UNPARSEABLE", response.content[:200])
+        return None
+    return spec if isinstance(spec, dict) and spec.get("table") else None
+
+# --- Document Summaries ---
+
+def summarize_document_text(text: str, max_tokens: int = 300, priority: int = BACKGROUND) -> str:
+    prompt = f"""Summarize the following construction project document text in under 200 tokens. Keep parties, amounts, dates, deadlines, obligations, penalties and anything unusual. No fluff:
+{text}
+"""
+    response = invoke_llm([{"role": "user", "content": prompt}], model="gpt-4.1-mini", temperature=0.1, max_tokens=max_tokens, priority=priority)
+    return response.content.strip()
+
 # --- Score, Strength, Weakness, Next Steps ---
 
 SCORING_PARAMS = ["cost", "timeline", "compliance", "design", "sustainability"]
@@ -160,8 +266,76 @@ PARAM_WEIGHTS = {
 }
 WEIGHTS = {"cost": 0.3, "timeline": 0.2, "compliance": 0.2, "design": 0.1, "sustainability": 0.2}
 
-def evaluate_scores_with_llm(doc_chunks: List[DocChunk]) -> Tuple[Dict[str, Any], float, StrengthWeakness, StrengthWeakness, List[NextStep]]:
-    context_text = "\n\n".join(chunk.page_content for chunk in doc_chunks)
+def apply_param_weights(raw_scores: Dict[str, Dict[str, Any]], pinned: Optional[Dict[str, float]] = None) -> Tuple[Dict[str, Any], float]:
+    """
+    Propagate raw per-parameter scores through PARAM_WEIGHTS and compute the
+    weighted final score. `pinned` parameters keep the given value as-is (what-if
+    slider overrides) and feed into the others. Single source of truth for the
+    score math used by /dashboard and /dashboard/recalc.
+    """
+    pinned = pinned or {}
+    value = lambda key: pinned[key] if key in pinned else raw_scores.get(key, {}).get("score", 3)
+    results = {}
+    for param in SCORING_PARAMS:
+        if param in pinned:
+            results[param] = {"score": round(pinned[param], 2), "why": raw_scores[param]["why"]}
+            continue
+        w = PARAM_WEIGHTS.get(param, {})
+        score = (
+            w.get("self", 0.5) * value(param) +
+            w.get("timeline", 0) * value("timeline") +
+            w.get("cost", 0) * value("cost") +
+            w.get("compliance", 0) * value("compliance") +
+            w.get("design", 0) * value("design") +
+            w.get("safety", 0) * value("safety")
+        )
+        results[param] = {
+            "score": round(score, 2),
+            "why": raw_scores[param]["why"]
+        }
+    final_score = sum(WEIGHTS[p] * results[p]["score"] for p in WEIGHTS)
+    return results, final_score
+
+def evaluate_scores_with_llm(doc_chunks: List[DocChunk], priority: int = BACKGROUND) -> Tuple[Dict[str, Any], float, StrengthWeakness, StrengthWeakness, List[NextStep]]:
+    raw_scores, strength, weakness, next_steps = score_with_llm(doc_chunks, priority)
+    results, final_score = apply_param_weights(raw_scores)
+    return results, final_score, strength, weakness, next_steps
+
+ScoreResult = Tuple[Dict[str, Dict[str, Any]], StrengthWeakness, StrengthWeakness, List[NextStep]]
+
+@traced()
+def score_with_llm(doc_chunks: List[DocChunk], priority: int = BACKGROUND) -> ScoreResult:
+    """
+    LLM baseline: raw (unpropagated) scores per parameter plus strength, weakness
+    and next steps. Context larger than a model takes is packed into parts that
+    are scored separately and merged, so no chunk is left unread.
+    """
+    budget = ROUTER.max_prompt_tokens(1200) - 1000
+    parts, sizes = [], []
+    for part in pack_texts((chunk.page_content for chunk in doc_chunks), budget):
+        parts.append(_score_part(part, priority))
+        sizes.append(estimate_tokens(part))
+    if len(parts) <= 1:
+        return parts[0] if parts else _score_part("", priority)
+    return _merge_part_scores(parts, sizes)
+
+def _merge_part_scores(parts: List[ScoreResult], sizes: List[int]) -> ScoreResult:
+    """
+    Scores averaged over the parts weighted by their size, each explained by the
+    part that scored closest to the average. Strength comes from the best-scoring
+    part; weakness and next steps from the worst.
+    """
+    total = sum(sizes)
+    raw_scores = {}
+    for key in parts[0][0]:
+        score = sum(size * part[0][key]["score"] for part, size in zip(parts, sizes)) / total
+        closest = min(parts, key=lambda part: abs(part[0][key]["score"] - score))
+        raw_scores[key] = {"score": round(score, 2), "why": closest[0][key]["why"]}
+    overall = lambda part: sum(item["score"] for item in part[0].values())
+    best, worst = max(parts, key=overall), min(parts, key=overall)
+    return raw_scores, best[1], worst[2], worst[3]
+
+def _score_part(context_text: str, priority: int) -> ScoreResult:
     prompt = f"""
 You are a senior construction consultant.
 Based on the following document context, rate the project on these parameters—cost, timeline, compliance, design, safety, sustainability (1=worst, 5=best).
@@ -187,47 +361,28 @@ Structure your response as a JSON object with the following top-level keys:
 Context:
 {context_text}
 """
-    llm = ChatOpenAI(model="gpt-4.1-mini", temperature=0.2, max_tokens=1200)
-    response = llm.invoke([{"role": "user", "content": prompt}])
-
-    match = re.search(r"\{[\s\S]+\}", response.content if hasattr(response, 'content') else response)
-    raw_json = json.loads(match.group()) if match else {}
+    sections = invoke_structured(
+        [{"role": "user", "content": prompt}], EvaluationOutput,
+        model="gpt-4.1-mini", temperature=0.2, max_tokens=1200, priority=priority
+    )
 
     # Validate and parse with Pydantic
     try:
-        output = EvaluationOutput.parse_obj(raw_json)
+        output = EvaluationOutput(**sections)
     except ValidationError as ve:
         # Fallback: preserve everything, fill missing with defaults
         output = EvaluationOutput(
-            scores=[ScoreItem(parameter=k, score=3, why="Malformed response") for k in SCORING_PARAMS],
-            strength=StrengthWeakness(what="", why=""),
-            weakness=StrengthWeakness(what="", why=""),
-            next_steps=[]
+            scores=sections.get("scores") or [ScoreItem(parameter=k, score=3, why="Malformed response") for k in SCORING_PARAMS],
+            strength=sections.get("strength") or StrengthWeakness(what="", why=""),
+            weakness=sections.get("weakness") or StrengthWeakness(what="", why=""),
+            next_steps=sections.get("next_steps") or []
         )
 
-    # Score calculation as before
     raw_scores = {item.parameter: {"score": item.score, "why": item.why} for item in output.scores}
     for key in ["cost", "timeline", "compliance", "design", "sustainability", "safety"]:
         if key not in raw_scores:
             raw_scores[key] = {"score": 3, "why": "Insufficient evidence in documents."}
-    results = {}
-    for param in SCORING_PARAMS:
-        w = PARAM_WEIGHTS.get(param, {})
-        score = (
-            w.get("self", 0.5) * raw_scores[param]["score"] +
-            w.get("timeline", 0) * raw_scores.get("timeline", {}).get("score", 3) +
-            w.get("cost", 0) * raw_scores.get("cost", {}).get("score", 3) +
-            w.get("compliance", 0) * raw_scores.get("compliance", {}).get("score", 3) +
-            w.get("design", 0) * raw_scores.get("design", {}).get("score", 3) +
-            w.get("safety", 0) * raw_scores.get("safety", {}).get("score", 3)
-        )
-        results[param] = {
-            "score": round(score, 2),
-            "why": raw_scores[param]["why"]
-        }
-    final_score = sum(WEIGHTS[p] * results[p]["score"] for p in WEIGHTS)
-
-    return results, final_score, output.strength, output.weakness, output.next_steps
+    return raw_scores, output.strength, output.weakness, output.next_steps
 
 # --- Follow-up Question Pipeline ---
 from typing import List, Dict, Any, Set, Optional
@@ -237,13 +392,29 @@ import json
 class QuestionRequest(BaseModel):
     user_query: str
 
-def summarize_history(history: List[Dict[str, str]], model="gpt-4.1-mini", max_tokens=200) -> str:
+@traced()
+def summarize_history(history: List[Dict[str, str]], model="gpt-4.1-mini", max_tokens=200, priority: int = INTERACTIVE) -> str:
     history_text = "\n".join(f"{m['role']}: {m['content']}" for m in history)
     prompt = f"""Summarize the following chat history in under 150 tokens, keeping key questions, decisions, and context for the next LLM turn. No fluff:
 {history_text}
 """
-    llm = ChatOpenAI(model=model, temperature=0.1, max_tokens=max_tokens)
-    response = llm.invoke([{"role": "user", "content": prompt}])
+    response = invoke_llm([{"role": "user", "content": prompt}], model=model, temperature=0.1, max_tokens=max_tokens, priority=priority)
+    return response.content.strip()
+
+@traced()
+def update_summary(previous_summary: Optional[str], new_turns: List[Dict[str, str]], model="gpt-4.1-mini", max_tokens=200, priority: int = BACKGROUND) -> str:
+    # Incremental: only the turns since the last summary are sent, not the whole window
+    if not previous_summary:
+        return summarize_history(new_turns, model=model, max_tokens=max_tokens, priority=priority)
+    turns_text = "\n".join(f"{m['role']}: {m['content']}" for m in new_turns)
+    prompt = f"""Update the running summary of a chat with the new turns below. Stay under 150 tokens, keep key questions, decisions, and context for the next LLM turn. No fluff.
+Current summary:
+{previous_summary}
+
+New turns:
+{turns_text}
+"""
+    response = invoke_llm([{"role": "user", "content": prompt}], model=model, temperature=0.1, max_tokens=max_tokens, priority=priority)
     return response.content.strip()
 #############added:
 def build_final_reasoning_prompt(user_query: str, context: List[str]) -> str:
@@ -279,15 +450,21 @@ Now generate your answer.
 """
     return prompt.strip()
 
+FINAL_REPORT_KEYS = [
+    "answer", "cost_impact", "schedule_impact", "resource_impact",
+    "consequences", "recommended_mitigation", "alternative_strategies"
+]
+
+@traced()
 def get_final_report(user_query: str, context: List[str]) -> Dict[str, Any]:
     prompt = build_final_reasoning_prompt(user_query, context)
-    llm = ChatOpenAI(model="gpt-4.1-mini", temperature=0.2, max_tokens=1400)
-    res = llm.invoke([{"role": "system", "content": "Return only minified JSON. If evidence lacking, clearly state so in 'citations' and 'why'."},
-                      {"role": "user", "content": prompt}])
-    import re
-    match = re.search(r"\{[\s\S]+\}", res.content if hasattr(res, 'content') else res)
-    report = json.loads(match.group()) if match else {"error": "Malformed LLM output"}
-    return report
+    report = invoke_structured(
+        [{"role": "system", "content": "Return only minified JSON. If evidence lacking, clearly state so in 'citations' and 'why'."},
+         {"role": "user", "content": prompt}],
+        required_keys=FINAL_REPORT_KEYS,
+        model="gpt-4.1-mini", temperature=0.2, max_tokens=1400, priority=INTERACTIVE
+    )
+    return report or {"error": "Malformed LLM output"}
 
 #############till here
 def build_final_reasoning_prompt(user_query: str, context: List[str]) -> str:
@@ -330,11 +507,12 @@ JSON structure:
 """
     return prompt.strip()
 
+@traced()
 def generate_report(request: QuestionRequest, chat_summary: Optional[str]=None) -> List[str]:
-    prompt = build_final_reasoning_prompt(request.user_query, chat_summary)
-    llm = ChatOpenAI(model="gpt-4.1-mini", temperature=0.0, max_tokens=500)
-    res = llm.invoke([{"role": "system", "content": "Generate questions as described."},
-                      {"role": "user", "content": prompt}])
+    prompt = build_final_reasoning_prompt(request.user_query, [chat_summary] if chat_summary else [])
+    res = invoke_llm([{"role": "system", "content": "Generate questions as described."},
+                      {"role": "user", "content": prompt}],
+                     model="gpt-4.1-mini", temperature=0.0, max_tokens=500, priority=INTERACTIVE)
     try:
         start = res.content.find('[')
         end = res.content.rfind(']') + 1
@@ -346,25 +524,122 @@ def generate_report(request: QuestionRequest, chat_summary: Optional[str]=None)
     except Exception as e:
         return []
 
-def rag_loop(
+# Shared pool for the pipelined rag_loop; work is I/O bound (LLM + embedding calls)
+RAG_EXECUTOR = ContextThreadPoolExecutor(max_workers=16, thread_name_prefix="rag")
+FOLLOWUP_DEADLINE_SECONDS = 15.0
+
+@traced()
+def gather_context_pipelined(
+    user_query: str,
+    vectorstore,
+    chat_summary: Optional[str] = None,
+    followup_deadline: Optional[float] = FOLLOWUP_DEADLINE_SECONDS,
+    search_filter: Optional[Dict[str, Any]] = None
+) -> List[DocChunk]:
+    """
+    Retrieve on the raw query while follow-up questions are being generated,
+    then fan out one retrieval per follow-up and merge results as they arrive.
+    Whatever has not arrived by `followup_deadline` seconds is left behind.
+    """
+    deadline = time.monotonic() + followup_deadline if followup_deadline else None
+    direct = RAG_EXECUTOR.submit(rag_search, user_query, vectorstore, search_filter=search_filter)
+    followups = RAG_EXECUTOR.submit(generate_report, QuestionRequest(user_query=user_query), chat_summary)
+    pending = {direct, followups}
+    results: Dict[Any, List[DocChunk]] = {}
+    while pending:
+        timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+        done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+        if not done:
+            # Searches still queued behind other requests are dropped rather than run for nobody
+            cancelled = sum(fut.cancel() for fut in pending)
+            print(f"rag_loop: follow-up deadline hit, continuing without {len(pending)} pending task(s), {cancelled} cancelled")
+            break
+        for fut in done:
+            if fut is followups:
+                try:
+                    questions = fut.result()
+                except Exception as e:
+                    print("FOLLOWUP ERROR", e)
+                    questions = []
+                pending |= {RAG_EXECUTOR.submit(rag_search, q, vectorstore, search_filter=search_filter)
+                            for q in questions if isinstance(q, str) and q.strip()}
+            elif fut is direct:
+                results[fut] = fut.result()
+            else:
+                try:
+                    results[fut] = fut.result()
+                except Exception as e:
+                    print("RAG SEARCH ERROR", e)
+    # Direct hits first, follow-up hits in arrival order
+    merged = list(results.pop(direct, []))
+    for chunks in results.values():
+        merged.extend(chunks)
+    return merged
+
+@traced()
+def rag_context(
     user_query: str,
     vectorstore,
     history: Optional[List[Dict[str, str]]] = None,
     chat_summary: Optional[str] = None,
-    summary_every: int = 5
-) -> Dict[str, Any]:
+    summary_every: int = 5,
+    near_dup_threshold: float = NEAR_DUP_THRESHOLD,
+    pipelined: bool = False,
+    followup_deadline: Optional[float] = FOLLOWUP_DEADLINE_SECONDS,
+    search_filter: Optional[Dict[str, Any]] = None
+) -> Tuple[List[str], Optional[str]]:
+    """The retrieval half of rag_loop: deduplicated context and the (possibly refreshed) chat summary."""
     # Step 1: update/generate summary if needed
     history = history or []
     if len(history) > 0 and (chat_summary is None or len(history) % summary_every == 0):
         chat_summary = summarize_history(history[-summary_every:])
 
     # Step 2: followup questions using latest summary
-    request = QuestionRequest(user_query=user_query)
-    followup_questions = generate_report(request, chat_summary=chat_summary)
-    context_chunks = []
-    for q in followup_questions:
-        context_chunks.extend(rag_search(q, vectorstore))
+    if pipelined:
+        context_chunks = gather_context_pipelined(user_query, vectorstore, chat_summary, followup_deadline, search_filter)
+    else:
+        request = QuestionRequest(user_query=user_query)
+        followup_questions = generate_report(request, chat_summary=chat_summary)
+        context_chunks = []
+        for q in followup_questions:
+            context_chunks.extend(rag_search(q, vectorstore, search_filter=search_filter))
  
+    return dedupe_context(context_chunks, near_dup_threshold), chat_summary
+
+def finish_report(
+    user_query: str,
+    context: List[str],
+    chat_summary: Optional[str] = None,
+    extra_context: Optional[List[str]] = None
+) -> Dict[str, Any]:
+    # Computed results (e.g. table aggregates) go first and are never deduplicated away
+    context = list(extra_context or []) + context
+    # Replace evaluate_scores_with_llm with get_final_report:
+    final_report = get_final_report(user_query, context)
+    final_report["summary"] = chat_summary
+    return final_report
+
+@traced()
+def rag_loop(
+    user_query: str,
+    vectorstore,
+    history: Optional[List[Dict[str, str]]] = None,
+    chat_summary: Optional[str] = None,
+    summary_every: int = 5,
+    near_dup_threshold: float = NEAR_DUP_THRESHOLD,
+    pipelined: bool = False,
+    followup_deadline: Optional[float] = FOLLOWUP_DEADLINE_SECONDS,
+    search_filter: Optional[Dict[str, Any]] = None,
+    extra_context: Optional[List[str]] = None
+) -> Dict[str, Any]:
+    context, chat_summary = rag_context(
+        user_query, vectorstore, history, chat_summary, summary_every, near_dup_threshold,
+        pipelined, followup_deadline, search_filter
+    )
+    return finish_report(user_query, context, chat_summary, extra_context)
+
+@traced()
+def dedupe_context(context_chunks, near_dup_threshold: float = NEAR_DUP_THRESHOLD) -> List[str]:
     seen: Set[str] = set()
     deduped_chunks = []
     for c in context_chunks:
@@ -372,7 +647,100 @@ def rag_loop(
         if page_text not in seen:
             deduped_chunks.append(page_text)
             seen.add(page_text)
-    # Replace evaluate_scores_with_llm with get_final_report:
-    final_report = get_final_report(user_query, deduped_chunks)
-    final_report["summary"] = chat_summary
-    return final_report
+    # Drop overlapping chunks / repeated boilerplate clauses using ingest-time MinHash signatures
+    return filter_near_duplicates(deduped_chunks, threshold=near_dup_threshold)
+
+# --- Batch What-If Pipeline ---
+
+@traced()
+def batch_rag_search(queries: List[str], vectorstore, k: int = 4, search_filter: Optional[Dict[str, Any]] = None) -> Dict[str, List[DocChunk]]:
+    """
+    Retrieve for many queries at once: duplicates are collapsed, cached queries
+    are served from the retrieval cache and the rest are embedded in a single
+    batch request when the store allows it.
+    Returns normalized query -> chunks.
+    """
+    # normalized key -> first original wording; the wording is what gets embedded
+    unique: Dict[str, str] = {}
+    for q in queries:
+        if q and q.strip():
+            unique.setdefault(normalize_query(q), q)
+    if not unique:
+        return {}
+    found = {key: cached_lookup(q, vectorstore, k=k, filter=search_filter) for key, q in unique.items()}
+    misses = [key for key, chunks in found.items() if chunks is None]
+    texts = [unique[key] for key in misses]
+    embeddings = getattr(vectorstore, "embeddings", None)
+    if misses and embeddings is not None and hasattr(vectorstore, "similarity_search_by_vector"):
+        vectors = embeddings.embed_documents(texts)
+        found.update(zip(misses, RAG_EXECUTOR.map(
+            lambda qv: search_by_vector(qv[0], qv[1], vectorstore, k=k, filter=search_filter), zip(texts, vectors)
+        )))
+    elif misses:
+        found.update(zip(misses, RAG_EXECUTOR.map(lambda q: vectorstore.similarity_search(q, k=k, filter=search_filter), texts)))
+    return {q: [DocChunk(page_content=c.page_content) for c in chunks] for q, chunks in found.items()}
+
+@traced()
+def rag_batch(
+    user_queries: List[str],
+    vectorstore,
+    max_concurrency: int = 4,
+    k: int = 4,
+    near_dup_threshold: float = NEAR_DUP_THRESHOLD,
+    search_filter: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """
+    Run many what-if scenarios against one shared context pool.
+    Follow-up generation and final reports run concurrently, at most
+    `max_concurrency` LLM calls at a time.
+    """
+    started = time.monotonic()
+    timings: List[Dict[str, float]] = [{} for _ in user_queries]
+
+    def followups_for(i: int) -> List[str]:
+        t0 = time.monotonic()
+        try:
+            questions = generate_report(QuestionRequest(user_query=user_queries[i]))
+        except Exception as e:
+            print("FOLLOWUP ERROR", e)
+            questions = []
+        timings[i]["followups_s"] = round(time.monotonic() - t0, 3)
+        return [user_queries[i]] + [q for q in questions if isinstance(q, str)]
+
+    with ContextThreadPoolExecutor(max_workers=max(1, max_concurrency), thread_name_prefix="rag-batch") as pool:
+        scenario_queries = list(pool.map(followups_for, range(len(user_queries))))
+
+        t0 = time.monotonic()
+        all_queries = [q for queries in scenario_queries for q in queries]
+        context_pool = batch_rag_search(all_queries, vectorstore, k=k, search_filter=search_filter)
+        retrieval_s = round(time.monotonic() - t0, 3)
+
+        def report_for(i: int) -> Dict[str, Any]:
+            chunks = [c for q in scenario_queries[i] for c in context_pool.get(normalize_query(q), [])]
+            context = dedupe_context(chunks, near_dup_threshold)
+            t1 = time.monotonic()
+            try:
+                report = get_final_report(user_queries[i], context)
+            except Exception as e:
+                report = {"error": str(e)}
+            timings[i]["report_s"] = round(time.monotonic() - t1, 3)
+            timings[i]["context_chunks"] = len(context)
+            return report
+
+        reports = list(pool.map(report_for, range(len(user_queries))))
+
+    for t in timings:
+        t["retrieval_s"] = retrieval_s
+        t["total_s"] = round(t.get("followups_s", 0) + retrieval_s + t.get("report_s", 0), 3)
+    return {
+        "results": [
+            {"question": q, "report": r, "timings": t}
+            for q, r, t in zip(user_queries, reports, timings)
+        ],
+        "retrieval": {
+            "queries": len(all_queries),
+            "unique_queries": len(context_pool),
+            "seconds": retrieval_s,
+        },
+        "total_seconds": round(time.monotonic() - started, 3),
+    }
@@ -0,0 +1,187 @@
+import math
+import os
+import re
+import threading
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+# --- Relevance pre-filter ---
+# Highlights and scoring only need chunks that can carry obligations,
+# deadlines, payment terms or risks. Each chunk gets a local relevance score
+# at ingest (keyword / regex features, damped for drawing-layer counts, IFC
+# element lists and OCR noise), stored with its metadata. Before the whole
+# corpus goes to the LLM, chunks under RELEVANCE_THRESHOLD are dropped. That
+# is a vectorized comparison over the stored scores, not a rescan.
+# With RELEVANCE_EMBEDDINGS=1, chunks whose keyword score is borderline are
+# also compared against embedded prototype clauses, and kept when close to
+# one. Kept / dropped counts are exported in /stats, and
+# benchmarks/bench_relevance.py measures recall on labelled chunks.
+
+RELEVANCE_FILTER = os.getenv("RELEVANCE_FILTER", "1") == "1"
+# 0.2 keeps 99% of clauses and ~48% of prompt tokens on the synthetic set; 0.3 keeps 92% / ~37%
+RELEVANCE_THRESHOLD = float(os.getenv("RELEVANCE_THRESHOLD", "0.2"))
+# Never send fewer than this many chunks (the best-scoring ones) when a corpus has them
+RELEVANCE_MIN_KEEP = int(os.getenv("RELEVANCE_MIN_KEEP", "5"))
+RELEVANCE_EMBEDDINGS = os.getenv("RELEVANCE_EMBEDDINGS", "0") == "1"
+# Keyword scores in [BORDERLINE_LOW, threshold) are checked against the prototypes
+BORDERLINE_LOW = float(os.getenv("RELEVANCE_BORDERLINE_LOW", "0.1"))
+PROTOTYPE_SIMILARITY = float(os.getenv("RELEVANCE_PROTOTYPE_SIMILARITY", "0.45"))
+
+# (weight, pattern); each feature counts at most FEATURE_CAP hits
+FEATURES = {
+    "obligation": (1.0, re.compile(
+        r"\b(?:shall|must|is required to|are required to|agrees? to|undertakes? to|responsible for|obliged to|"
+        r"warrants?|covenants?)\b", re.IGNORECASE)),
+    "deadline": (0.8, re.compile(
+        r"\b(?:within \d+|no later than|not later than|on or before|prior to|deadline|completion date|milestone|"
+        r"(?:working|business|calendar) days?|\d{1,2}[/.-]\d{1,2}[/.-]\d{2,4}|"
+        r"(?:jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]* \d{1,2}(?:st|nd|rd|th)?,? \d{4})\b", re.IGNORECASE)),
+    "payment": (0.8, re.compile(
+        r"(?:\b(?:payments?|payable|paid|invoices?|fees?|retention|reimburse\w*|compensation|contract sum|"
+        r"contract price|interest|advance)\b|[$€£]\s?\d)", re.IGNORECASE)),
+    "risk": (0.9, re.compile(
+        r"\b(?:penalt\w+|terminat\w+|indemnif\w+|liabilit\w+|liable|breach\w*|default\w*|damages|insurance|"
+        r"disputes?|force majeure|suspen\w+|claims?|warrant(?:y|ies)|delays?|non-compliance|risks?)\b", re.IGNORECASE)),
+    # Weak signals for clauses that avoid the lexicon ("will release ... once the 12 month period has ended")
+    "term": (0.5, re.compile(
+        r"\b\d+(?:\.\d+)?\s?(?:%|per ?cent|(?:working |business |calendar )?(?:days?|weeks?|months?|years?))(?!\w)",
+        re.IGNORECASE)),
+    "modal": (0.3, re.compile(r"\b(?:will|may|should|shall not|cannot)\b", re.IGNORECASE)),
+}
+FEATURE_CAP = 3
+# Evidence is spread over the chunk: a keyword in a long passage counts for less than in a single clause
+REFERENCE_WORDS = 40
+EVIDENCE_SCALE = 2.5
+# Machine-generated summaries from the CAD / BIM loaders
+NOISE_LINE_RE = re.compile(r"^\s*(?:Ifc\w+:|Layer:|\.\.\.\(\d+ more entities)", re.MULTILINE)
+PROSE_ALPHA_RATIO = 0.6
+_SPACE_RE = re.compile(r"\s")
+_ALPHA_RE = re.compile(r"[^\W\d_]")
+_WORD_RE = re.compile(r"[^\W\d_]+")
+
+
+def relevance_score(text: str) -> float:
+    """0..1 estimate that a chunk states an obligation, deadline, payment term or risk."""
+    evidence = sum(weight * min(len(pattern.findall(text)), FEATURE_CAP) for weight, pattern in FEATURES.values())
+    if not evidence:
+        return 0.0
+    evidence *= min(1.0, math.sqrt(REFERENCE_WORDS / max(len(_WORD_RE.findall(text)), 1)))
+    score = 1 - math.exp(-evidence / EVIDENCE_SCALE)
+    # Mostly digits / symbols (OCR noise, tables of numbers) counts for less
+    visible = len(text) - len(_SPACE_RE.findall(text))
+    alpha = len(_ALPHA_RE.findall(text)) / max(visible, 1)
+    score *= min(alpha / PROSE_ALPHA_RATIO, 1.0)
+    lines = max(text.count("\n") + 1, 1)
+    score *= 1 - min(len(NOISE_LINE_RE.findall(text)) / lines, 1.0)
+    return round(score, 2)
+
+
+# --- Prototype clauses (optional embedding check) ---
+
+PROTOTYPE_CLAUSES = [
+    "The Contractor shall complete the Works by the Completion Date.",
+    "Payment shall be made within 30 days of receipt of a valid invoice.",
+    "Liquidated damages of 0.1% of the Contract Sum per day of delay shall apply.",
+    "Either party may terminate this Agreement for material breach.",
+    "The Subcontractor shall indemnify the Employer against all claims and losses.",
+    "Retention of 5% will be held until practical completion.",
+    "The Contractor must maintain professional indemnity insurance.",
+    "Any dispute shall be referred to adjudication.",
+]
+_prototypes: Optional[np.ndarray] = None
+_prototypes_lock = threading.Lock()
+
+
+def _prototype_vectors(embeddings) -> np.ndarray:
+    global _prototypes
+    with _prototypes_lock:
+        if _prototypes is None:
+            vectors = np.asarray(embeddings.embed_documents(PROTOTYPE_CLAUSES), dtype=np.float32)
+            _prototypes = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+        return _prototypes
+
+
+def score_chunks(chunks, embeddings=None) -> None:
+    """Set metadata["relevance"] on freshly parsed chunks (at ingest)."""
+    scores = [relevance_score(chunk.page_content) for chunk in chunks]
+    if RELEVANCE_EMBEDDINGS:
+        borderline = [i for i, s in enumerate(scores) if BORDERLINE_LOW <= s < RELEVANCE_THRESHOLD]
+        if borderline:
+            try:
+                if embeddings is None:
+                    from vectorstore import get_embeddings
+                    embeddings = get_embeddings()
+                vectors = np.asarray(embeddings.embed_documents([chunks[i].page_content for i in borderline]), dtype=np.float32)
+                vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12
+                similarity = (vectors @ _prototype_vectors(embeddings).T).max(axis=1)
+                for i, sim in zip(borderline, similarity):
+                    if sim >= PROTOTYPE_SIMILARITY:
+                        scores[i] = RELEVANCE_THRESHOLD
+            except Exception as e:
+                # Keyword scores alone are still a valid filter
+                print("RELEVANCE EMBEDDING ERROR", e)
+    for chunk, score in zip(chunks, scores):
+        chunk.metadata["relevance"] = score
+
+
+# --- Request-time filter ---
+
+class RelevanceStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.chunks_in = 0
+        self.chunks_kept = 0
+        self.bytes_in = 0
+        self.bytes_kept = 0
+
+    def record(self, chunks_in: int, chunks_kept: int, bytes_in: int, bytes_kept: int) -> None:
+        with self._lock:
+            self.calls += 1
+            self.chunks_in += chunks_in
+            self.chunks_kept += chunks_kept
+            self.bytes_in += bytes_in
+            self.bytes_kept += bytes_kept
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": RELEVANCE_FILTER,
+                "threshold": RELEVANCE_THRESHOLD,
+                "calls": self.calls,
+                "chunks_in": self.chunks_in,
+                "chunks_kept": self.chunks_kept,
+                "bytes_kept_ratio": round(self.bytes_kept / self.bytes_in, 3) if self.bytes_in else None,
+            }
+
+
+RELEVANCE_STATS = RelevanceStats()
+
+
+def select_relevant(chunks, threshold: Optional[float] = None):
+    """
+    The chunks worth sending to the LLM, in their original order: a ChunkList
+    stays a ChunkList, a list stays a list. Chunks scored before this filter
+    existed are scored now.
+    """
+    if not RELEVANCE_FILTER or not len(chunks):
+        return chunks
+    threshold = RELEVANCE_THRESHOLD if threshold is None else threshold
+    compact = hasattr(chunks, "numeric")
+    if compact:
+        scores, sizes = chunks.numeric("relevance"), chunks.sizes()
+    else:
+        scores = np.array([c.metadata.get("relevance", np.nan) for c in chunks], dtype=np.float64)
+        sizes = np.array([len(c.page_content) for c in chunks], dtype=np.int64)
+    for i in np.flatnonzero(np.isnan(scores)):
+        scores[i] = relevance_score(chunks[int(i)].page_content)
+    keep = np.flatnonzero(scores >= threshold)
+    if len(keep) < min(RELEVANCE_MIN_KEEP, len(scores)):
+        keep = np.sort(np.argsort(-scores, kind="stable")[:RELEVANCE_MIN_KEEP])
+    RELEVANCE_STATS.record(len(scores), len(keep), int(sizes.sum()), int(sizes[keep].sum()))
+    return chunks.take(keep) if compact else [chunks[int(i)] for i in keep]
+
+
+def relevance_stats() -> Dict[str, Any]:
+    return RELEVANCE_STATS.stats()
@@ -0,0 +1,107 @@
+import gzip
+import hashlib
+import os
+from typing import Any, Callable, Dict, Optional
+
+import orjson
+from fastapi import Request
+from fastapi.responses import Response
+
+# --- Conditional GET and compact JSON responses ---
+# /highlights and /dashboard results only change when the project's corpus
+# does, so they carry a weak ETag derived from the corpus version and the
+# request parameters. A client (or the browser cache) that sends the current
+# tag in If-None-Match gets a bodyless 304 before any snapshot or LLM work,
+# answered by ConditionalGetMiddleware ahead of admission control so a
+# revalidation never waits for (or takes) an endpoint slot.
+# Bodies are serialized with orjson and gzip-compressed above GZIP_MIN_BYTES
+# when the client accepts it.
+
+GZIP_MIN_BYTES = int(os.getenv("GZIP_MIN_BYTES", "1024"))
+# Level 1: ~5x smaller bodies at about half the CPU of level 5 (benchmarks/bench_responses.py)
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "1"))
+# Always revalidate: the tag is cheap to check and results must follow uploads immediately
+CACHE_CONTROL = "no-cache"
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+
+def etag_for(*parts: Any) -> str:
+    return 'W/"%s"' % hashlib.sha1(repr(parts).encode("utf-8")).hexdigest()[:24]
+
+
+def _opaque(tag: str) -> str:
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Weak comparison of `etag` against the request's If-None-Match list."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return _opaque(etag) in {_opaque(tag) for tag in header.split(",")}
+
+
+def accepts_gzip(request: Request) -> bool:
+    for coding in request.headers.get("accept-encoding", "").split(","):
+        name, _, params = coding.strip().partition(";")
+        if name.strip().lower() in ("gzip", "*"):
+            return _qvalue(params) > 0
+    return False
+
+
+def _qvalue(params: str) -> float:
+    # A q-value that does not parse counts as q=0: an identity body is always acceptable
+    for param in params.split(";"):
+        key, _, value = param.partition("=")
+        if key.strip().lower() == "q":
+            try:
+                return float(value.strip())
+            except ValueError:
+                return 0.0
+    return 1.0
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
+
+
+def json_response(request: Request, payload: Any, etag: Optional[str] = None, status_code: int = 200) -> Response:
+    body = orjson.dumps(payload, option=ORJSON_OPTIONS)
+    headers = {"Vary": "Accept-Encoding"}
+    if etag:
+        headers["ETag"] = etag
+        headers["Cache-Control"] = CACHE_CONTROL
+    if len(body) >= GZIP_MIN_BYTES and accepts_gzip(request):
+        body = gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+        headers["Content-Encoding"] = "gzip"
+    return Response(content=body, status_code=status_code, headers=headers, media_type="application/json")
+
+
+class ConditionalGetMiddleware:
+    """
+    Answers a GET whose If-None-Match holds the current tag with a 304 before
+    the inner app runs. `etags` maps a path to a function of the query
+    parameters returning that tag, or None to leave the request to the endpoint.
+    """
+
+    def __init__(self, app, etags: Dict[str, Callable[[Dict[str, str]], Optional[str]]]):
+        self.app = app
+        self.etags = etags
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["method"] == "GET":
+            current = self.etags.get(scope["path"].rstrip("/") or "/")
+            if current is not None:
+                request = Request(scope)
+                if request.headers.get("if-none-match"):
+                    try:
+                        etag = current(dict(request.query_params))
+                    except ValueError:
+                        # Invalid parameters; the endpoint reports them
+                        etag = None
+                    if etag and etag_matches(request, etag):
+                        return await not_modified(etag)(scope, receive, send)
+        await self.app(scope, receive, send)
@@ -0,0 +1,68 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from corpus_state import CORPUS
+from rag_chain import PARAM_WEIGHTS, WEIGHTS, apply_param_weights
+
+# --- What-if score recalculation ---
+# /dashboard?mode=ai stores the raw LLM scores it was computed from, keyed by
+# project/file scope and corpus version. Slider moves are then answered by
+# re-running the backend's weight propagation on that baseline, with no LLM
+# call. Baselines are cached in-process and persisted in the corpus database so
+# any worker can serve the recalculation.
+
+MAX_CACHED_BASELINES = 256
+SCORE_MIN, SCORE_MAX = 1.0, 5.0
+# Sliders cover the scored parameters plus those that only feed the propagation (safety)
+PINNABLE_PARAMS = set(WEIGHTS) | set(PARAM_WEIGHTS)
+
+_baselines: "OrderedDict[Tuple[str, int], Dict[str, Any]]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def baseline_scope(project: str, file_name: Optional[str] = None) -> str:
+    return f"{project}|{file_name or ''}"
+
+
+def _remember(key: Tuple[str, int], raw_scores: Dict[str, Any]) -> None:
+    with _lock:
+        _baselines[key] = raw_scores
+        _baselines.move_to_end(key)
+        while len(_baselines) > MAX_CACHED_BASELINES:
+            _baselines.popitem(last=False)
+
+
+def save_baseline(project: str, file_name: Optional[str], corpus_version: int, raw_scores: Dict[str, Any]) -> None:
+    scope = baseline_scope(project, file_name)
+    CORPUS.save_baseline(scope, corpus_version, raw_scores)
+    _remember((scope, corpus_version), raw_scores)
+
+
+def get_baseline(project: str, file_name: Optional[str], corpus_version: int) -> Optional[Dict[str, Any]]:
+    key = (baseline_scope(project, file_name), corpus_version)
+    with _lock:
+        raw_scores = _baselines.get(key)
+        if raw_scores is not None:
+            _baselines.move_to_end(key)
+            return raw_scores
+    raw_scores = CORPUS.baseline(*key)
+    if raw_scores is not None:
+        _remember(key, raw_scores)
+    return raw_scores
+
+
+def recalc_scores(raw_scores: Dict[str, Any], values: Dict[str, float]) -> Dict[str, Any]:
+    """Scores with `values` pinned, next to the untouched baseline, plus the parameter that moved the total most."""
+    baseline, baseline_final = apply_param_weights(raw_scores)
+    scores, final_score = apply_param_weights(raw_scores, pinned=values)
+    impact = {p: abs(WEIGHTS[p] * (scores[p]["score"] - baseline[p]["score"])) for p in WEIGHTS}
+    most_impactful = max(impact, key=impact.get)
+    for param, entry in scores.items():
+        entry["baseline"] = baseline[param]["score"]
+    return {
+        "scores": scores,
+        "final_score": round(final_score, 2),
+        "baseline_final_score": round(baseline_final, 2),
+        "most_impactful": most_impactful if impact[most_impactful] > 0 else None,
+    }
@@ -0,0 +1,122 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+# --- Per-session conversation state for /ask ---
+# Each session keeps its recent turns plus a rolling summary. The summary is
+# folded forward incrementally (previous summary + turns not yet summarized)
+# by a background task after each turn, so /ask never blocks on it.
+# Session ids are always minted here: an id the store does not know (expired,
+# evicted or made up by the client) starts a new session under a fresh id.
+
+MAX_SESSIONS = 1000
+SESSION_TTL_SECONDS = 60 * 60
+MAX_TURNS_KEPT = 20
+
+
+class ConversationSession:
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.history: List[Dict[str, str]] = []
+        self.summary: Optional[str] = None
+        # Number of messages in `history` already folded into `summary`
+        self.summarized_upto = 0
+        # Absolute index of history[0] (messages ever trimmed from the front), so a
+        # summary computed outside the lock can find its position after a trim
+        self.history_start = 0
+        self.last_seen = time.time()
+        self.lock = threading.Lock()
+        self.summary_lock = threading.Lock()
+
+    def add_turn(self, question: str, answer: str) -> None:
+        with self.lock:
+            self.history.append({"role": "user", "content": question})
+            self.history.append({"role": "assistant", "content": answer})
+            overflow = len(self.history) - MAX_TURNS_KEPT * 2
+            # Prefer dropping messages that are already part of the summary
+            drop = min(max(overflow, 0), self.summarized_upto)
+            if drop:
+                del self.history[:drop]
+                self.summarized_upto -= drop
+                self.history_start += drop
+            # Summaries keep failing: the oldest unsummarized turns go too, the history stays bounded
+            overflow = len(self.history) - MAX_TURNS_KEPT * 2
+            if overflow > 0:
+                del self.history[:overflow]
+                self.history_start += overflow
+
+    def pending_turns(self) -> Tuple[List[Dict[str, str]], int]:
+        """Turns not yet summarized, and the absolute index just past the last of them."""
+        with self.lock:
+            return list(self.history[self.summarized_upto:]), self.history_start + len(self.history)
+
+    def mark_summarized(self, summary: str, upto: int) -> None:
+        """Install a summary covering every message before absolute index `upto`."""
+        with self.lock:
+            self.summary = summary
+            position = min(max(upto - self.history_start, 0), len(self.history))
+            self.summarized_upto = max(self.summarized_upto, position)
+
+    def context(self) -> Optional[str]:
+        """Rolling summary plus any turns the background summarizer has not folded in yet."""
+        with self.lock:
+            parts = [self.summary] if self.summary else []
+            parts.extend(f"{m['role']}: {m['content']}" for m in self.history[self.summarized_upto:])
+        return "\n".join(parts) if parts else None
+
+
+class SessionStore:
+    """Bounded LRU of conversation sessions with idle expiry."""
+
+    def __init__(self, max_sessions: int = MAX_SESSIONS, ttl_seconds: float = SESSION_TTL_SECONDS):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self._sessions: "OrderedDict[str, ConversationSession]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def get(self, session_id: Optional[str] = None) -> ConversationSession:
+        now = time.time()
+        with self._lock:
+            self._evict_expired(now)
+            session = self._sessions.get(session_id) if session_id else None
+            if session is None:
+                # Never adopt a client-chosen id (session fixation); the new id is returned with the answer
+                session = ConversationSession(str(uuid.uuid4()))
+                self._sessions[session.session_id] = session
+            self._sessions.move_to_end(session.session_id)
+            session.last_seen = now
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+            return session
+
+    def _evict_expired(self, now: float) -> None:
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if now - oldest.last_seen < self.ttl_seconds:
+                break
+            self._sessions.popitem(last=False)
+
+
+SESSIONS = SessionStore()
+
+
+def refresh_session_summary(session: ConversationSession) -> None:
+    """Fold turns added since the last refresh into the session's rolling summary."""
+    from rag_chain import update_summary
+
+    # Serialize refreshes per session so each turn is folded in exactly once
+    with session.summary_lock:
+        pending, upto = session.pending_turns()
+        if not pending:
+            return
+        try:
+            summary = update_summary(session.summary, pending)
+        except Exception as e:
+            print("SUMMARY ERROR", e)
+            return
+        session.mark_summarized(summary, upto)
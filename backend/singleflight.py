@@ -0,0 +1,50 @@
+import asyncio
+from typing import Any, Callable, Dict, Hashable
+
+from fastapi.concurrency import run_in_threadpool
+
+# --- In-flight request coalescing ---
+# Concurrent callers asking for the same key share one computation. The work
+# runs as its own task, so a caller disconnecting does not cancel it for the
+# others still waiting.
+
+
+class SingleFlight:
+    def __init__(self):
+        self._tasks: Dict[Hashable, asyncio.Task] = {}
+        self._waiters: Dict[asyncio.Task, int] = {}
+        self.executed = 0
+        self.merged = 0
+
+    async def do(self, key: Hashable, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run blocking `fn` in the threadpool, or join an identical call already running."""
+        task = self._tasks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(run_in_threadpool(fn, *args, **kwargs))
+            self._tasks[key] = task
+            self.executed += 1
+            task.add_done_callback(lambda t, key=key: self._forget(key, t))
+        else:
+            self.merged += 1
+        self._waiters[task] = self._waiters.get(task, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            if task in self._waiters:
+                self._waiters[task] -= 1
+
+    def _forget(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        self._waiters.pop(task, None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": len(self._tasks),
+            "waiting_requests": sum(self._waiters.values()),
+            "executed": self.executed,
+            "merged": self.merged,
+        }
+
+
+LLM_SINGLEFLIGHT = SingleFlight()
@@ -0,0 +1,273 @@
+import argparse
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from langchain_core.documents import Document
+
+from citations import OUTLINES, index_chunks
+from corpus_state import CORPUS
+from dedup import NEAR_DUP_INDEX, NUM_PERM
+from tables import TABLES
+from vectorstore import add_embeddings, chunk_id, existing_ids, get_vectorstore, iter_embeddings, project_name
+
+# --- Portable index snapshots ---
+# A snapshot is a directory holding one project's index:
+#   manifest.json   format version, corpus version, embedding model/dim, documents, file checksums
+#   chunks.jsonl    one chunk per line (text + metadata), grouped by document
+#   embeddings.npy  float32 (count, dim), row i belongs to chunk i
+#   minhash.npy     uint32 (count, NUM_PERM) near-duplicate signatures, row i belongs to chunk i
+#   tables/<id>/    columnar tables of CSV/XLSX uploads (column .npy files + meta.json), listed per document
+# The .npy files are memory-mapped on import, so a replica can be seeded from
+# a snapshot without parsing a single upload or calling the embedding API.
+# There is no keyword index in this codebase; the lexical part of the bundle
+# is the MinHash shingle signatures used for context de-duplication.
+# Import refuses a snapshot made with a different embedding model or
+# dimension than the target store, and writes vectors under the same
+# deterministic ids an upload would get. An import that died partway can be
+# re-run: vectors already written and documents already registered (same
+# sha256) are skipped instead of duplicated.
+
+SNAPSHOT_FORMAT = "whatif-index-snapshot"
+SNAPSHOT_FORMAT_VERSION = 1
+IMPORT_BATCH_ROWS = 4096
+_FILES = ("chunks.jsonl", "embeddings.npy", "minhash.npy")
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _text_key(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def export_snapshot(out_dir: str, project: Optional[str] = None, vectorstore=None) -> Dict[str, Any]:
+    """Write a snapshot of `project` to `out_dir` (must not exist); returns the manifest."""
+    project = project_name(project)
+    if os.path.exists(out_dir):
+        raise SnapshotError(f"{out_dir} already exists")
+    corpus_version, chunks = CORPUS.snapshot(project)
+    documents = CORPUS.manifests(project)
+    if not chunks:
+        raise SnapshotError(f"Project {project} has no documents")
+    vectorstore = vectorstore or get_vectorstore(project=project)
+
+    # Reuse stored vectors; identical texts embed identically, so they are matched by content
+    wanted = {_text_key(c.page_content) for c in chunks}
+    stored: Dict[str, np.ndarray] = {}
+    for texts, vectors in iter_embeddings(vectorstore):
+        for text, vector in zip(texts, vectors):
+            key = _text_key(text)
+            if key in wanted:
+                stored[key] = np.asarray(vector, dtype=np.float32)
+    missing = list(dict.fromkeys(c.page_content for c in chunks if _text_key(c.page_content) not in stored))
+    if missing:
+        print(f"snapshot: embedding {len(missing)} chunk(s) not found in the vectorstore")
+        for text, vector in zip(missing, vectorstore.embeddings.embed_documents(missing)):
+            stored[_text_key(text)] = np.asarray(vector, dtype=np.float32)
+
+    # Group chunks by document, in upload order
+    by_doc: Dict[str, List[Document]] = {}
+    for c in chunks:
+        by_doc.setdefault(c.metadata.get("doc_id"), []).append(c)
+    ordered: List[Document] = []
+    doc_entries = []
+    for doc in documents:
+        doc_chunks = by_doc.get(doc["doc_id"], [])
+        doc_tables = TABLES.document_tables(project, doc["doc_id"])
+        doc_entries.append(dict(doc, chunk_start=len(ordered), chunk_count=len(doc_chunks),
+                                tables=[t.table_id for t in doc_tables]))
+        ordered.extend(doc_chunks)
+
+    dim = len(next(iter(stored.values())))
+    tmp_dir = out_dir.rstrip("/") + ".partial"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    with open(os.path.join(tmp_dir, "chunks.jsonl"), "w", encoding="utf-8") as f:
+        for c in ordered:
+            f.write(json.dumps({"text": c.page_content, "metadata": c.metadata}) + "\n")
+    embeddings = np.lib.format.open_memmap(
+        os.path.join(tmp_dir, "embeddings.npy"), mode="w+", dtype=np.float32, shape=(len(ordered), dim)
+    )
+    signatures = np.lib.format.open_memmap(
+        os.path.join(tmp_dir, "minhash.npy"), mode="w+", dtype=np.uint32, shape=(len(ordered), NUM_PERM)
+    )
+    for i, c in enumerate(ordered):
+        embeddings[i] = stored[_text_key(c.page_content)]
+        signatures[i] = NEAR_DUP_INDEX.signature(c.page_content)
+    embeddings.flush()
+    signatures.flush()
+    del embeddings, signatures
+    files = list(_FILES)
+    for doc in doc_entries:
+        for table_id in doc["tables"]:
+            src = os.path.join(TABLES.root, project, table_id)
+            shutil.copytree(src, os.path.join(tmp_dir, "tables", table_id))
+            files.extend(f"tables/{table_id}/{name}" for name in sorted(os.listdir(src)))
+
+    manifest = {
+        "format": SNAPSHOT_FORMAT,
+        "format_version": SNAPSHOT_FORMAT_VERSION,
+        "project": project,
+        "corpus_version": corpus_version,
+        "created_at": time.time(),
+        "embedding_model": getattr(vectorstore.embeddings, "model", None),
+        "dim": dim,
+        "count": len(ordered),
+        "documents": doc_entries,
+        "files": {
+            name: {"sha256": _sha256(os.path.join(tmp_dir, name)), "bytes": os.path.getsize(os.path.join(tmp_dir, name))}
+            for name in files
+        },
+    }
+    with open(os.path.join(tmp_dir, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+    # Only a complete snapshot ever appears under the final name
+    os.replace(tmp_dir, out_dir)
+    return manifest
+
+
+def read_manifest(snapshot_dir: str, verify: bool = True) -> Dict[str, Any]:
+    """Load and validate a snapshot manifest; with `verify`, every file is checked against its checksum."""
+    try:
+        with open(os.path.join(snapshot_dir, "manifest.json")) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        raise SnapshotError(f"Unreadable snapshot manifest: {e}")
+    if manifest.get("format") != SNAPSHOT_FORMAT or manifest.get("format_version") != SNAPSHOT_FORMAT_VERSION:
+        raise SnapshotError(f"Unsupported snapshot format {manifest.get('format')} v{manifest.get('format_version')}")
+    for name, info in manifest["files"].items():
+        path = os.path.join(snapshot_dir, name)
+        if not os.path.exists(path) or os.path.getsize(path) != info["bytes"]:
+            raise SnapshotError(f"Snapshot file {name} is missing or truncated")
+        if verify and _sha256(path) != info["sha256"]:
+            raise SnapshotError(f"Checksum mismatch for snapshot file {name}")
+    return manifest
+
+
+def _store_dim(vectorstore) -> Optional[int]:
+    """Dimension of the vectors already in `vectorstore`, None while it is empty."""
+    if hasattr(vectorstore, "export_rows"):
+        return vectorstore.dim
+    sample = vectorstore._collection.get(limit=1, include=["embeddings"])["embeddings"]
+    return len(sample[0]) if sample is not None and len(sample) else None
+
+
+def _check_embeddings(manifest: Dict[str, Any], vectorstore) -> None:
+    """Vectors from another embedding model would import fine and then rank garbage; refuse them."""
+    model = getattr(vectorstore.embeddings, "model", None)
+    if manifest.get("embedding_model") and model and manifest["embedding_model"] != model:
+        raise SnapshotError(
+            f"Snapshot was embedded with {manifest['embedding_model']}, the target store uses {model}"
+        )
+    dim = _store_dim(vectorstore)
+    if dim is not None and dim != manifest["dim"]:
+        raise SnapshotError(f"Snapshot vectors have {manifest['dim']} dimensions, the target store has {dim}")
+
+
+def import_snapshot(snapshot_dir: str, project: Optional[str] = None, verify: bool = True, vectorstore=None) -> Dict[str, Any]:
+    """
+    Load a snapshot into `project` (default: the project it was exported from).
+    The target project must be empty, or hold only documents of this snapshot
+    (an earlier import that did not finish); returns a summary of what was loaded.
+    """
+    started = time.monotonic()
+    manifest = read_manifest(snapshot_dir, verify=verify)
+    project = project_name(project or manifest["project"])
+    embeddings = np.load(os.path.join(snapshot_dir, "embeddings.npy"), mmap_mode="r")
+    signatures = np.load(os.path.join(snapshot_dir, "minhash.npy"), mmap_mode="r")
+    if embeddings.shape != (manifest["count"], manifest["dim"]) or signatures.shape != (manifest["count"], NUM_PERM):
+        raise SnapshotError("Snapshot arrays do not match the manifest")
+
+    # Serialize imports across workers sharing the corpus database
+    lock_path = CORPUS.path + ".import.lock"
+    with open(lock_path, "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            snapshot_hashes = {doc.get("sha256") for doc in manifest["documents"]} - {None}
+            if any(m["sha256"] not in snapshot_hashes for m in CORPUS.manifests(project)):
+                raise SnapshotError(f"Project {project} already has documents")
+            with open(os.path.join(snapshot_dir, "chunks.jsonl"), encoding="utf-8") as f:
+                rows = [json.loads(line) for line in f]
+            if len(rows) != manifest["count"]:
+                raise SnapshotError("Snapshot chunk count does not match the manifest")
+            texts = [row["text"] for row in rows]
+            metadatas = []
+            for row in rows:
+                metadata = {k: v for k, v in row["metadata"].items() if k != "doc_id"}
+                metadata["project"] = project
+                metadatas.append(metadata)
+
+            vectorstore = vectorstore or get_vectorstore(project=project)
+            _check_embeddings(manifest, vectorstore)
+            # The ids add_documents gives these chunks on upload: position within their document
+            ids = [None] * len(rows)
+            for doc in manifest["documents"]:
+                for i in range(doc["chunk_start"], doc["chunk_start"] + doc["chunk_count"]):
+                    ids[i] = chunk_id(Document(page_content=texts[i], metadata=metadatas[i]), i - doc["chunk_start"])
+            ids = [vector_id or chunk_id(Document(page_content=texts[i], metadata=metadatas[i]), i)
+                   for i, vector_id in enumerate(ids)]
+            present = existing_ids(vectorstore, ids)
+            todo = np.array([i for i, vector_id in enumerate(ids) if vector_id not in present], dtype=np.int64)
+            for start in range(0, len(todo), IMPORT_BATCH_ROWS):
+                batch = todo[start:start + IMPORT_BATCH_ROWS]
+                add_embeddings(vectorstore, [texts[i] for i in batch], np.asarray(embeddings[batch]),
+                               [metadatas[i] for i in batch], [ids[i] for i in batch])
+            for doc in manifest["documents"]:
+                start, stop = doc["chunk_start"], doc["chunk_start"] + doc["chunk_count"]
+                chunks = [Document(page_content=texts[i], metadata=dict(metadatas[i])) for i in range(start, stop)]
+                doc_id, _, created = CORPUS.add_document(doc["file_name"], chunks, doc.get("sha256"), project)
+                OUTLINES.save(index_chunks(chunks))
+                # Registered by an earlier, interrupted import (or a duplicate from before uploads
+                # were de-duplicated by content): only tables that never made it are restored
+                if created or not TABLES.document_tables(project, doc_id):
+                    # Snapshots written before tables were bundled have no "tables" entry
+                    TABLES.restore(project, doc_id, [os.path.join(snapshot_dir, "tables", t) for t in doc.get("tables", [])])
+            NEAR_DUP_INDEX.add_signatures(texts, signatures)
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+    return {
+        "project": project,
+        "documents": len(manifest["documents"]),
+        "chunks": manifest["count"],
+        "vectors_already_present": len(present),
+        "tables": sum(len(doc.get("tables", [])) for doc in manifest["documents"]),
+        "source_corpus_version": manifest["corpus_version"],
+        "elapsed_s": round(time.monotonic() - started, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export or import a project's index snapshot.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    export_cmd = sub.add_parser("export")
+    export_cmd.add_argument("out_dir")
+    export_cmd.add_argument("--project")
+    import_cmd = sub.add_parser("import")
+    import_cmd.add_argument("snapshot_dir")
+    import_cmd.add_argument("--project")
+    import_cmd.add_argument("--no-verify", action="store_true", help="skip checksum verification")
+    args = parser.parse_args()
+    if args.command == "export":
+        manifest = export_snapshot(args.out_dir, args.project)
+        print(json.dumps({k: manifest[k] for k in ("project", "corpus_version", "count", "dim")}))
+    else:
+        print(json.dumps(import_snapshot(args.snapshot_dir, args.project, verify=not args.no_verify)))
+
+
+if __name__ == "__main__":
+    main()
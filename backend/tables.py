@@ -0,0 +1,426 @@
+import json
+import os
+import re
+import shutil
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+# --- Columnar tables ---
+# CSV/XLSX uploads are stored whole, one directory per sheet, next to the
+# vector store: numeric columns as float64 .npy files (NaN = missing), text
+# columns dictionary-encoded (int32 codes .npy + a JSON list of values, -1 =
+# missing). Columns are memory-mapped on query, and filter / group-by /
+# aggregate run as numpy array operations, so a question like "total cost of
+# concrete items" is computed exactly over the full sheet instead of being
+# guessed from a 5-row preview. Tables are immutable once written.
+
+TABLE_STORE_DIR = os.getenv("TABLE_STORE_DIR") or os.path.join(os.getenv("VECTORSTORE_DIR", "/tmp/chroma_store"), "tables")
+TABULAR_EXTENSIONS = (".csv", ".xlsx")
+# Object columns are treated as numbers when this share of non-empty values parses as one ("$1,200.50")
+NUMERIC_PARSE_RATIO = 0.95
+TOP_VALUES = 12
+MAX_RESULT_ROWS = 50
+# Group-by keys up to this many combinations are counted densely (bincount) instead of sorted
+DENSE_GROUP_LIMIT = 4_000_000
+FILTER_OPS = ("eq", "ne", "contains", "in", "gt", "gte", "lt", "lte")
+AGGREGATES = ("sum", "count", "avg", "min", "max")
+# Words that say nothing about which table is meant, so never count as a column match
+_GATE_STOPWORDS = {
+    "total", "sum", "how", "many", "much", "count", "number", "average", "avg", "mean",
+    "max", "maximum", "min", "minimum", "highest", "lowest", "largest", "smallest", "per", "by", "each",
+    "a", "an", "and", "at", "for", "if", "in", "is", "it", "no", "of", "on", "or", "the", "to", "what", "with",
+}
+
+
+class TableQueryError(ValueError):
+    pass
+
+
+# --- Ingest ---
+
+def is_tabular(file_path: str) -> bool:
+    return os.path.splitext(file_path)[1].lower() in TABULAR_EXTENSIONS
+
+
+def read_tabular(file_path: str) -> List[Tuple[str, Any]]:
+    """[(sheet name, DataFrame)] for a CSV ("main table") or every sheet of an XLSX file."""
+    import pandas as pd
+    if file_path.lower().endswith(".csv"):
+        return [("main table", pd.read_csv(file_path))]
+    excel = pd.ExcelFile(file_path)
+    return [(sheet, excel.parse(sheet)) for sheet in excel.sheet_names]
+
+
+def table_chunks(frames: List[Tuple[str, Any]], file_name: str, file_type: str) -> List[Document]:
+    """One retrieval chunk per table: columns, row count and a short preview."""
+    docs = []
+    for sheet, data in frames:
+        columns = ", ".join(str(c) for c in data.columns)
+        preview = data.head(5).to_string(index=False)
+        header = f"Sheet: {sheet}\n" if file_type == "xlsx" else ""
+        summary = (
+            f"{header}Table columns: {columns}\nRows: {len(data)} (full table available for exact totals and filters)\n"
+            f"Preview (first 5 rows):\n{preview}"
+        )
+        docs.append(Document(page_content=summary, metadata={
+            "file_type": file_type,
+            "file_name": file_name,
+            "source_location": sheet
+        }))
+    return docs
+
+
+def _as_number(column) -> Optional[np.ndarray]:
+    import pandas as pd
+    if pd.api.types.is_bool_dtype(column) or pd.api.types.is_numeric_dtype(column):
+        return column.astype("float64").to_numpy()
+    if not (pd.api.types.is_object_dtype(column) or pd.api.types.is_string_dtype(column)):
+        return None
+    present = column.dropna()
+    if present.empty:
+        return None
+    parsed = pd.to_numeric(column.astype(str).str.replace(r"[,\s$€£%]", "", regex=True), errors="coerce")
+    if parsed[column.notna()].notna().mean() < NUMERIC_PARSE_RATIO:
+        return None
+    return parsed.astype("float64").to_numpy()
+
+
+def _write_table(path: str, file_name: str, sheet: str, data) -> Dict[str, Any]:
+    import pandas as pd
+    tmp = path + ".partial"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    columns = []
+    for i, name in enumerate(data.columns):
+        column = data[name]
+        entry: Dict[str, Any] = {"name": str(name), "file": f"c{i}.npy"}
+        values = _as_number(column)
+        if values is not None:
+            np.save(os.path.join(tmp, entry["file"]), values)
+            finite = values[~np.isnan(values)]
+            entry.update(kind="number", min=float(finite.min()) if finite.size else None,
+                         max=float(finite.max()) if finite.size else None)
+        else:
+            if pd.api.types.is_datetime64_any_dtype(column):
+                column = column.dt.strftime("%Y-%m-%d")
+            codes, uniques = pd.factorize(column.astype("string"), use_na_sentinel=True)
+            np.save(os.path.join(tmp, entry["file"]), codes.astype(np.int32))
+            with open(os.path.join(tmp, f"c{i}.values.json"), "w", encoding="utf-8") as f:
+                json.dump([str(v) for v in uniques], f)
+            counts = np.bincount(codes[codes >= 0], minlength=len(uniques)) if len(uniques) else np.zeros(0, int)
+            top = np.argsort(-counts, kind="stable")[:TOP_VALUES]
+            entry.update(kind="text", distinct=len(uniques), top_values=[str(uniques[j]) for j in top])
+        columns.append(entry)
+    meta = {"file_name": file_name, "sheet": sheet, "rows": len(data), "columns": columns}
+    with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(tmp, path)
+    return meta
+
+
+# --- Store ---
+
+class Table:
+    def __init__(self, table_id: str, path: str, meta: Dict[str, Any]):
+        self.table_id = table_id
+        self.path = path
+        self.meta = meta
+        self.rows = meta["rows"]
+        self.columns = {c["name"]: c for c in meta["columns"]}
+        self._arrays: Dict[str, np.ndarray] = {}
+        self._values: Dict[str, List[str]] = {}
+        self._lowered: Dict[str, Any] = {}
+
+    def array(self, name: str) -> np.ndarray:
+        arr = self._arrays.get(name)
+        if arr is None:
+            arr = np.load(os.path.join(self.path, self.columns[name]["file"]), mmap_mode="r")
+            self._arrays[name] = arr
+        return arr
+
+    def values(self, name: str) -> List[str]:
+        """Dictionary of a text column (code -> value)."""
+        vals = self._values.get(name)
+        if vals is None:
+            with open(os.path.join(self.path, self.columns[name]["file"].replace(".npy", ".values.json")), encoding="utf-8") as f:
+                vals = json.load(f)
+            self._values[name] = vals
+        return vals
+
+    def lowered(self, name: str):
+        """Lower-cased dictionary of a text column as a pandas Series, for vectorized string matching."""
+        series = self._lowered.get(name)
+        if series is None:
+            import pandas as pd
+            series = pd.Series(self.values(name), dtype="object").str.lower()
+            self._lowered[name] = series
+        return series
+
+    def describe(self) -> Dict[str, Any]:
+        """Schema as shown to the query planner."""
+        columns = []
+        for c in self.meta["columns"]:
+            if c["kind"] == "number":
+                columns.append({"name": c["name"], "type": "number", "min": c["min"], "max": c["max"]})
+            else:
+                columns.append({"name": c["name"], "type": "text", "distinct": c["distinct"], "examples": c["top_values"]})
+        return {"table": self.table_id, "file_name": self.meta["file_name"], "sheet": self.meta["sheet"],
+                "rows": self.rows, "columns": columns}
+
+
+class TableStore:
+    def __init__(self, root: str = TABLE_STORE_DIR):
+        self.root = root
+        self._lock = threading.Lock()
+        self._tables: Dict[str, Table] = {}
+
+    def save(self, project: str, doc_id: str, file_name: str, frames: List[Tuple[str, Any]]) -> List[str]:
+        """Write every sheet of an uploaded file; returns the table ids."""
+        ids = []
+        for i, (sheet, data) in enumerate(frames):
+            table_id = f"{doc_id}-{i}"
+            _write_table(os.path.join(self.root, project, table_id), file_name, sheet, data)
+            ids.append(table_id)
+        return ids
+
+    def tables(self, project: str, file_name: Optional[str] = None) -> List[Table]:
+        project_dir = os.path.join(self.root, project)
+        if not os.path.isdir(project_dir):
+            return []
+        found = []
+        for table_id in sorted(os.listdir(project_dir)):
+            if table_id.endswith(".partial"):
+                continue
+            key = f"{project}/{table_id}"
+            table = self._tables.get(key)
+            if table is None:
+                path = os.path.join(project_dir, table_id)
+                try:
+                    with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+                        meta = json.load(f)
+                except (OSError, ValueError):
+                    continue
+                with self._lock:
+                    table = self._tables.setdefault(key, Table(table_id, path, meta))
+            if file_name is None or table.meta["file_name"] == file_name:
+                found.append(table)
+        return found
+
+    def document_tables(self, project: str, doc_id: str) -> List[Table]:
+        """Tables of one uploaded file, in sheet order."""
+        tables = [t for t in self.tables(project) if t.table_id.rsplit("-", 1)[0] == doc_id]
+        return sorted(tables, key=lambda t: int(t.table_id.rsplit("-", 1)[1]))
+
+    def restore(self, project: str, doc_id: str, sources: List[str]) -> List[str]:
+        """Copy table directories (e.g. from a snapshot) in for a registered document; returns the table ids."""
+        ids = []
+        for i, src in enumerate(sources):
+            table_id = f"{doc_id}-{i}"
+            path = os.path.join(self.root, project, table_id)
+            tmp = path + ".partial"
+            shutil.rmtree(tmp, ignore_errors=True)
+            shutil.copytree(src, tmp)
+            os.replace(tmp, path)
+            ids.append(table_id)
+        return ids
+
+
+TABLES = TableStore()
+
+
+# --- Query engine ---
+
+def _filter_mask(table: Table, flt: Dict[str, Any]) -> np.ndarray:
+    name, op, value = flt.get("column"), flt.get("op"), flt.get("value")
+    if name not in table.columns:
+        raise TableQueryError(f"Unknown column {name!r}")
+    if op not in FILTER_OPS:
+        raise TableQueryError(f"Unsupported filter op {op!r}")
+    arr = table.array(name)
+    if table.columns[name]["kind"] == "number":
+        try:
+            target = [float(v) for v in value] if op == "in" else float(value)
+        except (TypeError, ValueError):
+            raise TableQueryError(f"Filter on numeric column {name!r} needs a number")
+        if op == "in":
+            return np.isin(arr, target)
+        compare = {"eq": np.equal, "ne": np.not_equal, "gt": np.greater, "gte": np.greater_equal,
+                   "lt": np.less, "lte": np.less_equal}.get(op)
+        if compare is None:
+            raise TableQueryError(f"Op {op!r} does not apply to numeric column {name!r}")
+        return compare(arr, target)
+    # Text: evaluate the predicate once per distinct value, then select rows by code
+    dictionary = table.lowered(name)
+    if op == "contains":
+        hits = dictionary.str.contains(str(value).lower(), regex=False).to_numpy(dtype=bool)
+    elif op in ("eq", "ne", "in"):
+        values = value if op == "in" and isinstance(value, list) else [value]
+        hits = dictionary.isin([str(v).lower() for v in values]).to_numpy(dtype=bool)
+    else:
+        raise TableQueryError(f"Op {op!r} does not apply to text column {name!r}")
+    mask = np.isin(arr, np.flatnonzero(hits).astype(np.int32))
+    return ~mask & (arr >= 0) if op == "ne" else mask
+
+
+def _aggregate(fn: str, values: Optional[np.ndarray], groups: np.ndarray, n_groups: int) -> np.ndarray:
+    if fn == "count" and values is None:
+        return np.bincount(groups, minlength=n_groups).astype(np.float64)
+    present = ~np.isnan(values)
+    groups, values = groups[present], values[present]
+    counts = np.bincount(groups, minlength=n_groups)
+    if fn == "count":
+        return counts.astype(np.float64)
+    if fn in ("sum", "avg"):
+        sums = np.bincount(groups, weights=values, minlength=n_groups)
+        if fn == "sum":
+            return sums
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)
+    # min / max: unbuffered in-place reduction per group, no sort needed
+    result = np.full(n_groups, np.inf if fn == "min" else -np.inf)
+    (np.minimum if fn == "min" else np.maximum).at(result, groups, values)
+    result[counts == 0] = np.nan
+    return result
+
+
+def run_query(table: Table, spec: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Execute {"filters": [{"column", "op", "value"}], "group_by": [columns],
+    "aggregates": [{"fn", "column"}], "order": "desc"|"asc", "limit": n}
+    over the whole table.
+    """
+    mask = np.ones(table.rows, dtype=bool)
+    for flt in spec.get("filters") or []:
+        mask &= _filter_mask(table, flt)
+    rows = np.flatnonzero(mask)
+
+    aggregates = spec.get("aggregates") or [{"fn": "count", "column": None}]
+    for agg in aggregates:
+        if agg.get("fn") not in AGGREGATES:
+            raise TableQueryError(f"Unsupported aggregate {agg.get('fn')!r}")
+        column = agg.get("column")
+        if column is not None and column not in table.columns:
+            raise TableQueryError(f"Unknown column {column!r}")
+        if agg["fn"] != "count" and (column is None or table.columns[column]["kind"] != "number"):
+            raise TableQueryError(f"{agg['fn']} needs a numeric column")
+
+    group_by = spec.get("group_by") or []
+    for name in group_by:
+        if name not in table.columns:
+            raise TableQueryError(f"Unknown column {name!r}")
+    if group_by and len(rows):
+        # Factorize each key column (text columns already are), combine the factors into one integer key
+        levels, factors = [], []
+        for name in group_by:
+            column = np.asarray(table.array(name))[rows]
+            if table.columns[name]["kind"] == "text":
+                levels.append(np.arange(-1, len(table.values(name))))
+                factors.append(column.astype(np.int64) + 1)
+            else:
+                values, inverse = np.unique(column, return_inverse=True)
+                levels.append(values)
+                factors.append(inverse.reshape(-1))
+        dims = [len(v) for v in levels]
+        combined = np.ravel_multi_index(factors, dims) if len(factors) > 1 else factors[0]
+        if int(np.prod(dims, dtype=np.float64)) <= DENSE_GROUP_LIMIT:
+            group_keys = np.flatnonzero(np.bincount(combined, minlength=int(np.prod(dims))))
+            remap = np.empty(int(np.prod(dims)), dtype=np.int64)
+            remap[group_keys] = np.arange(len(group_keys))
+            groups = remap[combined]
+        else:
+            group_keys, groups = np.unique(combined, return_inverse=True)
+            groups = groups.reshape(-1)
+        key_parts = np.unravel_index(group_keys, dims)
+        n_groups = len(group_keys)
+    elif group_by:
+        groups, n_groups = np.zeros(0, dtype=np.int64), 0
+    else:
+        groups, n_groups = np.zeros(len(rows), dtype=np.int64), 1
+
+    labels = [f"{a['fn']}({a.get('column') or '*'})" for a in aggregates]
+    results = [
+        _aggregate(a["fn"], None if a.get("column") is None else np.asarray(table.array(a["column"]), dtype=np.float64)[rows],
+                   groups, n_groups)
+        for a in aggregates
+    ]
+    order = np.arange(n_groups)
+    if group_by:
+        # Largest first by the first aggregate unless asked otherwise; NaN last
+        first = np.nan_to_num(results[0], nan=-np.inf if spec.get("order", "desc") == "desc" else np.inf)
+        order = np.argsort(-first if spec.get("order", "desc") == "desc" else first, kind="stable")
+    limit = max(1, min(int(spec.get("limit") or MAX_RESULT_ROWS), MAX_RESULT_ROWS))
+
+    out_rows = []
+    for g in order[:limit]:
+        row = {}
+        for j, name in enumerate(group_by):
+            key = levels[j][key_parts[j][g]]
+            if table.columns[name]["kind"] == "text":
+                row[name] = table.values(name)[int(key)] if key >= 0 else None
+            else:
+                row[name] = None if np.isnan(key) else float(key)
+        for label, values in zip(labels, results):
+            row[label] = None if np.isnan(values[g]) else round(float(values[g]), 6)
+        out_rows.append(row)
+    return {"matched_rows": int(len(rows)), "groups": int(n_groups), "rows": out_rows}
+
+
+def _fmt(value) -> str:
+    if isinstance(value, float):
+        return f"{value:,.2f}".rstrip("0").rstrip(".") if value != int(value) else f"{int(value):,}"
+    return str(value)
+
+
+def format_result(table: Table, spec: Dict[str, Any], result: Dict[str, Any]) -> str:
+    """Computed result as a context block for the answering LLM."""
+    filters = "; ".join(f"{f['column']} {f['op']} {f['value']!r}" for f in spec.get("filters") or []) or "none"
+    lines = [
+        f"[COMPUTED TABLE RESULT | {table.meta['file_name']} / {table.meta['sheet']}]",
+        f"Exact values computed over all {table.rows:,} rows; use these numbers as given.",
+        f"Filters: {filters}",
+        f"Group by: {', '.join(spec.get('group_by') or []) or 'none'}",
+        f"Matched rows: {result['matched_rows']:,}",
+    ]
+    if result["groups"] > len(result["rows"]):
+        lines.append(f"Showing {len(result['rows'])} of {result['groups']} groups")
+    for row in result["rows"]:
+        lines.append(", ".join(f"{k} = {_fmt(v)}" for k, v in row.items()))
+    return "\n".join(lines)
+
+
+def _words(text: str) -> set:
+    # Crude singular form, so "costs" matches a "Cost" column
+    return {w[:-1] if len(w) > 3 and w.endswith("s") else w for w in re.findall(r"[a-z0-9]+", text.lower())}
+
+
+def might_be_table_question(question: str, tables: List[Table]) -> bool:
+    """Cheap gate before spending an LLM call on planning: the question must name one of the columns."""
+    words = _words(question) - _GATE_STOPWORDS
+    if not words:
+        return False
+    return any(words & _words(c["name"]) for table in tables for c in table.meta["columns"])
+
+
+def answer_table_question(question: str, project: str, file_name: Optional[str] = None) -> Optional[str]:
+    """
+    Plan and run a table query for the question; returns the computed result as
+    context text, or None when no table applies (or the plan is unusable).
+    """
+    from rag_chain import plan_table_query
+
+    tables = TABLES.tables(project, file_name)
+    if not tables or not might_be_table_question(question, tables):
+        return None
+    by_id = {t.table_id: t for t in tables}
+    spec = plan_table_query(question, [t.describe() for t in tables])
+    table = by_id.get((spec or {}).get("table"))
+    if table is None:
+        return None
+    try:
+        return format_result(table, spec, run_query(table, spec))
+    except (TableQueryError, TypeError, ValueError) as e:
+        print("TABLE QUERY REJECTED", e, spec)
+        return None
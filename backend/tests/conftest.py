@@ -0,0 +1,11 @@
+import os
+import sys
+import tempfile
+
+# Modules read their storage paths from the environment at import time; point them at a scratch dir
+_STATE_DIR = tempfile.mkdtemp(prefix="backend-tests-")
+os.environ.setdefault("VECTORSTORE_DIR", _STATE_DIR)
+os.environ.setdefault("CORPUS_STATE_DB", os.path.join(_STATE_DIR, "corpus_state.db"))
+os.environ.setdefault("TABLE_STORE_DIR", os.path.join(_STATE_DIR, "tables"))
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,101 @@
+import asyncio
+import json
+
+import admission
+from admission import AdmissionControlMiddleware, EndpointLimit
+
+
+async def _ok_app(scope, receive, send):
+    while (await receive()).get("more_body"):
+        pass
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"ok"})
+
+
+def _call(app, path, headers=(), body=b""):
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "path": path, "method": "POST", "headers": list(headers)}
+    asyncio.run(app(scope, receive, send))
+    start = sent[0]
+    return start["status"], dict(start["headers"]), b"".join(m.get("body", b"") for m in sent[1:])
+
+
+def test_unlimited_path_passes_through():
+    assert _call(AdmissionControlMiddleware(_ok_app), "/about")[0] == 200
+
+
+def test_malformed_content_length_is_rejected_with_400(monkeypatch):
+    monkeypatch.setitem(admission.BODY_LIMITS, "/upload", 100)
+    app = AdmissionControlMiddleware(_ok_app)
+    for value in (b"abc", b"-5"):
+        status, _, body = _call(app, "/upload", [(b"content-length", value)])
+        assert status == 400
+        assert json.loads(body) == {"error": "Invalid Content-Length header."}
+
+
+def test_declared_oversized_body_is_rejected_with_413(monkeypatch):
+    monkeypatch.setitem(admission.BODY_LIMITS, "/upload", 100)
+    status, _, _ = _call(AdmissionControlMiddleware(_ok_app), "/upload", [(b"content-length", b"101")])
+    assert status == 413
+
+
+def test_streamed_oversized_body_is_rejected_with_413(monkeypatch):
+    monkeypatch.setitem(admission.BODY_LIMITS, "/upload", 100)
+    status, _, _ = _call(AdmissionControlMiddleware(_ok_app), "/upload", body=b"x" * 101)
+    assert status == 413
+
+
+def test_full_queue_is_rejected_with_429(monkeypatch):
+    limit = EndpointLimit("test", 1, 0, 1.0)
+    monkeypatch.setitem(admission.ENDPOINT_LIMITS, "/search", limit)
+    limit.active = 1
+    status, headers, _ = _call(AdmissionControlMiddleware(_ok_app), "/search")
+    assert status == 429
+    assert headers[b"retry-after"] == str(admission.RETRY_AFTER_SECONDS).encode()
+    assert limit.rejected == 1
+
+
+def test_queue_timeout_is_rejected_with_503(monkeypatch):
+    limit = EndpointLimit("test", 1, 1, 0.05)
+    monkeypatch.setitem(admission.ENDPOINT_LIMITS, "/search", limit)
+    limit.semaphore = asyncio.Semaphore(0)
+    status, _, _ = _call(AdmissionControlMiddleware(_ok_app), "/search")
+    assert status == 503
+    assert limit.timed_out == 1 and limit.queued == 0
+
+
+def test_queue_timeouts_do_not_shrink_capacity(monkeypatch):
+    limit = EndpointLimit("test", 2, 8, 0.02)
+    monkeypatch.setitem(admission.ENDPOINT_LIMITS, "/search", limit)
+    app = AdmissionControlMiddleware(_ok_app)
+
+    async def main():
+        # Hold both permits, let queued requests time out while permits come back right at the deadline
+        await limit.semaphore.acquire()
+        await limit.semaphore.acquire()
+        loop = asyncio.get_running_loop()
+        loop.call_later(0.02, limit.semaphore.release)
+        loop.call_later(0.02, limit.semaphore.release)
+        sent = []
+
+        async def receive():
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {"type": "http", "path": "/search", "method": "GET", "headers": []}
+        await asyncio.gather(*(app(scope, receive, send) for _ in range(4)))
+        return [m["status"] for m in sent if m["type"] == "http.response.start"]
+
+    statuses = asyncio.run(main())
+    assert len(statuses) == 4 and set(statuses) <= {200, 503}
+    assert limit.active == 0 and limit.queued == 0
+    assert limit.semaphore._value == limit.max_concurrent
@@ -0,0 +1,75 @@
+import numpy as np
+
+from chunk_store import ChunkList, ChunkStore
+
+
+def _store():
+    store = ChunkStore()
+    store.extend([
+        ("Payment within 30 days.", {"file_name": "a.pdf", "page": 1, "relevance": 0.75}),
+        ("Scope of works – Ü.", {"file_name": "a.pdf", "page": 2, "tags": ["scope"]}),
+        ("Drawing list.", {"file_name": "b.dwg", "relevance": 0.1}),
+    ])
+    return store
+
+
+def test_texts_and_metadata_round_trip():
+    store = _store()
+    assert store.text(1) == "Scope of works – Ü."
+    assert store.metadata(0) == {"file_name": "a.pdf", "page": 1, "relevance": 0.75}
+    assert store.metadata(2) == {"file_name": "b.dwg", "relevance": 0.1}
+    assert store.sizes(3).tolist() == [len(store.text(i).encode("utf-8")) for i in range(3)]
+
+
+def test_non_scalar_values_are_copied_per_read():
+    store = _store()
+    store.metadata(1)["tags"].append("changed")
+    assert store.metadata(1)["tags"] == ["scope"]
+
+
+def test_float_values_get_a_float_column():
+    store = _store()
+    assert store._columns["relevance"].typecode == "d"
+    assert store._columns["file_name"].typecode == "I"
+    np.testing.assert_array_equal(store.numeric("relevance", 3), [0.75, np.nan, 0.1])
+    np.testing.assert_array_equal(store.numeric("page", 3), [1.0, 2.0, np.nan])
+    np.testing.assert_array_equal(store.numeric("file_name", 3), [np.nan] * 3)
+
+
+def test_float_column_converts_when_other_values_arrive():
+    store = _store()
+    store.append("Legacy chunk.", {"relevance": "high"})
+    assert store._columns["relevance"].typecode == "I"
+    assert [store.metadata(i).get("relevance") for i in range(4)] == [0.75, None, 0.1, "high"]
+    np.testing.assert_array_equal(store.numeric("relevance", 4), [0.75, np.nan, 0.1, np.nan])
+
+
+def test_values_keep_their_type():
+    store = ChunkStore()
+    store.extend([("a", {"v": 1}), ("b", {"v": True}), ("c", {"v": "1"})])
+    assert [store.metadata(i)["v"] for i in range(3)] == [1, True, "1"]
+
+
+def test_list_is_a_stable_snapshot():
+    store = _store()
+    chunks = ChunkList(store, store.count)
+    store.append("Later upload.", {"file_name": "a.pdf"})
+    assert len(chunks) == 3
+    assert [c.page_content for c in chunks.where("file_name", "a.pdf")] == [store.text(0), store.text(1)]
+
+
+def test_where_group_by_and_take():
+    store = _store()
+    chunks = ChunkList(store, store.count)
+    groups = chunks.group_by("file_name")
+    assert list(groups) == ["a.pdf", "b.dwg"]
+    assert [c.metadata.get("page") for c in groups["a.pdf"]] == [1, 2]
+    assert list(chunks.group_by("relevance")) == [0.75, None, 0.1]
+    assert len(chunks.where("relevance", 0.1)) == 1
+    assert len(chunks.where("relevance", "0.1")) == 0
+    assert len(chunks.where("missing", 1)) == 0
+    subset = chunks.take(np.array([2, 0]))
+    assert [c.page_content for c in subset] == [store.text(2), store.text(0)]
+    assert subset.numeric("relevance").tolist() == [0.1, 0.75]
+    assert [c.page_content for c in chunks[1:]] == [store.text(1), store.text(2)]
+    assert chunks[-1].page_content == store.text(2)
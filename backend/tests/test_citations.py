@@ -0,0 +1,60 @@
+from citations import AhoCorasick, index_chunks, normalize, quote_fragments, verify_citations
+
+
+class Chunk:
+    def __init__(self, text, **metadata):
+        self.page_content = text
+        self.metadata = metadata
+
+
+CHUNKS = [
+    "ARTICLE 4 PAYMENT\nThe Employer shall pay each invoice\nwithin 30 days of receipt.",
+    "Retention of 5% applies.\n\n12.1 Delay damages\nThe Contractor shall pay delay damages of EUR 1,000 per day.",
+]
+
+
+def test_normalize_maps_back_to_original_positions():
+    text = "The  “Employer”\nshall Pay"
+    norm, positions = normalize(text)
+    assert norm == 'the "employer" shall pay'
+    assert text[positions[norm.index("shall")]:].startswith("shall")
+    assert len(positions) == len(norm)
+
+
+def test_quote_fragments_skip_elisions_and_short_pieces():
+    assert quote_fragments("The Employer shall pay ... within 30 days. [...] ok") == [
+        "the employer shall pay", "within 30 days",
+    ]
+    assert quote_fragments(None) == []
+
+
+def test_aho_corasick_finds_overlapping_patterns():
+    matcher = AhoCorasick(["he", "she", "hers"])
+    found = {(matcher.patterns[pid], end) for pid, end in matcher.search("ushers")}
+    assert found == {("she", 4), ("he", 4), ("hers", 6)}
+
+
+def test_index_chunks_carries_headings_and_lines():
+    outlines = list(index_chunks([Chunk(t, source_location="page 1") for t in CHUNKS]).values())
+    assert outlines[0]["headings"] == [[0, "ARTICLE 4 PAYMENT"]]
+    assert outlines[1]["heading"] == "ARTICLE 4 PAYMENT"
+    assert outlines[1]["line_start"] == 4
+
+
+def test_verify_citations_flags_and_locates_quotes():
+    answer = {"citations": [
+        {"chunk": "CHUNK 1", "quote": "delay damages of EUR 1,000 per day"},
+        {"chunk": "CHUNK 1", "quote": "the Employer shall pay ... within 30 days"},
+        {"chunk": "CHUNK 2", "quote": "liquidated damages are capped at 10%"},
+        "not a citation",
+    ]}
+    result = verify_citations(answer, CHUNKS)
+    first, second, third, _ = result["citations"]
+    assert first["verified"] and first["source"] == {"chunk": "CHUNK 2", "heading": "12.1 Delay damages", "line": 4}
+    assert second["verified"] and second["source"] == {"chunk": "CHUNK 1", "heading": "ARTICLE 4 PAYMENT", "line": 2}
+    assert third["verified"] is False and "source" not in third
+    assert result["verification"] == {"verified": 2, "unverified": 2}
+
+
+def test_answer_without_citations_is_unchanged():
+    assert verify_citations({"answer": "x"}, CHUNKS) == {"answer": "x"}
@@ -0,0 +1,51 @@
+import os
+import subprocess
+import sys
+
+from langchain_core.documents import Document
+
+from corpus_state import CorpusState
+
+
+def _chunks(*texts):
+    return [Document(page_content=t, metadata={"file_name": "c.pdf", "file_type": "pdf"}) for t in texts]
+
+
+def test_same_content_is_registered_once_per_project(tmp_path):
+    corpus = CorpusState(str(tmp_path / "state.db"))
+    doc_id, version, created = corpus.add_document("c.pdf", _chunks("a", "b"), sha256="h1")
+    assert (version, created) == (1, True)
+    assert corpus.add_document("copy.pdf", _chunks("a", "b"), sha256="h1") == (doc_id, 1, False)
+    other_id, other_version, created = corpus.add_document("c.pdf", _chunks("a", "b"), sha256="h1", project="site-b")
+    assert created and other_id != doc_id and other_version == 1
+    assert len(corpus.manifests("default")) == 1
+    assert len(corpus.chunks("default")) == 2
+    assert corpus.find_document("h1")["doc_id"] == doc_id
+    assert corpus.find_document("h2") is None
+
+
+def test_versions_are_per_project_and_snapshots_refresh(tmp_path):
+    path = str(tmp_path / "state.db")
+    writer, reader = CorpusState(path), CorpusState(path)
+    writer.add_document("a.pdf", _chunks("a"), sha256="ha")
+    version, chunks = reader.snapshot("default")
+    assert version == 1 and [c.page_content for c in chunks] == ["a"]
+    writer.add_document("b.pdf", _chunks("b"), sha256="hb", project="other")
+    assert reader.snapshot("default")[0] == 1
+    writer.add_document("c.pdf", _chunks("c1", "c2"), sha256="hc")
+    version, refreshed = reader.snapshot("default")
+    assert version == 2 and [c.page_content for c in refreshed] == ["a", "c1", "c2"]
+    # Older snapshots keep their length
+    assert len(chunks) == 1
+    assert reader.version() == 3
+
+
+def test_database_defaults_to_the_vectorstore_dir(tmp_path):
+    env = dict(os.environ, VECTORSTORE_DIR=str(tmp_path))
+    env.pop("CORPUS_STATE_DB", None)
+    out = subprocess.run(
+        [sys.executable, "-c", "import corpus_state; print(corpus_state.CORPUS_STATE_DB)"],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))), env=env,
+        capture_output=True, text=True, check=True,
+    ).stdout.strip()
+    assert out == os.path.join(str(tmp_path), "corpus_state.db")
@@ -0,0 +1,35 @@
+import hashlib
+
+from dedup import NearDuplicateIndex, filter_near_duplicates
+
+CLAUSE = "The Contractor shall submit the monthly progress report to the Engineer within seven days of the end of each month."
+
+
+def test_near_duplicates_keep_first_occurrence():
+    index = NearDuplicateIndex()
+    texts = [CLAUSE, "  " + CLAUSE.upper().replace(",", ""), "Payment is due within 30 days of the invoice date.", CLAUSE]
+    assert filter_near_duplicates(texts, index) == [texts[0], texts[2]]
+
+
+def test_signature_matches_registered_signature():
+    index = NearDuplicateIndex()
+    registered = index.add(CLAUSE)
+    assert index.signature(CLAUSE) == registered
+
+
+def test_signature_does_not_register_unknown_texts():
+    index = NearDuplicateIndex(lazy_cache_size=2)
+    for i in range(10):
+        index.signature(f"{CLAUSE} Revision {i}.")
+    assert len(index) == 0
+    assert len(index._lazy) == 2
+
+
+def test_lazy_cache_keeps_recently_used_signatures():
+    index = NearDuplicateIndex(lazy_cache_size=2)
+    a, b, c = (f"{CLAUSE} {suffix}" for suffix in "ABC")
+    index.signature(a)
+    index.signature(b)
+    index.signature(a)
+    index.signature(c)
+    assert list(index._lazy) == [hashlib.sha1(t.encode("utf-8")).hexdigest() for t in (a, c)]
@@ -0,0 +1,62 @@
+import threading
+import time
+
+from langchain_core.documents import Document
+
+import insights
+from corpus_state import CORPUS
+
+
+def _fake_compute(calls):
+    def compute(chunks):
+        calls.append(threading.current_thread().name)
+        return {"file_name": chunks[0].metadata.get("file_name"), "summary": "s", "highlights": [], "risks": []}
+    return compute
+
+
+def test_queued_precompute_is_taken_over_by_the_request(monkeypatch):
+    calls = []
+    monkeypatch.setattr(insights, "compute_document_insights", _fake_compute(calls))
+    CORPUS.add_document("queued.pdf", [Document(page_content="text", metadata={"file_name": "queued.pdf"})], sha256="queued", project="insights-a")
+    chunks = CORPUS.snapshot("insights-a")[1]
+    doc_id = chunks[0].metadata["doc_id"]
+
+    # Occupy every insight worker so the document's job stays queued
+    release = threading.Event()
+    blockers = [insights.INSIGHTS_EXECUTOR.submit(release.wait, 5) for _ in range(insights.INSIGHTS_EXECUTOR._max_workers)]
+    try:
+        queued = insights.schedule_document_insights(doc_id, "insights-a", chunks)
+        started = time.monotonic()
+        result = insights.document_insights("insights-a", chunks)
+        assert time.monotonic() - started < 1
+    finally:
+        release.set()
+        for blocker in blockers:
+            blocker.result()
+    assert result[0]["file_name"] == "queued.pdf"
+    assert queued.cancelled()
+    assert calls == [threading.current_thread().name]
+    assert CORPUS.insights([doc_id])[doc_id]["summary"] == "s"
+    assert doc_id not in insights._inflight
+
+
+def test_running_precompute_is_joined(monkeypatch):
+    calls, running, release = [], threading.Event(), threading.Event()
+    compute = _fake_compute(calls)
+
+    def slow(chunks):
+        running.set()
+        release.wait(5)
+        return compute(chunks)
+
+    monkeypatch.setattr(insights, "compute_document_insights", slow)
+    CORPUS.add_document("running.pdf", [Document(page_content="text", metadata={"file_name": "running.pdf"})], sha256="running", project="insights-b")
+    chunks = CORPUS.snapshot("insights-b")[1]
+    doc_id = chunks[0].metadata["doc_id"]
+
+    job = insights.schedule_document_insights(doc_id, "insights-b", chunks)
+    assert running.wait(5)
+    threading.Timer(0.1, release.set).start()
+    result = insights.document_insights("insights-b", chunks)
+    assert result == [job.result()]
+    assert len(calls) == 1 and calls[0].startswith("insights")
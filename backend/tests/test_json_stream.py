@@ -0,0 +1,88 @@
+from typing import List, Optional
+
+from pydantic import BaseModel
+
+from json_stream import StreamingJSONParser, collect_sections
+
+
+class Risk(BaseModel):
+    title: str
+    severity: str
+
+
+class Report(BaseModel):
+    summary: str
+    risks: List[Risk]
+    score: Optional[int] = None
+
+
+def _chunks(text: str, size: int = 7):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def test_parser_reports_members_and_items_as_they_close():
+    parser = StreamingJSONParser()
+    events = []
+    for chunk in _chunks('Sure:\n```json\n{"summary": "a, \\"b\\"", "risks": [{"title": "x"}, 2], "n": 1}```'):
+        events.extend(parser.feed(chunk))
+    assert events == [
+        ("section", "summary", 'a, "b"'),
+        ("item", "risks", {"title": "x"}),
+        ("item", "risks", 2),
+        ("section", "risks", [{"title": "x"}, 2]),
+        ("section", "n", 1),
+    ]
+    assert parser.done
+
+
+def test_truncated_stream_keeps_completed_sections_and_items():
+    text = '{"summary": "ok", "risks": [{"title": "Late payment", "severity": "high"}, {"title": "Sco'
+    sections, partial = collect_sections(_chunks(text), Report)
+    assert sections == {"summary": "ok"}
+    assert partial == {"risks": [Risk(title="Late payment", severity="high")]}
+
+
+def test_invalid_items_are_dropped_and_unknown_keys_ignored():
+    text = '{"summary": "ok", "risks": [{"title": "A", "severity": "low"}, {"title": "B"}], "extra": 1}'
+    sections, partial = collect_sections([text], Report)
+    assert sections == {"summary": "ok", "risks": [Risk(title="A", severity="low")]}
+    assert partial == {}
+
+
+def test_stream_error_after_output_returns_what_was_parsed():
+    def chunks():
+        yield '{"summary": "ok", '
+        raise ConnectionError("stream reset")
+
+    sections, _ = collect_sections(chunks(), Report)
+    assert sections == {"summary": "ok"}
+
+
+def test_stream_error_before_output_is_raised():
+    def chunks():
+        raise ConnectionError("stream reset")
+        yield
+
+    try:
+        collect_sections(chunks(), Report)
+    except ConnectionError:
+        pass
+    else:
+        raise AssertionError("expected ConnectionError")
+
+
+def test_chunk_boundaries_do_not_change_events():
+    text = '```json\n{"summary": "x{[,]}\\"", "risks": [{"a": [1, 2]}, "s,t", 3], "k": {"n": [4]}}\n```'
+    expected = StreamingJSONParser().feed(text)
+    for size in (1, 2, 3, 5, 11):
+        parser = StreamingJSONParser()
+        events = [e for chunk in _chunks(text, size) for e in parser.feed(chunk)]
+        assert events == expected
+
+
+def test_parser_keeps_only_the_open_member():
+    parser = StreamingJSONParser()
+    parser.feed('{"a": "' + "x" * 1000 + '", ')
+    for i in range(200):
+        parser.feed(f'"k{i}": {i}, ')
+    assert sum(map(len, parser._chunks)) < 20
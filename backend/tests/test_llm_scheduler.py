@@ -0,0 +1,136 @@
+import threading
+import time
+
+import pytest
+
+import llm_scheduler
+from llm_scheduler import BACKGROUND, INTERACTIVE, LLMRateLimitError, LLMScheduler, LLMUnavailableError
+
+
+class Chunk:
+    def __init__(self, content):
+        self.content = content
+
+
+class FakeChat:
+    """Stand-in for ChatOpenAI: streams a fixed reply, or fails with the given errors first."""
+
+    errors = []
+
+    def __init__(self, model=None, **kwargs):
+        self.model = model
+
+    def invoke(self, messages):
+        if FakeChat.errors:
+            raise FakeChat.errors.pop(0)
+        return Chunk("four words of output")
+
+    def stream(self, messages):
+        if FakeChat.errors:
+            raise FakeChat.errors.pop(0)
+        for word in ("one ", "two ", "three ", "four "):
+            yield Chunk(word)
+
+
+class ProviderError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+@pytest.fixture
+def scheduler(monkeypatch):
+    sched = LLMScheduler()
+    monkeypatch.setattr(llm_scheduler, "SCHEDULER", sched)
+    monkeypatch.setattr(llm_scheduler, "ChatOpenAI", FakeChat)
+    monkeypatch.setattr(llm_scheduler, "MAX_RETRIES", 1)
+    monkeypatch.setattr(llm_scheduler.time, "sleep", lambda s: None)
+    FakeChat.errors = []
+    return sched
+
+
+def _available(sched, model="m"):
+    return sched.stats()[model]["tokens_available"]
+
+
+def _route(sched, messages, max_tokens=500):
+    route = llm_scheduler.ROUTER.route(messages, "m", max_tokens)
+    # No refill between calls, so the bucket shows exactly what was charged
+    sched._queue(route.model).token_bucket.rate = 0
+    return route
+
+
+def test_interactive_calls_are_admitted_before_background():
+    sched = LLMScheduler()
+    sched.acquire("m", 0)
+    q = sched._queue("m")
+    q.request_bucket.tokens = 0
+    q.request_bucket.rate = 20.0  # one request every 50 ms
+    order = []
+
+    def call(name, priority):
+        sched.acquire("m", 1, priority, max_wait=5)
+        order.append(name)
+
+    threads = [threading.Thread(target=call, args=("background", BACKGROUND))]
+    threads[0].start()
+    time.sleep(0.01)
+    threads.append(threading.Thread(target=call, args=("interactive", INTERACTIVE)))
+    threads[1].start()
+    for t in threads:
+        t.join()
+    assert order == ["interactive", "background"]
+
+
+def test_wait_over_the_budget_is_refused_with_retry_after():
+    sched = LLMScheduler()
+    sched.acquire("m", 200000)
+    with pytest.raises(LLMRateLimitError) as raised:
+        sched.acquire("m", 100000, max_wait=1)
+    assert 25 < raised.value.retry_after < 35
+    assert sched.stats()["m"]["shed"] == 1
+    assert sched.stats()["m"]["queue_depth"] == 0
+
+
+def test_refund_returns_tokens_up_to_capacity():
+    sched = LLMScheduler()
+    sched._queue("m").token_bucket.rate = 0
+    sched.acquire("m", 1000)
+    sched.refund("m", 600)
+    assert _available(sched) == llm_scheduler.DEFAULT_TPM - 400
+    sched.refund("m", 10 ** 9)
+    assert _available(sched) == llm_scheduler.DEFAULT_TPM
+
+
+def test_invoke_refunds_unused_output_tokens(scheduler):
+    messages = [{"role": "user", "content": "hello"}]
+    route = _route(scheduler, messages)
+    llm_scheduler.invoke_llm(messages, model="m", max_tokens=500)
+    used = _available(scheduler, route.model)
+    assert llm_scheduler.DEFAULT_TPM - used == route.prompt_tokens + llm_scheduler.estimate_tokens("four words of output")
+
+
+def test_failures_map_to_rate_limit_and_unavailable(scheduler):
+    messages = [{"role": "user", "content": "hello"}]
+    route = _route(scheduler, messages)
+    FakeChat.errors = [ProviderError(429), ProviderError(429)]
+    with pytest.raises(LLMRateLimitError):
+        llm_scheduler.invoke_llm(messages, model="m", max_tokens=500)
+    FakeChat.errors = [ProviderError(503), ProviderError(500)]
+    with pytest.raises(LLMUnavailableError):
+        llm_scheduler.invoke_llm(messages, model="m", max_tokens=500)
+    FakeChat.errors = [ProviderError(400)]
+    with pytest.raises(ProviderError):
+        llm_scheduler.invoke_llm(messages, model="m", max_tokens=500)
+    # Only prompts stay charged for calls that produced nothing
+    assert llm_scheduler.DEFAULT_TPM - _available(scheduler, route.model) == 5 * route.prompt_tokens
+
+
+def test_stream_stopped_early_refunds_its_reservation(scheduler):
+    messages = [{"role": "user", "content": "hello"}]
+    route = _route(scheduler, messages)
+    stream = llm_scheduler.stream_llm(messages, model="m", max_tokens=500)
+    assert next(stream) == "one "
+    stream.close()
+    charged = llm_scheduler.DEFAULT_TPM - _available(scheduler, route.model)
+    assert charged == route.prompt_tokens + llm_scheduler.estimate_tokens("one ")
@@ -0,0 +1,88 @@
+import json
+import multiprocessing
+import os
+
+import numpy as np
+import pytest
+
+import matrix_store
+from matrix_store import MatrixVectorStore
+
+
+class Embeddings:
+    """Deterministic stand-in: a text's vector is seeded by its characters."""
+
+    dim = 8
+
+    def embed_documents(self, texts):
+        return [self.embed_query(t) for t in texts]
+
+    def embed_query(self, text):
+        return np.random.default_rng(sum(map(ord, text))).normal(size=self.dim).tolist()
+
+
+@pytest.fixture(params=["float16", "int8"])
+def dtype(request):
+    return request.param
+
+
+def _add(store, *ids):
+    store.add_texts([f"text {i}" for i in ids], [{"file_name": f"{i}.pdf"} for i in ids], ids=list(ids))
+
+
+def test_search_finds_the_closest_row(tmp_path, dtype):
+    store = MatrixVectorStore(Embeddings(), str(tmp_path), dtype=dtype)
+    _add(store, "a", "b", "c")
+    assert store.similarity_search("text b", k=1)[0].metadata["id"] == "b"
+    assert [d.metadata["id"] for d in store.similarity_search("text b", k=3, filter={"file_name": {"$in": ["a.pdf", "c.pdf"]}})] in (["a", "c"], ["c", "a"])
+
+
+def test_two_stores_on_one_directory_see_each_others_rows(tmp_path, dtype):
+    a = MatrixVectorStore(Embeddings(), str(tmp_path), dtype=dtype)
+    b = MatrixVectorStore(Embeddings(), str(tmp_path), dtype=dtype)
+    _add(a, "a0")
+    _add(a, "a1")
+    _add(b, "b1")
+    assert b.contains(["a0", "a1", "b1"]) == {"a0", "a1", "b1"}
+    assert a.contains(["b1"]) == {"b1"}
+    assert a.similarity_search("text b1", k=1)[0].metadata["id"] == "b1"
+    reopened = MatrixVectorStore(Embeddings(), str(tmp_path), dtype=dtype)
+    assert reopened.count == 3
+    assert [d.metadata["id"] for d in reopened.get_by_ids(["a0", "a1", "b1"])] == ["a0", "a1", "b1"]
+
+
+def test_interrupted_append_is_cut_off_by_the_next_writer(tmp_path, dtype):
+    store = MatrixVectorStore(Embeddings(), str(tmp_path), dtype=dtype)
+    _add(store, "a")
+    # A crash after writing data but before committing info.json
+    with open(store._vectors_path, "ab") as f:
+        f.write(b"\x01" * 5)
+    with open(store._meta_path, "ab") as f:
+        f.write(b'{"id": "half')
+    reopened = MatrixVectorStore(Embeddings(), str(tmp_path), dtype=dtype)
+    assert reopened.count == 1
+    _add(reopened, "b")
+    again = MatrixVectorStore(Embeddings(), str(tmp_path), dtype=dtype)
+    assert [d.metadata["id"] for d in again.get_by_ids(["a", "b"])] == ["a", "b"]
+    assert again.similarity_search("text b", k=1)[0].metadata["id"] == "b"
+
+
+def _writer(path, worker):
+    store = MatrixVectorStore(Embeddings(), path)
+    for i in range(20):
+        _add(store, f"w{worker}-{i}")
+
+
+@pytest.mark.skipif(matrix_store.fcntl is None, reason="needs fcntl and fork")
+def test_concurrent_processes_append_without_losing_rows(tmp_path):
+    ctx = multiprocessing.get_context("fork")
+    procs = [ctx.Process(target=_writer, args=(str(tmp_path), w)) for w in range(4)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+    store = MatrixVectorStore(Embeddings(), str(tmp_path))
+    assert store.count == 80
+    assert len(store.contains([f"w{w}-{i}" for w in range(4) for i in range(20)])) == 80
+    with open(os.path.join(str(tmp_path), "info.json")) as f:
+        assert json.load(f)["count"] == 80
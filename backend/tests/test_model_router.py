@@ -0,0 +1,56 @@
+import model_router
+import rag_chain
+from model_router import ModelRouter
+
+
+def _messages(words):
+    return [{"role": "user", "content": " ".join(["word"] * words)}]
+
+
+def test_short_lookup_goes_to_fastest_model_of_same_quality(monkeypatch):
+    monkeypatch.setattr(model_router, "ROUTING_ENABLED", False)
+    decision = ModelRouter().route(_messages(50), "gpt-4", 600, priority=1)
+    assert (decision.model, decision.action) == ("gpt-4.1", "fast")
+
+
+def test_quality_drop_for_short_lookups_is_opt_in(monkeypatch):
+    monkeypatch.setattr(model_router, "ROUTING_ENABLED", True)
+    decision = ModelRouter().route(_messages(50), "gpt-4", 600, priority=1)
+    assert decision.model == "gpt-4.1-mini"
+
+
+def test_latency_target_never_lowers_quality_by_default(monkeypatch):
+    monkeypatch.setattr(model_router, "ROUTING_ENABLED", False)
+    router = ModelRouter()
+    # Too long to count as a short lookup, and gpt-4 is predicted past the target
+    decision = router.route(_messages(3000), "gpt-4", 1000, latency_target=30)
+    assert (decision.model, decision.action) == ("gpt-4.1", "latency")
+    decision = router.route(_messages(3000), "gpt-4.1-mini", 1000, latency_target=1)
+    assert (decision.model, decision.action) == ("gpt-4.1-mini", "kept")
+
+
+def test_prompt_too_large_for_every_model_is_truncated(monkeypatch):
+    router = ModelRouter([model_router.MODELS["gpt-4"]])
+    decision = router.route(_messages(20000), "gpt-4", 600)
+    assert decision.action == "truncated"
+    assert decision.prompt_tokens + 600 <= 8192
+    assert decision.messages[0]["content"].endswith(model_router.TRUNCATION_MARKER)
+
+
+def test_scoring_reads_every_part_of_a_large_corpus(monkeypatch):
+    seen = []
+
+    def score_part(text, priority):
+        seen.append(text)
+        score = 2 if "bad" in text else 4
+        scores = {key: {"score": score, "why": text[:3]} for key in ("cost", "safety")}
+        what = rag_chain.StrengthWeakness(what=text[:3], why="")
+        return scores, what, what, [rag_chain.NextStep(step=text[:3], why="", impact="", how_it_helps="")]
+
+    monkeypatch.setattr(rag_chain, "_score_part", score_part)
+    monkeypatch.setattr(rag_chain.ROUTER, "max_prompt_tokens", lambda max_tokens=0: 1000 + 1)
+    chunks = [rag_chain.DocChunk(page_content=text) for text in ("good one", "bad two", "good three")]
+    raw_scores, strength, weakness, next_steps = rag_chain.score_with_llm(chunks)
+    assert len(seen) == 3
+    assert 2 < raw_scores["cost"]["score"] < 4
+    assert strength.what == "goo" and weakness.what == "bad" and next_steps[0].step == "bad"
@@ -0,0 +1,39 @@
+import threading
+
+import rag_chain
+from tracing import ContextThreadPoolExecutor
+
+
+def test_followups_skip_non_string_questions(monkeypatch):
+    searched = []
+
+    def search(query, vectorstore, search_filter=None):
+        searched.append(query)
+        return [query]
+
+    monkeypatch.setattr(rag_chain, "rag_search", search)
+    monkeypatch.setattr(rag_chain, "generate_report", lambda request, summary: ["cost?", {"q": 1}, ["x"], "  ", None, "time?"])
+    merged = rag_chain.gather_context_pipelined("q", None, followup_deadline=None)
+    assert merged[0] == "q"
+    assert sorted(searched) == ["cost?", "q", "time?"]
+
+
+def test_deadline_cancels_searches_that_have_not_started(monkeypatch):
+    release = threading.Event()
+    started = []
+
+    def search(query, vectorstore, search_filter=None):
+        started.append(query)
+        if query != "q":
+            release.wait(2)
+        return [query]
+
+    monkeypatch.setattr(rag_chain, "RAG_EXECUTOR", ContextThreadPoolExecutor(max_workers=2))
+    monkeypatch.setattr(rag_chain, "rag_search", search)
+    monkeypatch.setattr(rag_chain, "generate_report", lambda request, summary: [f"f{i}" for i in range(5)])
+    merged = rag_chain.gather_context_pipelined("q", None, followup_deadline=0.2)
+    release.set()
+    rag_chain.RAG_EXECUTOR.shutdown(wait=True)
+    assert merged == ["q"]
+    # Only the searches already running when the deadline hit ever started
+    assert len(started) == 3
@@ -0,0 +1,64 @@
+import numpy as np
+from langchain_core.documents import Document
+
+import relevance
+from corpus_state import CORPUS
+from relevance import relevance_score, score_chunks, select_relevant
+
+CLAUSE = "The Contractor shall pay liquidated damages of 0.1% per day of delay within 14 days of the Completion Date."
+NOISE = "Layer: A-WALL\nLayer: A-DOOR\nIfcWall: 312\n...(40 more entities)"
+DIGITS = "0012 3345 9981 2231 / 0044 1192 -- 7781 0023"
+PROSE = "The drawings may show the north elevation of the building."
+
+
+def test_clauses_outscore_drawing_layers_and_number_tables():
+    assert relevance_score(CLAUSE) > 0.5
+    assert relevance_score(NOISE) == 0.0
+    assert relevance_score(DIGITS) == 0.0
+    assert relevance_score(PROSE) < relevance.RELEVANCE_THRESHOLD
+
+
+def test_long_passages_dilute_a_single_keyword():
+    short = "Payment is due."
+    assert relevance_score(short) > relevance_score(short + " " + PROSE * 20)
+
+
+def test_filter_keeps_order_and_scores_unscored_chunks(monkeypatch):
+    monkeypatch.setattr(relevance, "RELEVANCE_MIN_KEEP", 1)
+    chunks = [Document(page_content=text) for text in (CLAUSE, NOISE, PROSE, CLAUSE + " Invoices are payable monthly.")]
+    kept = select_relevant(chunks)
+    assert [c.page_content for c in kept] == [chunks[0].page_content, chunks[3].page_content]
+
+
+def test_filter_never_sends_fewer_than_min_keep(monkeypatch):
+    monkeypatch.setattr(relevance, "RELEVANCE_MIN_KEEP", 2)
+    chunks = [Document(page_content=text) for text in (NOISE, PROSE, CLAUSE, DIGITS)]
+    kept = select_relevant(chunks)
+    assert [c.page_content for c in kept] == [PROSE, CLAUSE]
+
+
+def test_compact_chunk_lists_filter_on_stored_scores(monkeypatch):
+    monkeypatch.setattr(relevance, "RELEVANCE_MIN_KEEP", 1)
+    docs = [Document(page_content=text, metadata={"file_name": "r.pdf"}) for text in (NOISE, CLAUSE, PROSE)]
+    score_chunks(docs)
+    CORPUS.add_document("r.pdf", docs, sha256="relevance", project="relevance")
+    chunks = CORPUS.snapshot("relevance")[1]
+    kept = select_relevant(chunks)
+    assert type(kept) is type(chunks)
+    assert [c.page_content for c in kept] == [CLAUSE]
+
+
+def test_borderline_chunks_close_to_a_prototype_are_kept(monkeypatch):
+    class Embeddings:
+        def embed_documents(self, texts):
+            # Every text points the same way, so each borderline chunk matches a prototype
+            return [np.ones(4).tolist() for _ in texts]
+
+    monkeypatch.setattr(relevance, "RELEVANCE_EMBEDDINGS", True)
+    monkeypatch.setattr(relevance, "_prototypes", None)
+    borderline = "The site will be handed over in stages."
+    assert relevance.BORDERLINE_LOW <= relevance_score(borderline) < relevance.RELEVANCE_THRESHOLD
+    docs = [Document(page_content=borderline), Document(page_content=NOISE)]
+    score_chunks(docs, Embeddings())
+    assert docs[0].metadata["relevance"] == relevance.RELEVANCE_THRESHOLD
+    assert docs[1].metadata["relevance"] == 0.0
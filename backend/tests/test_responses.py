@@ -0,0 +1,71 @@
+import gzip
+
+import orjson
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+import admission
+from admission import AdmissionControlMiddleware, EndpointLimit
+from responses import ConditionalGetMiddleware, etag_for, etag_matches, json_response
+
+TAG = etag_for("highlights", "default", None, 1)
+
+
+def _app(monkeypatch, tag=TAG):
+    # No slot and no queue: anything that reaches admission is turned away
+    monkeypatch.setitem(admission.ENDPOINT_LIMITS, "/highlights", EndpointLimit("test", 0, 0, 1.0))
+    app = FastAPI()
+
+    @app.get("/highlights")
+    async def highlights(request: Request):
+        return json_response(request, {"ok": True}, tag)
+
+    app.add_middleware(AdmissionControlMiddleware)
+
+    def current(params):
+        if params.get("project") == "bad name":
+            raise ValueError("bad project")
+        return tag
+
+    app.add_middleware(ConditionalGetMiddleware, etags={"/highlights": current})
+    return TestClient(app)
+
+
+def test_current_tag_is_answered_before_admission(monkeypatch):
+    client = _app(monkeypatch)
+    response = client.get("/highlights", headers={"If-None-Match": TAG})
+    assert response.status_code == 304
+    assert response.headers["etag"] == TAG and response.content == b""
+    assert admission.ENDPOINT_LIMITS["/highlights"].rejected == 0
+
+
+def test_stale_tag_or_bad_parameters_go_through_admission(monkeypatch):
+    client = _app(monkeypatch)
+    assert client.get("/highlights", headers={"If-None-Match": 'W/"old"'}).status_code == 429
+    assert client.get("/highlights", params={"project": "bad name"}, headers={"If-None-Match": TAG}).status_code == 429
+    assert client.get("/highlights").status_code == 429
+
+
+def test_weak_comparison_and_lists():
+    def request(header):
+        return Request({"type": "http", "headers": [(b"if-none-match", header.encode())]})
+
+    opaque = TAG[2:]
+    assert etag_matches(request(opaque), TAG)
+    assert etag_matches(request(f'W/"x", {TAG}'), TAG)
+    assert etag_matches(request("*"), TAG)
+    assert not etag_matches(request('W/"x"'), TAG)
+
+
+def test_large_bodies_are_gzipped_when_accepted():
+    payload = {"items": ["clause"] * 500}
+
+    def request(encoding):
+        return Request({"type": "http", "headers": [(b"accept-encoding", encoding.encode())]})
+
+    compressed = json_response(request("br, gzip"), payload, TAG)
+    assert compressed.headers["content-encoding"] == "gzip"
+    assert orjson.loads(gzip.decompress(compressed.body)) == payload
+    plain = json_response(request("gzip;q=0"), payload)
+    assert "content-encoding" not in plain.headers and "etag" not in plain.headers
+    assert orjson.loads(plain.body) == payload
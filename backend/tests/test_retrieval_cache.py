@@ -0,0 +1,65 @@
+import numpy as np
+from langchain_core.documents import Document
+
+import vectorstore
+from corpus_state import CORPUS
+from matrix_store import MatrixVectorStore
+from vectorstore import RetrievalCache, cached_search, store_key
+
+
+class CountingEmbeddings:
+    def __init__(self):
+        self.queries = 0
+
+    def embed_documents(self, texts):
+        return [self._vector(t) for t in texts]
+
+    def embed_query(self, text):
+        self.queries += 1
+        return self._vector(text)
+
+    def _vector(self, text):
+        return np.random.default_rng(sum(map(ord, text))).normal(size=8).tolist()
+
+
+def _store(tmp_path, monkeypatch, project):
+    monkeypatch.setattr(vectorstore, "RETRIEVAL_CACHE", RetrievalCache(16))
+    embeddings = CountingEmbeddings()
+    store = MatrixVectorStore(embeddings, str(tmp_path), dtype="float16")
+    store.add_texts(["alpha clause", "beta clause"], [{"file_name": "a.pdf"}, {"file_name": "b.pdf"}], ids=["a", "b"])
+    vectorstore.RETRIEVAL_CACHE.bind_project(store_key(store), project)
+    return store, embeddings
+
+
+def test_repeated_and_reworded_queries_hit(tmp_path, monkeypatch):
+    store, embeddings = _store(tmp_path, monkeypatch, "cache-hits")
+    first = cached_search("Alpha  clause", store, k=1)
+    again = cached_search("alpha clause", store, k=1)
+    assert [d.page_content for d in again] == [d.page_content for d in first]
+    assert embeddings.queries == 1
+    assert vectorstore.RETRIEVAL_CACHE.stats()["hits"] == 1
+    # A different filter is a different entry
+    cached_search("alpha clause", store, k=1, filter={"file_name": "b.pdf"})
+    assert embeddings.queries == 2
+
+
+def test_registering_a_document_invalidates_entries(tmp_path, monkeypatch):
+    store, embeddings = _store(tmp_path, monkeypatch, "cache-corpus")
+    cached_search("alpha clause", store, k=1)
+    # Another worker registers a document: only the shared corpus version moves
+    CORPUS.add_document("c.pdf", [Document(page_content="gamma", metadata={"file_name": "c.pdf"})], sha256="cache-corpus", project="cache-corpus")
+    cached_search("alpha clause", store, k=1)
+    assert embeddings.queries == 2
+    # Other projects' registrations leave the entry alone
+    CORPUS.add_document("d.pdf", [Document(page_content="delta", metadata={"file_name": "d.pdf"})], sha256="cache-other", project="cache-other")
+    cached_search("alpha clause", store, k=1)
+    assert embeddings.queries == 2
+
+
+def test_local_writes_invalidate_before_registration(tmp_path, monkeypatch):
+    store, embeddings = _store(tmp_path, monkeypatch, "cache-writes")
+    cached_search("gamma", store, k=1)
+    vectors = store.embeddings.embed_documents(["gamma"])
+    vectorstore.add_embeddings(store, ["gamma"], vectors, [{"file_name": "c.pdf"}], ids=["c"])
+    assert cached_search("gamma", store, k=1)[0].page_content == "gamma"
+    assert embeddings.queries == 2
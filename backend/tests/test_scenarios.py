@@ -0,0 +1,20 @@
+from scenarios import PINNABLE_PARAMS, recalc_scores
+
+
+def _raw(score=3):
+    keys = ("cost", "timeline", "compliance", "design", "sustainability", "safety")
+    return {key: {"score": score, "why": key} for key in keys}
+
+
+def test_safety_can_be_pinned_and_moves_the_scores_it_feeds():
+    assert "safety" in PINNABLE_PARAMS and "sustainability" in PINNABLE_PARAMS
+    result = recalc_scores(_raw(), {"safety": 5})
+    assert result["scores"]["cost"]["score"] > result["scores"]["cost"]["baseline"]
+    assert result["final_score"] > result["baseline_final_score"]
+    assert result["most_impactful"] is not None
+
+
+def test_unchanged_pin_has_no_impact():
+    result = recalc_scores(_raw(), {"cost": 3})
+    assert result["final_score"] == result["baseline_final_score"]
+    assert result["most_impactful"] is None
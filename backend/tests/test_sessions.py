@@ -0,0 +1,67 @@
+import rag_chain
+import sessions
+from sessions import MAX_TURNS_KEPT, ConversationSession, SessionStore, refresh_session_summary
+
+
+def test_unknown_ids_get_a_fresh_server_id():
+    store = SessionStore()
+    session = store.get("attacker-chosen")
+    assert session.session_id != "attacker-chosen"
+    assert store.get(session.session_id) is session
+    assert store.get(None) is not session
+
+
+def test_store_is_bounded_and_expires_idle_sessions():
+    store = SessionStore(max_sessions=2, ttl_seconds=60)
+    first = store.get()
+    store.get()
+    store.get()
+    assert len(store) == 2 and store.get(first.session_id) is not first
+    first.last_seen -= 120
+    store._sessions[first.session_id] = first
+    store._sessions.move_to_end(first.session_id, last=False)
+    store.get()
+    assert first.session_id not in store._sessions
+
+
+def test_refresh_folds_pending_turns(monkeypatch):
+    monkeypatch.setattr(rag_chain, "update_summary", lambda summary, turns: f"{summary or ''}+{len(turns)}")
+    session = ConversationSession("s")
+    session.add_turn("q1", "a1")
+    refresh_session_summary(session)
+    session.add_turn("q2", "a2")
+    assert session.context() == "+2\nuser: q2\nassistant: a2"
+    refresh_session_summary(session)
+    assert session.context() == "+2+2"
+
+
+def test_history_stays_bounded_when_summaries_fail(monkeypatch):
+    def fail(summary, turns):
+        raise RuntimeError("llm down")
+
+    monkeypatch.setattr(rag_chain, "update_summary", fail)
+    session = ConversationSession("s")
+    for i in range(MAX_TURNS_KEPT * 2):
+        session.add_turn(f"q{i}", f"a{i}")
+        refresh_session_summary(session)
+    assert len(session.history) == MAX_TURNS_KEPT * 2
+    assert session.history[-1]["content"] == f"a{MAX_TURNS_KEPT * 2 - 1}"
+
+
+def test_trim_during_summary_keeps_positions(monkeypatch):
+    monkeypatch.setattr(sessions, "MAX_TURNS_KEPT", 3)
+    session = ConversationSession("s")
+    session.add_turn("q0", "a0")
+    session.add_turn("q1", "a1")
+
+    def slow_summary(summary, turns):
+        # Two more turns arrive while the summary is written; the second trims q0/a0
+        session.add_turn("q2", "a2")
+        session.add_turn("q3", "a3")
+        return "covers q0-a1"
+
+    monkeypatch.setattr(rag_chain, "update_summary", slow_summary)
+    refresh_session_summary(session)
+    assert session.history_start == 2
+    assert session.summarized_upto == 2
+    assert [m["content"] for m in session.pending_turns()[0]] == ["q2", "a2", "q3", "a3"]
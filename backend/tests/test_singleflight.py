@@ -0,0 +1,66 @@
+import asyncio
+import threading
+import time
+
+from singleflight import SingleFlight
+
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight()
+    calls = []
+
+    def work(x):
+        calls.append(x)
+        time.sleep(0.05)
+        return x * 2
+
+    async def main():
+        return await asyncio.gather(*(flight.do("key", work, 21) for _ in range(5)))
+
+    assert asyncio.run(main()) == [42] * 5
+    assert calls == [21]
+    assert flight.stats() == {"in_flight": 0, "waiting_requests": 0, "executed": 1, "merged": 4}
+
+
+def test_different_keys_run_separately():
+    flight = SingleFlight()
+
+    async def main():
+        return await asyncio.gather(flight.do("a", lambda: "a"), flight.do("b", lambda: "b"))
+
+    assert asyncio.run(main()) == ["a", "b"]
+    assert flight.executed == 2
+
+
+def test_errors_reach_every_waiter_and_are_not_cached():
+    flight = SingleFlight()
+
+    def fail():
+        time.sleep(0.02)
+        raise RuntimeError("upstream down")
+
+    async def main():
+        return await asyncio.gather(flight.do("key", fail), flight.do("key", fail), return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert [type(r) for r in results] == [RuntimeError, RuntimeError]
+    assert asyncio.run(flight.do("key", lambda: "ok")) == "ok"
+
+
+def test_cancelled_caller_does_not_cancel_shared_work():
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def work():
+        release.wait(2)
+        return "done"
+
+    async def main():
+        first = asyncio.ensure_future(flight.do("key", work))
+        second = asyncio.ensure_future(flight.do("key", work))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        release.set()
+        return await second
+
+    assert asyncio.run(main()) == "done"
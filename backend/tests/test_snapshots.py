@@ -0,0 +1,99 @@
+import os
+
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+
+import snapshots
+from corpus_state import CORPUS
+from matrix_store import MatrixVectorStore
+from snapshots import SnapshotError, export_snapshot, import_snapshot, read_manifest
+from vectorstore import add_documents, chunk_id
+
+
+class Embeddings:
+    def __init__(self, model="test-embedding", dim=8):
+        self.model = model
+        self.dim = dim
+
+    def embed_documents(self, texts):
+        return [self.embed_query(t) for t in texts]
+
+    def embed_query(self, text):
+        return np.random.default_rng(sum(map(ord, text))).normal(size=self.dim).tolist()
+
+
+def _upload(store, project, file_name, texts, sha256):
+    chunks = [Document(page_content=t, metadata={"file_name": file_name, "file_type": "pdf", "project": project,
+                                                 "source_location": f"page {i + 1}"})
+              for i, t in enumerate(texts)]
+    add_documents(chunks, store)
+    CORPUS.add_document(file_name, chunks, sha256, project)
+    return chunks
+
+
+@pytest.fixture
+def snapshot(tmp_path):
+    store = MatrixVectorStore(Embeddings(), str(tmp_path / "source"))
+    _upload(store, "snap-src", "a.pdf", ["Payment within 30 days.", "Retention is 5%."], "sha-a")
+    _upload(store, "snap-src", "b.pdf", ["Delay damages apply."], "sha-b")
+    out = str(tmp_path / "snapshot")
+    export_snapshot(out, "snap-src", vectorstore=store)
+    return out
+
+
+def test_round_trip_keeps_documents_vectors_and_ids(tmp_path, snapshot):
+    target = MatrixVectorStore(Embeddings(), str(tmp_path / "target"))
+    summary = import_snapshot(snapshot, "snap-dst", vectorstore=target)
+    assert (summary["documents"], summary["chunks"], summary["vectors_already_present"]) == (2, 3, 0)
+    assert [m["file_name"] for m in CORPUS.manifests("snap-dst")] == ["a.pdf", "b.pdf"]
+    assert [c.page_content for c in CORPUS.chunks("snap-dst")] == [
+        "Payment within 30 days.", "Retention is 5%.", "Delay damages apply."]
+    # Same ids an upload into the target project would have written
+    expected = [chunk_id(c, i) for i, c in enumerate(_chunks_of(CORPUS.chunks("snap-dst"), "a.pdf"))]
+    assert target.contains(expected) == set(expected)
+    assert target.similarity_search("Delay damages apply.", k=1)[0].page_content == "Delay damages apply."
+
+
+def _chunks_of(chunks, file_name):
+    return [Document(page_content=c.page_content, metadata={k: v for k, v in c.metadata.items() if k != "doc_id"})
+            for c in chunks if c.metadata["file_name"] == file_name]
+
+
+def test_interrupted_import_resumes_without_duplicates(tmp_path, snapshot, monkeypatch):
+    target = MatrixVectorStore(Embeddings(), str(tmp_path / "target"))
+    real_restore = snapshots.TABLES.restore
+
+    def crash(project, doc_id, sources):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(snapshots.TABLES, "restore", crash)
+    with pytest.raises(OSError):
+        import_snapshot(snapshot, "snap-resume", vectorstore=target)
+    assert len(CORPUS.manifests("snap-resume")) == 1
+    monkeypatch.setattr(snapshots.TABLES, "restore", real_restore)
+    summary = import_snapshot(snapshot, "snap-resume", vectorstore=target)
+    assert summary["vectors_already_present"] == 3
+    assert target.count == 3
+    assert len(CORPUS.manifests("snap-resume")) == 2
+    # A project holding documents of its own is still refused
+    _upload(target, "snap-other", "c.pdf", ["Other."], "sha-c")
+    with pytest.raises(SnapshotError, match="already has documents"):
+        import_snapshot(snapshot, "snap-other", vectorstore=target)
+
+
+def test_other_embedding_model_or_dimension_is_refused(tmp_path, snapshot):
+    with pytest.raises(SnapshotError, match="embedded with test-embedding"):
+        import_snapshot(snapshot, "snap-model", vectorstore=MatrixVectorStore(Embeddings(model="other"), str(tmp_path / "m")))
+    store = MatrixVectorStore(Embeddings(dim=4), str(tmp_path / "d"))
+    store.add_texts(["x"], ids=["x"])
+    with pytest.raises(SnapshotError, match="8 dimensions"):
+        import_snapshot(snapshot, "snap-dim", vectorstore=store)
+    assert CORPUS.manifests("snap-model") == [] and CORPUS.manifests("snap-dim") == []
+
+
+def test_tampered_files_fail_verification(snapshot):
+    with open(os.path.join(snapshot, "chunks.jsonl"), "r+b") as f:
+        f.write(b"X")
+    with pytest.raises(SnapshotError, match="Checksum mismatch"):
+        read_manifest(snapshot)
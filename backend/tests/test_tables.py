@@ -0,0 +1,86 @@
+import pandas as pd
+import pytest
+
+from tables import TableQueryError, TableStore, might_be_table_question, run_query
+
+
+@pytest.fixture
+def table(tmp_path):
+    data = pd.DataFrame({
+        "Package": ["Civil", "Civil", "MEP", "MEP", "MEP", None],
+        "Item": ["Concrete", "Rebar", "Cable", "Cable", "Duct", "Misc"],
+        "Cost": ["1,000", "$250", "400", "600", "100", "50"],
+        "Qty": [10, 5, 2, None, 1, 1],
+    })
+    store = TableStore(str(tmp_path))
+    store.save("default", "doc1", "boq.csv", [("main table", data)])
+    return store.tables("default")[0]
+
+
+def test_columns_are_typed_at_ingest(table):
+    kinds = {name: column["kind"] for name, column in table.columns.items()}
+    assert kinds == {"Package": "text", "Item": "text", "Cost": "number", "Qty": "number"}
+    assert table.columns["Cost"]["min"] == 50.0 and table.columns["Cost"]["max"] == 1000.0
+
+
+def test_count_without_group_by(table):
+    assert run_query(table, {}) == {"matched_rows": 6, "groups": 1, "rows": [{"count(*)": 6.0}]}
+
+
+def test_group_by_orders_by_first_aggregate(table):
+    result = run_query(table, {"group_by": ["Package"], "aggregates": [
+        {"fn": "sum", "column": "Cost"}, {"fn": "avg", "column": "Qty"}, {"fn": "count", "column": "Qty"},
+    ]})
+    assert result["groups"] == 3
+    assert result["rows"] == [
+        {"Package": "Civil", "sum(Cost)": 1250.0, "avg(Qty)": 7.5, "count(Qty)": 2.0},
+        {"Package": "MEP", "sum(Cost)": 1100.0, "avg(Qty)": 1.5, "count(Qty)": 2.0},
+        {"Package": None, "sum(Cost)": 50.0, "avg(Qty)": 1.0, "count(Qty)": 1.0},
+    ]
+
+
+def test_filters_and_multi_column_groups(table):
+    spec = {
+        "filters": [{"column": "package", "op": "eq", "value": "mep"}, {"column": "Cost", "op": "gte", "value": 200}],
+        "group_by": ["Package", "Item"],
+        "aggregates": [{"fn": "max", "column": "Cost"}],
+    }
+    with pytest.raises(TableQueryError):
+        run_query(table, spec)
+    spec["filters"][0]["column"] = "Package"
+    result = run_query(table, spec)
+    assert result["matched_rows"] == 2
+    assert result["rows"] == [{"Package": "MEP", "Item": "Cable", "max(Cost)": 600.0}]
+
+
+def test_text_filter_ops(table):
+    def matched(op, value):
+        return run_query(table, {"filters": [{"column": "Item", "op": op, "value": value}]})["matched_rows"]
+
+    assert matched("contains", "CAB") == 2
+    assert matched("in", ["duct", "misc"]) == 2
+    assert matched("ne", "cable") == 4
+
+
+def test_limit_and_ascending_order(table):
+    result = run_query(table, {"group_by": ["Item"], "aggregates": [{"fn": "sum", "column": "Cost"}],
+                               "order": "asc", "limit": 2})
+    assert result["groups"] == 5
+    assert [row["Item"] for row in result["rows"]] == ["Misc", "Duct"]
+
+
+@pytest.mark.parametrize("spec", [
+    {"aggregates": [{"fn": "median", "column": "Cost"}]},
+    {"aggregates": [{"fn": "sum", "column": "Item"}]},
+    {"group_by": ["Vendor"]},
+    {"filters": [{"column": "Cost", "op": "contains", "value": "1"}]},
+    {"filters": [{"column": "Cost", "op": "gt", "value": "a lot"}]},
+])
+def test_invalid_specs_raise(table, spec):
+    with pytest.raises(TableQueryError):
+        run_query(table, spec)
+
+
+def test_gate_requires_a_column_name(table):
+    assert might_be_table_question("What is the total cost per package?", [table])
+    assert not might_be_table_question("What is the total of the retention?", [table])
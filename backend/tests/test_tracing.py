@@ -0,0 +1,89 @@
+import os
+import subprocess
+import sys
+
+from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
+from fastapi.testclient import TestClient
+
+import tracing
+from tracing import ContextThreadPoolExecutor, TraceStore, TracingMiddleware, annotate, span, timeline, traced
+
+POOL = ContextThreadPoolExecutor(max_workers=2)
+
+
+@traced()
+def retrieve(query):
+    annotate(query=query, cache="miss")
+    with span("embed_query"):
+        return query.upper()
+
+
+def _client(tmp_path, monkeypatch):
+    monkeypatch.setattr(tracing, "TRACES", TraceStore(str(tmp_path / "traces.jsonl"), memory=2))
+    app = FastAPI()
+
+    @app.get("/search")
+    async def search(q: str):
+        first = await run_in_threadpool(retrieve, q)
+        second = POOL.submit(retrieve, q + "!").result()
+        return {"results": [first, second]}
+
+    app.add_middleware(TracingMiddleware)
+    return TestClient(app)
+
+
+def test_untraced_requests_carry_no_trace(tmp_path, monkeypatch):
+    client = _client(tmp_path, monkeypatch)
+    response = client.get("/search", params={"q": "a"})
+    assert response.status_code == 200 and "x-request-id" not in response.headers
+    assert not os.path.exists(tmp_path / "traces.jsonl")
+
+
+def test_spans_follow_the_request_into_worker_threads(tmp_path, monkeypatch):
+    client = _client(tmp_path, monkeypatch)
+    response = client.get("/search", params={"q": "a"}, headers={"X-Trace": "1", "X-Request-ID": "req-1"})
+    assert response.headers["x-request-id"] == "req-1"
+    record = tracing.TRACES.get("req-1")
+    assert record["status"] == 200 and record["path"] == "/search"
+    spans = timeline(record)["spans"]
+    assert [(s["name"], s["depth"]) for s in spans] == [
+        ("GET /search", 0), ("retrieve", 1), ("embed_query", 2), ("retrieve", 1), ("embed_query", 2),
+    ]
+    assert spans[1]["attrs"] == {"query": "a", "cache": "miss"}
+    # The second retrieve ran on a ContextThreadPoolExecutor worker, still under the root span
+    assert spans[3]["attrs"]["query"] == "a!" and spans[3]["parent"] == spans[0]["id"]
+
+
+def test_reused_or_invalid_ids_get_a_fresh_one(tmp_path, monkeypatch):
+    client = _client(tmp_path, monkeypatch)
+    client.get("/search", params={"q": "first"}, headers={"X-Trace": "1", "X-Request-ID": "dup"})
+    again = client.get("/search", params={"q": "second"}, headers={"X-Trace": "1", "X-Request-ID": "dup"})
+    assert again.headers["x-request-id"] != "dup"
+    assert tracing.TRACES.get("dup")["spans"][1]["attrs"]["query"] == "first"
+    bad = client.get("/search", params={"q": "b"}, headers={"X-Trace": "1", "X-Request-ID": "no spaces allowed"})
+    assert bad.headers["x-request-id"] != "no spaces allowed"
+
+
+def test_evicted_traces_are_read_back_from_the_file(tmp_path, monkeypatch):
+    client = _client(tmp_path, monkeypatch)
+    for i in range(3):
+        client.get("/search", params={"q": str(i)}, headers={"X-Trace": "1", "X-Request-ID": f"r{i}"})
+    assert "r0" not in tracing.TRACES._recent
+    assert tracing.TRACES.get("r0")["request_id"] == "r0"
+    # Another worker sharing the file sees it too, and cannot claim the id while it is in memory there
+    other = TraceStore(tracing.TRACES.path)
+    assert other.get("r2")["request_id"] == "r2"
+    assert not tracing.TRACES.claim("r2")
+
+
+def test_trace_endpoint_is_only_served_when_enabled():
+    script = "import main; print(any(getattr(r, 'path', '') == '/debug/trace/{request_id}' for r in main.app.routes))"
+    backend = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    results = []
+    for tracing_flag in ("0", "1"):
+        env = dict(os.environ, OPENAI_API_KEY="x", TRACING=tracing_flag)
+        env.pop("PROFILE_ENDPOINT", None)
+        out = subprocess.run([sys.executable, "-c", script], cwd=backend, env=env, capture_output=True, text=True, check=True)
+        results.append(out.stdout.strip().splitlines()[-1])
+    assert results == ["False", "True"]
@@ -0,0 +1,388 @@
+import contextvars
+import functools
+import json
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from starlette.concurrency import run_in_threadpool
+
+# --- Request tracing and sampling profiler ---
+# Opt-in: with TRACING=1 every request is traced, otherwise only requests
+# sent with "X-Trace: 1". A trace is a tree of timed spans (pipeline stages,
+# LLM calls with routed model / token counts / queue wait, retrieval with
+# cache hits) collected through a context variable, so it follows the request
+# into run_in_threadpool and ContextThreadPoolExecutor workers. Finished
+# traces are appended to TRACE_FILE as JSON lines and kept in memory; the
+# GET /debug/trace/{request_id} endpoint is only served while TRACING or
+# PROFILE_ENDPOINT is set. With PROFILE_ENDPOINT=/ask, requests to that
+# path are also sampled every PROFILE_INTERVAL_MS: the stacks of the threads
+# working on the request are written to PROFILE_DIR in collapsed-stack format
+# (flamegraph.pl, speedscope, inferno).
+
+TRACING = os.getenv("TRACING", "0") == "1"
+TRACE_FILE = os.getenv("TRACE_FILE", "/tmp/chroma_store/traces.jsonl")
+TRACE_FILE_MAX_BYTES = int(os.getenv("TRACE_FILE_MAX_BYTES", str(50 * 1024 * 1024)))
+TRACE_MEMORY = int(os.getenv("TRACE_MEMORY", "200"))
+PROFILE_ENDPOINT = os.getenv("PROFILE_ENDPOINT") or None
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "/tmp/chroma_store/profiles")
+TRACE_ENDPOINT_ENABLED = TRACING or PROFILE_ENDPOINT is not None
+MAX_ATTR_CHARS = 200
+_REQUEST_ID_RE = re.compile(r"^[\w.-]{1,64}$")
+
+
+class Span:
+    __slots__ = ("trace", "id", "parent", "name", "start", "end", "thread", "attrs")
+
+    def __init__(self, trace: "Trace", name: str, parent: Optional[int], attrs: Dict[str, Any]):
+        self.trace = trace
+        self.id = trace.next_id()
+        self.parent = parent
+        self.name = name
+        self.start = time.perf_counter()
+        self.end: Optional[float] = None
+        self.thread = threading.get_ident()
+        self.attrs = attrs
+
+    def set(self, **attrs: Any) -> None:
+        self.attrs.update(attrs)
+
+    def incr(self, name: str, amount: int = 1) -> None:
+        self.attrs[name] = self.attrs.get(name, 0) + amount
+
+    def to_dict(self) -> Dict[str, Any]:
+        origin = self.trace.origin
+        return {
+            "id": self.id,
+            "parent": self.parent,
+            "name": self.name,
+            "start_ms": round((self.start - origin) * 1000, 2),
+            "duration_ms": round(((self.end or time.perf_counter()) - self.start) * 1000, 2),
+            "thread": self.thread,
+            "attrs": {k: _clip(v) for k, v in self.attrs.items()},
+        }
+
+
+def _clip(value: Any) -> Any:
+    if isinstance(value, str) and len(value) > MAX_ATTR_CHARS:
+        return value[:MAX_ATTR_CHARS] + "..."
+    return value
+
+
+class Trace:
+    def __init__(self, request_id: str, method: str, path: str):
+        self.request_id = request_id
+        self.method = method
+        self.path = path
+        self.started_at = time.time()
+        self.origin = time.perf_counter()
+        self.spans: List[Span] = []
+        self.profile: Optional[str] = None
+        self._ids = 0
+        self._lock = threading.Lock()
+        # thread ident -> open spans on it, for the sampling profiler
+        self.active_threads: Dict[int, int] = {}
+
+    def next_id(self) -> int:
+        with self._lock:
+            self._ids += 1
+            return self._ids
+
+    def open(self, span: Span) -> None:
+        with self._lock:
+            self.spans.append(span)
+            self.active_threads[span.thread] = self.active_threads.get(span.thread, 0) + 1
+
+    def close(self, span: Span) -> None:
+        span.end = time.perf_counter()
+        with self._lock:
+            left = self.active_threads.get(span.thread, 1) - 1
+            if left:
+                self.active_threads[span.thread] = left
+            else:
+                self.active_threads.pop(span.thread, None)
+
+    def to_dict(self, status: Optional[int] = None) -> Dict[str, Any]:
+        with self._lock:
+            spans = sorted((s.to_dict() for s in self.spans), key=lambda s: (s["start_ms"], s["id"]))
+        root = spans[0] if spans else None
+        return {
+            "request_id": self.request_id,
+            "method": self.method,
+            "path": self.path,
+            "status": status,
+            "started_at": self.started_at,
+            "duration_ms": root["duration_ms"] if root else None,
+            "profile": self.profile,
+            "spans": spans,
+        }
+
+
+_current: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("trace_span", default=None)
+
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+
+class span:
+    """`with span("rag_search", query=q) as s:` times a nested stage; a no-op outside a traced request."""
+
+    __slots__ = ("name", "attrs", "_span", "_token")
+
+    def __init__(self, name: str, **attrs: Any):
+        self.name = name
+        self.attrs = attrs
+        self._span: Optional[Span] = None
+
+    def __enter__(self) -> Optional[Span]:
+        parent = _current.get()
+        if parent is None:
+            return None
+        self._span = Span(parent.trace, self.name, parent.id, self.attrs)
+        parent.trace.open(self._span)
+        self._token = _current.set(self._span)
+        return self._span
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if self._span is None:
+            return
+        if exc_type is not None:
+            self._span.attrs["error"] = exc_type.__name__
+        _current.reset(self._token)
+        self._span.trace.close(self._span)
+
+
+def traced(name: Optional[str] = None):
+    """Decorator form of `span`, named after the function by default."""
+    def decorate(fn):
+        label = name or fn.__name__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _current.get() is None:
+                return fn(*args, **kwargs)
+            with span(label):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def annotate(**attrs: Any) -> None:
+    """Attach attributes (token counts, cache hits, ...) to the innermost open span."""
+    current = _current.get()
+    if current is not None:
+        current.set(**attrs)
+
+
+def incr(name: str, amount: int = 1) -> None:
+    current = _current.get()
+    if current is not None:
+        current.incr(name, amount)
+
+
+def record_span(name: str, started: float, **attrs: Any) -> None:
+    """A finished leaf span that began at perf_counter() `started` (for work that cannot nest, e.g. generators)."""
+    parent = _current.get()
+    if parent is None:
+        return
+    leaf = Span(parent.trace, name, parent.id, attrs)
+    leaf.start = started
+    leaf.end = time.perf_counter()
+    with parent.trace._lock:
+        parent.trace.spans.append(leaf)
+
+
+class ContextThreadPoolExecutor(ThreadPoolExecutor):
+    """ThreadPoolExecutor whose tasks run in the submitter's context, so spans nest across threads."""
+
+    def submit(self, fn, /, *args, **kwargs):
+        return super().submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+# --- Trace storage ---
+
+class TraceStore:
+    def __init__(self, path: str = TRACE_FILE, memory: int = TRACE_MEMORY):
+        self.path = path
+        self.memory = memory
+        self._lock = threading.Lock()
+        self._recent: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._pending: set = set()
+
+    def claim(self, request_id: str) -> bool:
+        """Reserve an id for a new trace; False if a recent or in-flight trace already has it."""
+        with self._lock:
+            if request_id in self._recent or request_id in self._pending:
+                return False
+            self._pending.add(request_id)
+            return True
+
+    def save(self, record: Dict[str, Any]) -> None:
+        with self._lock:
+            self._pending.discard(record["request_id"])
+            self._recent[record["request_id"]] = record
+            while len(self._recent) > self.memory:
+                self._recent.popitem(last=False)
+            try:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                if os.path.exists(self.path) and os.path.getsize(self.path) > TRACE_FILE_MAX_BYTES:
+                    os.replace(self.path, self.path + ".1")
+                with open(self.path, "a") as f:
+                    f.write(json.dumps(record, default=str) + "\n")
+            except OSError as e:
+                print("TRACE WRITE ERROR", e)
+
+    def get(self, request_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            if request_id in self._recent:
+                return self._recent[request_id]
+        # Traced by another worker, or evicted from memory: look in the file(s),
+        # oldest first, so a later request reusing the id cannot shadow the original
+        needle = json.dumps(request_id)
+        for path in (self.path + ".1", self.path):
+            if not os.path.exists(path):
+                continue
+            with open(path) as f:
+                for line in f:
+                    if needle in line:
+                        record = json.loads(line)
+                        if record.get("request_id") == request_id:
+                            return record
+        return None
+
+
+TRACES = TraceStore()
+
+
+def timeline(record: Dict[str, Any]) -> Dict[str, Any]:
+    """Trace record with spans in tree order (children under their parent, by start) and their depth."""
+    children: Dict[Optional[int], List[Dict[str, Any]]] = {}
+    for s in sorted(record["spans"], key=lambda s: (s["start_ms"], s["id"])):
+        children.setdefault(s["parent"], []).append(s)
+    spans: List[Dict[str, Any]] = []
+    stack = [(s, 0) for s in reversed(children.get(None, []))]
+    while stack:
+        s, depth = stack.pop()
+        spans.append(dict(s, depth=depth))
+        stack.extend((c, depth + 1) for c in reversed(children.get(s["id"], [])))
+    return dict(record, spans=spans)
+
+
+# --- Sampling profiler ---
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class Sampler:
+    """Samples the stacks of the threads working on one trace; writes collapsed stacks on stop."""
+
+    def __init__(self, trace: Trace, root_thread: int, interval_s: float = PROFILE_INTERVAL_MS / 1000):
+        self.trace = trace
+        self.root_thread = root_thread
+        self.interval_s = interval_s
+        self.counts: Dict[str, int] = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="trace-sampler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval_s):
+            frames = sys._current_frames()
+            with self.trace._lock:
+                # The event loop thread only counts while it runs a stage itself (not just the root span)
+                threads = [t for t, n in self.trace.active_threads.items() if t != self.root_thread or n > 1]
+            for ident in threads:
+                frame = frames.get(ident)
+                stack = []
+                while frame is not None:
+                    # Leave out the span wrappers themselves
+                    if frame.f_code.co_filename != __file__:
+                        stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                if stack:
+                    key = ";".join(reversed(stack))
+                    self.counts[key] = self.counts.get(key, 0) + 1
+
+    def stop(self) -> Optional[str]:
+        self._stop.set()
+        self._thread.join()
+        if not self.counts:
+            return None
+        slug = re.sub(r"[^\w]+", "_", self.trace.path).strip("_") or "root"
+        path = os.path.join(PROFILE_DIR, f"{slug}-{self.trace.request_id}.folded")
+        try:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            with open(path, "w") as f:
+                for stack, count in sorted(self.counts.items()):
+                    f.write(f"{stack} {count}\n")
+        except OSError as e:
+            print("PROFILE WRITE ERROR", e)
+            return None
+        return path
+
+
+# --- ASGI middleware ---
+
+class TracingMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        headers = dict(scope.get("headers") or [])
+        path = scope["path"].rstrip("/") or "/"
+        profiled = PROFILE_ENDPOINT is not None and path == PROFILE_ENDPOINT
+        if not (TRACING or profiled or headers.get(b"x-trace") == b"1"):
+            return await self.app(scope, receive, send)
+
+        request_id = headers.get(b"x-request-id", b"").decode("latin-1")
+        # A client id is only a hint: one already in use gets a fresh id instead of replacing that trace
+        if not (_REQUEST_ID_RE.match(request_id) and TRACES.claim(request_id)):
+            request_id = uuid.uuid4().hex
+            TRACES.claim(request_id)
+        trace = Trace(request_id, scope.get("method", ""), path)
+        root = Span(trace, f"{trace.method} {path}", None, {})
+        trace.open(root)
+        token = _current.set(root)
+        sampler = Sampler(trace, root.thread) if profiled else None
+        if sampler:
+            sampler.start()
+        status = None
+
+        async def traced_send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message = dict(message, headers=list(message.get("headers", [])) + [(b"x-request-id", request_id.encode())])
+            elif message["type"] == "http.response.body" and not message.get("more_body") and root.end is None:
+                # The request is done for the client; background tasks after this show up past the root span
+                trace.close(root)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, traced_send)
+        finally:
+            if root.end is None:
+                trace.close(root)
+            _current.reset(token)
+            # Joining the sampler and appending to the trace file block, so neither runs on the event loop
+            await run_in_threadpool(_finish_trace, trace, sampler, status)
+
+
+def _finish_trace(trace: Trace, sampler: Optional[Sampler], status: Optional[int]) -> None:
+    if sampler:
+        trace.profile = sampler.stop()
+    TRACES.save(trace.to_dict(status))
@@ -1,8 +1,58 @@
 
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from langchain_community.vectorstores import Chroma
 from langchain_openai import OpenAIEmbeddings
 from langchain_core.documents import Document
 
+from corpus_state import CORPUS
+from tracing import annotate, incr, span
+
+# "chroma" (default) or "matrix" (memory-mapped exact search, see matrix_store.py)
+VECTORSTORE_BACKEND = os.getenv("VECTORSTORE_BACKEND", "chroma")
+VECTORSTORE_DIR = os.getenv("VECTORSTORE_DIR", "/tmp/chroma_store")
+MATRIX_STORE_DTYPE = os.getenv("MATRIX_STORE_DTYPE", "float16")
+_MATRIX_STORES = {}
+_MATRIX_STORES_LOCK = threading.Lock()
+
+# Ingest: chunks are embedded in batches of EMBED_BATCH_SIZE, EMBED_CONCURRENCY
+# batches at a time, and each batch is written as soon as its vectors arrive.
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "256"))
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "3"))
+
+# Query results cached as ranked ids per (query, k, filter, corpus version); 0 disables
+RETRIEVAL_CACHE_SIZE = int(os.getenv("RETRIEVAL_CACHE_SIZE", "4096"))
+
+# --- Project namespaces ---
+# Each project gets its own Chroma collection (or matrix store directory), so a
+# query only scans that project's vectors. The default project keeps using the
+# original collection so existing indexes stay readable.
+DEFAULT_PROJECT = "default"
+_PROJECT_NAME = re.compile(r"^[A-Za-z0-9](?:[A-Za-z0-9_-]{0,46}[A-Za-z0-9])?$")
+
+def project_name(project=None):
+    """Validate a project name; None/empty means the default project."""
+    project = (project or DEFAULT_PROJECT).strip()
+    if not _PROJECT_NAME.match(project):
+        raise ValueError("Project names are 1-48 letters, digits, '-' or '_', starting and ending with a letter or digit.")
+    return project
+
+def metadata_filter(file_name=None, file_type=None):
+    """Chroma-style metadata filter restricting a search to one file and/or file type."""
+    clauses = [{key: value} for key, value in (("file_name", file_name), ("file_type", file_type)) if value]
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
 # Initialize embeddings ENGINES - update as needed
 def get_embeddings():
     try:
@@ -11,38 +61,348 @@ def get_embeddings():
     except Exception as e:
         raise RuntimeError(f"Failed to create embedding engine: {e}")
 
-def get_vectorstore(persist_directory="/tmp/chroma_store"):
+def get_vectorstore(persist_directory=VECTORSTORE_DIR, backend=None, project=None):
     """
-    Returns a Chroma vectorstore instance (persistent on disk in /tmp/chroma_store by default).
+    Returns a Chroma vectorstore instance (persistent on disk in VECTORSTORE_DIR, /tmp/chroma_store by default)
+    for the given project's collection.
+    With backend="matrix" (or VECTORSTORE_BACKEND=matrix) returns a MatrixVectorStore
+    under <persist_directory>_matrix[_<project>] instead; it is opened once per process and reused.
     """
-    try:
-        vectorstore = Chroma(
-            embedding_function=get_embeddings(),
-            persist_directory=persist_directory
-        )
-        return vectorstore
-    except Exception as e:
-        raise RuntimeError(f"Vectorstore initialization failed: {e}")
+    backend = backend or VECTORSTORE_BACKEND
+    project = project_name(project)
+    if backend == "matrix":
+        suffix = "_matrix" if project == DEFAULT_PROJECT else f"_matrix_{project}"
+        vectorstore = get_matrix_store(persist_directory + suffix)
+    else:
+        try:
+            kwargs = {} if project == DEFAULT_PROJECT else {"collection_name": f"project_{project}"}
+            vectorstore = Chroma(
+                embedding_function=get_embeddings(),
+                persist_directory=persist_directory,
+                **kwargs
+            )
+        except Exception as e:
+            raise RuntimeError(f"Vectorstore initialization failed: {e}")
+    RETRIEVAL_CACHE.bind_project(store_key(vectorstore), project)
+    return vectorstore
+
+def get_matrix_store(persist_directory):
+    from matrix_store import MatrixVectorStore
+    with _MATRIX_STORES_LOCK:
+        store = _MATRIX_STORES.get(persist_directory)
+        if store is None:
+            try:
+                store = MatrixVectorStore(get_embeddings(), persist_directory, dtype=MATRIX_STORE_DTYPE)
+            except Exception as e:
+                raise RuntimeError(f"Vectorstore initialization failed: {e}")
+            _MATRIX_STORES[persist_directory] = store
+        return store
+
+def chunk_id(chunk, position):
+    """Deterministic vector id, so re-adding the same chunks is a no-op instead of a duplicate."""
+    meta = chunk.metadata or {}
+    key = "|".join(str(meta.get(k, "")) for k in ("project", "file_name", "source_location"))
+    return hashlib.sha1(f"{key}|{position}|{chunk.page_content}".encode("utf-8")).hexdigest()
 
-def add_documents(chunks, vectorstore):
+def existing_ids(vectorstore, ids):
+    if hasattr(vectorstore, "contains"):
+        return vectorstore.contains(ids)
+    found = set()
+    for start in range(0, len(ids), 5000):
+        found.update(vectorstore._collection.get(ids=ids[start:start + 5000], include=[])["ids"])
+    return found
+
+def _with_retries(fn, *args):
+    for attempt in range(EMBED_MAX_RETRIES + 1):
+        try:
+            return fn(*args)
+        except Exception as e:
+            if attempt == EMBED_MAX_RETRIES:
+                raise
+            delay = min(2 ** attempt, 30) * random.uniform(0.5, 1.0)
+            print(f"EMBED RETRY {attempt + 1}/{EMBED_MAX_RETRIES} in {delay:.1f}s: {e}")
+            time.sleep(delay)
+
+def add_documents(chunks, vectorstore, batch_size=None, max_workers=None):
     """
     Add document chunks to the vectorstore.
     chunks: list of langchain Document objects (from loader.py).
+    Chunks are embedded in parallel batches and written as each batch arrives;
+    failed batches are retried on their own. Chunks already in the store (same
+    deterministic id) are skipped, so re-running a failed upload resumes it.
     """
+    batch_size = batch_size or EMBED_BATCH_SIZE
+    max_workers = max_workers or EMBED_CONCURRENCY
+    ids = [chunk_id(c, i) for i, c in enumerate(chunks)]
     try:
-        vectorstore.add_documents(chunks)
+        present = existing_ids(vectorstore, ids)
     except Exception as e:
         raise RuntimeError(f"Failed to add documents to vectorstore: {e}")
+    todo = [i for i, doc_id in enumerate(ids) if doc_id not in present]
+    batches = [todo[s:s + batch_size] for s in range(0, len(todo), batch_size)]
+    embeddings = getattr(vectorstore, "embeddings", None)
+    failed = []
+
+    def write(batch, vectors=None):
+        texts = [chunks[i].page_content for i in batch]
+        metadatas = [dict(chunks[i].metadata or {}) for i in batch]
+        batch_ids = [ids[i] for i in batch]
+        if vectors is None:
+            try:
+                _with_retries(lambda: vectorstore.add_documents([chunks[i] for i in batch], ids=batch_ids))
+            finally:
+                RETRIEVAL_CACHE.invalidate(store_key(vectorstore))
+        else:
+            _with_retries(add_embeddings, vectorstore, texts, vectors, metadatas, batch_ids)
+
+    if embeddings is None:
+        # Store embeds internally; still batch and retry per batch
+        for batch in batches:
+            try:
+                write(batch)
+            except Exception as e:
+                failed.append((batch, e))
+    else:
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="embed") as pool:
+            remaining = iter(batches)
+            pending = {}
+
+            def submit_next():
+                batch = next(remaining, None)
+                if batch is not None:
+                    texts = [chunks[i].page_content for i in batch]
+                    pending[pool.submit(_with_retries, embeddings.embed_documents, texts)] = batch
+
+            # Keep a bounded window of batches in flight; writes overlap with the next embeddings
+            for _ in range(max_workers * 2):
+                submit_next()
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    batch = pending.pop(fut)
+                    submit_next()
+                    try:
+                        write(batch, fut.result())
+                    except Exception as e:
+                        failed.append((batch, e))
 
-def similarity_search(query, vectorstore, k=5):
+    print(f"add_documents: {len(chunks)} chunks, {len(present)} already indexed, {len(batches)} batches, {len(failed)} failed")
+    if failed:
+        lost = sum(len(batch) for batch, _ in failed)
+        raise RuntimeError(
+            f"Failed to add documents to vectorstore: {len(failed)} of {len(batches)} batches ({lost} chunks) failed, "
+            f"last error: {failed[-1][1]}. Completed batches are kept; retry to resume."
+        )
+    return ids
+
+def iter_embeddings(vectorstore, batch_size=5000):
+    """
+    Yield (texts, embeddings) batches of everything stored in the vectorstore,
+    without calling the embedding API.
+    """
+    if hasattr(vectorstore, "export_rows"):
+        for start in range(0, vectorstore.count, batch_size):
+            _, texts, _, vectors = vectorstore.export_rows(start, start + batch_size)
+            yield texts, vectors
+        return
+    offset = 0
+    while True:
+        batch = vectorstore._collection.get(include=["documents", "embeddings"], limit=batch_size, offset=offset)
+        if not batch["ids"]:
+            return
+        yield batch["documents"], batch["embeddings"]
+        offset += len(batch["ids"])
+
+def add_embeddings(vectorstore, texts, embeddings, metadatas, ids=None, batch_size=5000):
+    """Add chunks with precomputed embeddings (no embedding API calls)."""
+    ids = ids or [str(uuid.uuid4()) for _ in texts]
+    try:
+        for start in range(0, len(texts), batch_size):
+            stop = start + batch_size
+            if hasattr(vectorstore, "add_embeddings"):
+                vectorstore.add_embeddings(texts[start:stop], embeddings[start:stop], metadatas[start:stop], ids[start:stop])
+            else:
+                vectorstore._collection.upsert(
+                    ids=ids[start:stop],
+                    embeddings=[list(map(float, v)) for v in embeddings[start:stop]],
+                    documents=texts[start:stop],
+                    metadatas=metadatas[start:stop],
+                )
+    except Exception as e:
+        raise RuntimeError(f"Failed to add embeddings to vectorstore: {e}")
+    finally:
+        # Even a partial write changes what a query can return
+        RETRIEVAL_CACHE.invalidate(store_key(vectorstore))
+    return ids
+
+def similarity_search(query, vectorstore, k=5, filter=None):
     """
     Search the vectorstore for top-k similar chunks for the given query.
+    `filter` is a metadata filter, e.g. {"file_name": "contract.pdf"}.
     Returns a list of Document objects.
     """
     try:
-        docs = vectorstore.similarity_search(query, k=k)
+        docs = cached_search(query, vectorstore, k=k, filter=filter)
         if not docs:
             raise ValueError("No relevant context found in the knowledge base.")
         return docs  # <-- Just return the list of Document objects!
     except Exception as e:
         raise RuntimeError(f"Error in vectorstore similarity search: {e}")
+
+
+# --- Retrieval cache ---
+# Repeated questions (and the follow-up questions generate_report keeps
+# producing) would otherwise re-embed and re-search the same text. Results are
+# cached as ranked (vector id, score) pairs keyed on the normalized query, k,
+# the metadata filter and the corpus version, and resolved back to chunks by id
+# on a hit. The version combines the project's shared corpus version (moves
+# when any worker registers a document) with a per-store write counter bumped
+# by add_documents/add_embeddings, so a write invalidates immediately here and
+# on every other worker once the document is registered. Misses embed the
+# query as written; normalization only decides which wordings share an entry.
+
+def normalize_query(query):
+    return " ".join(query.lower().split())
+
+def store_key(vectorstore):
+    """Stable identity of a store across the Chroma wrappers created per request; None if unknown."""
+    if hasattr(vectorstore, "persist_directory") and hasattr(vectorstore, "get_by_ids"):
+        return ("matrix", vectorstore.persist_directory)
+    collection = getattr(vectorstore, "_collection", None)
+    if collection is not None:
+        return ("chroma", getattr(vectorstore, "_persist_directory", None), collection.name)
+    return None
+
+class RetrievalCache:
+    def __init__(self, max_entries=RETRIEVAL_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._generations = {}
+        self._projects = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def bind_project(self, key, project):
+        if key is not None:
+            self._projects[key] = project
+
+    def invalidate(self, key):
+        with self._lock:
+            self._generations[key] = self._generations.get(key, 0) + 1
+
+    def version(self, key):
+        project = self._projects.get(key)
+        return (CORPUS.version(project), self._generations.get(key, 0))
+
+    def get(self, key):
+        with self._lock:
+            ranked = self._entries.get(key)
+            if ranked is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return ranked
+
+    def put(self, key, ranked):
+        with self._lock:
+            self._entries[key] = ranked
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def miss_after_hit(self):
+        """A hit whose chunks could not be resolved any more; count it as a miss."""
+        with self._lock:
+            self.hits -= 1
+            self.misses += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.max_entries > 0,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+                "evictions": self.evictions,
+            }
+
+RETRIEVAL_CACHE = RetrievalCache()
+
+def _cache_key(query, vectorstore, k, filter):
+    key = store_key(vectorstore)
+    if key is None or RETRIEVAL_CACHE.max_entries <= 0:
+        return None
+    filter_key = json.dumps(filter, sort_keys=True) if filter else None
+    return (key, normalize_query(query), k, filter_key, RETRIEVAL_CACHE.version(key))
+
+def _get_by_ids(vectorstore, ids):
+    if hasattr(vectorstore, "get_by_ids"):
+        return vectorstore.get_by_ids(ids)
+    found = vectorstore._collection.get(ids=ids, include=["documents", "metadatas"])
+    by_id = {
+        doc_id: Document(page_content=text, metadata=meta or {})
+        for doc_id, text, meta in zip(found["ids"], found["documents"], found["metadatas"])
+    }
+    return [by_id[doc_id] for doc_id in ids if doc_id in by_id]
+
+def _ranked_search(vectorstore, vector, k, filter):
+    """[(id, score)] and the matching Documents for one query vector, best first."""
+    if hasattr(vectorstore, "get_by_ids"):
+        pairs = vectorstore.similarity_search_with_score_by_vector(vector, k=k, filter=filter)
+        return [(doc.metadata["id"], score) for doc, score in pairs], [doc for doc, _ in pairs]
+    # Chroma's LangChain wrapper drops the ids; query the collection directly
+    found = vectorstore._collection.query(
+        query_embeddings=[list(map(float, vector))], n_results=k, where=filter or None,
+        include=["documents", "metadatas", "distances"],
+    )
+    ranked = list(zip(found["ids"][0], found["distances"][0]))
+    docs = [Document(page_content=text, metadata=meta or {}) for text, meta in zip(found["documents"][0], found["metadatas"][0])]
+    return ranked, docs
+
+def cached_lookup(query, vectorstore, k=4, filter=None):
+    """Cached chunks for a query, or None on a miss (or when the store cannot be cached)."""
+    key = _cache_key(query, vectorstore, k, filter)
+    if key is None:
+        return None
+    ranked = RETRIEVAL_CACHE.get(key)
+    if ranked is None:
+        incr("cache_misses")
+        return None
+    docs = _get_by_ids(vectorstore, [doc_id for doc_id, _ in ranked])
+    if len(docs) != len(ranked):
+        RETRIEVAL_CACHE.miss_after_hit()
+        incr("cache_misses")
+        return None
+    incr("cache_hits")
+    return docs
+
+def search_by_vector(query, vector, vectorstore, k=4, filter=None):
+    """Search with an already-embedded query and cache the ranking under its normalized form."""
+    key = _cache_key(query, vectorstore, k, filter)
+    if key is None:
+        return vectorstore.similarity_search_by_vector(vector, k=k, filter=filter)
+    ranked, docs = _ranked_search(vectorstore, vector, k, filter)
+    RETRIEVAL_CACHE.put(key, ranked)
+    return docs
+
+def cached_search(query, vectorstore, k=4, filter=None):
+    """vectorstore.similarity_search behind the retrieval cache."""
+    docs = cached_lookup(query, vectorstore, k, filter)
+    if docs is not None:
+        return docs
+    if _cache_key(query, vectorstore, k, filter) is None:
+        annotate(cache="uncacheable")
+        with span("similarity_search", k=k):
+            return vectorstore.similarity_search(query, k=k, filter=filter)
+    # The user's own text is embedded; the normalized form only keys the cache
+    with span("embed_query"):
+        vector = vectorstore.embeddings.embed_query(query)
+    with span("vector_search", k=k):
+        return search_by_vector(query, vector, vectorstore, k, filter)
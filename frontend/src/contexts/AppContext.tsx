@@ -51,6 +51,13 @@ interface ScoreData {
     impact: string;
     how_it_helps: string;
   }>;
+  parameters: {
+    cost: number;
+    timeline: number;
+    compliance: number;
+    design: number;
+    sustainability: number;
+  };
 }
 
 interface AppContextType {
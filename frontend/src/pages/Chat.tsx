@@ -21,6 +21,7 @@ const Chat = () => {
   const [loading, setLoading] = useState(false);
   const [uploading, setUploading] = useState(false);
   const [uploadedFile, setUploadedFile] = useState<string | null>(null);
+  const [sessionId, setSessionId] = useState<string | null>(null);
   const fileInputRef = useRef<HTMLInputElement>(null);
   const messagesEndRef = useRef<HTMLDivElement>(null);
 
@@ -89,6 +90,7 @@ const Chat = () => {
     try {
       const formData = new FormData();
       formData.append("question", input);
+      if (sessionId) formData.append("session_id", sessionId);
       const response = await fetch("https://whatif-ragbased-chatbot.onrender.com/ask", {
         method: "POST",
         body: formData,
@@ -99,6 +101,7 @@ const Chat = () => {
       }
 
       const data = await response.json();
+      if (data.session_id) setSessionId(data.session_id);
       
       // Parse the response to extract answer and citations
       // let parsedData;
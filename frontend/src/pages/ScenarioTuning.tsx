@@ -1,4 +1,4 @@
-import { useState, useEffect } from "react";
+import { useState, useEffect, useRef } from "react";
 import { Card, CardContent, CardHeader, CardTitle } from "@/components/ui/card";
 import { Slider } from "@/components/ui/slider";
 import { Loader2, TrendingUp, TrendingDown } from "lucide-react";
@@ -7,16 +7,17 @@ import { useApp } from "@/contexts/AppContext";
 import Navigation from "@/components/Navigation";
 import { Button } from "@/components/ui/button";
 
-// === Slider Dependency Logic (mirrors rag_chain.py) ===
-const PARAM_WEIGHTS = {
-  cost:       { self: 0.5, timeline: 0.3, compliance: 0.1, design: 0.1 },
-  timeline:   { self: 0.5, cost: 0.2, compliance: 0.2, design: 0.1 },
-  compliance: { self: 0.5, cost: 0.2, timeline: 0.2, design: 0.1 },
-  design:     { self: 0.5, cost: 0.2, timeline: 0.2, compliance: 0.1 },
-};
+const API_BASE = "https://whatif-ragbased-chatbot.onrender.com";
 
-const FINAL_WEIGHTS = { cost: 0.3, timeline: 0.2, compliance: 0.2, design: 0.1, sustainability: 0.2 };
+type ScoreParam = "cost" | "timeline" | "compliance" | "design" | "sustainability";
 
+// Slider dependencies and final weights live in the backend (POST /dashboard/recalc)
+interface RecalcResponse {
+  scores: Record<ScoreParam, { score: number; why: string; baseline: number }>;
+  final_score: number;
+  baseline_final_score: number;
+  most_impactful: string | null;
+}
 
 interface ScoreData {
   scores: {
@@ -50,22 +51,19 @@ const ScenarioTuning = () => {
   const [loading, setLoading] = useState(false);
   const [currentScore, setCurrentScore] = useState(0);
   const [mostImpactfulParam, setMostImpactfulParam] = useState<string | null>(null);
-
-  const weights = {
-    cost: 0.3,
-    timeline: 0.2,
-    compliance: 0.2,
-    design: 0.1,
-    sustainability: 0.2,
-  };
+  // Slider values the user set explicitly; the backend derives the rest
+  const [pinned, setPinned] = useState<Partial<Record<ScoreParam, number>>>({});
+  // Dragging a slider fires many requests; only the latest response is applied
+  const recalcSeq = useRef(0);
 
   // Load from global state on mount
   useEffect(() => {
     if (globalScoreData) {
       setCurrentScore(globalScoreData.final_score);
       if (adjustedScores) {
+        // parameters holds the backend's final-score weights
         const newScore = Object.entries(adjustedScores).reduce(
-          (sum, [key, value]) => sum + weights[key as keyof typeof weights] * value,
+          (sum, [key, value]) => sum + (globalScoreData.parameters[key as ScoreParam] ?? 0) * value,
           0
         );
         setCurrentScore(newScore);
@@ -73,52 +71,45 @@ const ScenarioTuning = () => {
     }
   }, [globalScoreData, adjustedScores]);
 
-  // === Frontend replication of dependency logic ===
-const recalcScores = (changedParam: keyof typeof weights, newValue: number) => {
-  if (!adjustedScores) return;
-
-  // Always start with default numeric values
-  const safeScores = {
-    cost: adjustedScores.cost ?? 3,
-    timeline: adjustedScores.timeline ?? 3,
-    compliance: adjustedScores.compliance ?? 3,
-    design: adjustedScores.design ?? 3,
-    sustainability: adjustedScores.sustainability ?? 3,
-  };
-
-  const newScores = { ...safeScores, [changedParam]: newValue };
-
-  // Update dependent sliders dynamically (excluding sustainability since it’s independent)
-  Object.keys(PARAM_WEIGHTS).forEach((param) => {
-    if (param === changedParam || param === "safety") return;
-
-    const w = PARAM_WEIGHTS[param as keyof typeof PARAM_WEIGHTS];
-    const related = ["cost", "timeline", "compliance", "design"];
-    let score = 0;
-
-    related.forEach((r) => {
-      const refVal = newScores[r as keyof typeof newScores] ?? safeScores[r as keyof typeof safeScores] ?? 3;
-      if (r === param) score += (w.self || 0.5) * refVal;
-      else score += (w[r as keyof typeof w] || 0) * refVal;
-    });
+  const recalcScores = async (changedParam: ScoreParam, newValue: number) => {
+    if (!adjustedScores) return;
 
-    // normalize and clamp between 1–5
-    newScores[param as keyof typeof newScores] = Math.min(5, Math.max(1, parseFloat(score.toFixed(2))));
-  });
+    const values = { ...pinned, [changedParam]: newValue };
+    setPinned(values);
+    // Move the slider right away; the dependent ones follow when the response arrives
+    setAdjustedScores({ ...adjustedScores, [changedParam]: newValue });
+    const seq = ++recalcSeq.current;
 
-  // Calculate weighted final score
-  const total =
-    weights.cost * newScores.cost +
-    weights.timeline * newScores.timeline +
-    weights.compliance * newScores.compliance +
-    weights.design * newScores.design +
-    weights.sustainability * newScores.sustainability;
-
-  setAdjustedScores(newScores);
-  setCurrentScore(parseFloat(total.toFixed(2)));
-};
+    try {
+      const response = await fetch(`${API_BASE}/dashboard/recalc`, {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify({ values }),
+      });
 
+      if (!response.ok) {
+        throw new Error("Failed to recalculate scores");
+      }
 
+      const data: RecalcResponse = await response.json();
+      if (seq !== recalcSeq.current) return;
+      setAdjustedScores({
+        cost: data.scores.cost.score,
+        timeline: data.scores.timeline.score,
+        compliance: data.scores.compliance.score,
+        design: data.scores.design.score,
+        sustainability: data.scores.sustainability.score,
+      });
+      setCurrentScore(data.final_score);
+      setMostImpactfulParam(data.most_impactful);
+    } catch (error) {
+      toast({
+        title: "Error",
+        description: "Failed to recalculate scores. Try generating the score again.",
+        variant: "destructive",
+      });
+    }
+  };
 
   const fetchScoreData = async () => {
     if (!documentId) {
@@ -132,7 +123,7 @@ const recalcScores = (changedParam: keyof typeof weights, newValue: number) => {
 
     setLoading(true);
     try {
-      const response = await fetch("https://whatif-ragbased-chatbot.onrender.com/dashboard?mode=ai", {
+      const response = await fetch(`${API_BASE}/dashboard?mode=ai`, {
         method: "GET",
       });
 
@@ -143,6 +134,8 @@ const recalcScores = (changedParam: keyof typeof weights, newValue: number) => {
       const data: ScoreData = await response.json();
       setGlobalScoreData(data);
       setCurrentScore(data.final_score);
+      setPinned({});
+      setMostImpactfulParam(null);
       
       // Set initial slider values from API scores
       setAdjustedScores({
@@ -168,36 +161,7 @@ const recalcScores = (changedParam: keyof typeof weights, newValue: number) => {
     }
   };
 
-  const recalculateScore = (newValues: {cost: number; timeline: number; compliance: number; design: number; sustainability: number}) => {
-    // Calculate new final score using weights
-    const newScore = Object.keys(weights).reduce((total, param) => {
-      const key = param as keyof typeof weights;
-      return total + weights[key] * newValues[key];
-    }, 0);
-
-    setCurrentScore(newScore);
-
-    // Find which parameter change had the most impact
-    if (globalScoreData) {
-      let maxImpact = 0;
-      let maxParam = "";
-      
-      Object.keys(weights).forEach((param) => {
-        const key = param as keyof typeof weights;
-        const originalValue = globalScoreData.scores[key].score;
-        const impact = Math.abs(weights[key] * (newValues[key] - originalValue));
-        
-        if (impact > maxImpact) {
-          maxImpact = impact;
-          maxParam = param;
-        }
-      });
-      
-      setMostImpactfulParam(maxImpact > 0 ? maxParam : null);
-    }
-  };
-
-  const handleSliderChange = (param: keyof typeof weights, value: number[]) => {
+  const handleSliderChange = (param: ScoreParam, value: number[]) => {
     recalcScores(param, value[0]);
   };
 